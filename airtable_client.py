@@ -0,0 +1,151 @@
+"""
+Общий клиент Airtable: один pyairtable.Api на процесс и общий лимит запросов на базу.
+
+Airtable пускает не больше 5 запросов в секунду на базу, а каталоги (7 таблиц), реестр гостей
+и их фоновая синхронизация ходят в одну базу. Каждый запрос берёт токен из token bucket своей базы;
+если токенов нет, запрос ждёт в очереди с приоритетом - запись гостей обгоняет загрузку каталогов.
+
+  api = shared_api(token, endpoint_url)
+  api.table(base_id, "Hotels")                          - таблица каталога (приоритет CATALOG)
+  api.table(base_id, "Wedding Guests", priority=GUESTS) - таблица гостей (запись - GUEST_WRITE)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Tuple
+
+from pyairtable import Api
+
+import metrics
+
+REQUESTS_PER_SECOND = 5.0
+BURST = 5
+
+# Приоритеты: меньше - важнее
+GUEST_WRITE = 0
+GUESTS = 1
+CATALOG = 2
+PRIORITY_NAMES = {GUEST_WRITE: "guest_write", GUESTS: "guests", CATALOG: "catalog"}
+
+QUEUE_DEPTH = metrics.REGISTRY.gauge(
+    "weddy_airtable_queue_depth",
+    "Запросы Airtable, ожидающие токен лимитера",
+    ("priority",)
+)
+QUEUE_WAIT = metrics.REGISTRY.histogram(
+    "weddy_airtable_queue_wait_seconds",
+    "Ожидание токена лимитера перед запросом Airtable",
+    ("priority",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+class TokenBucket:
+    """
+    Token bucket с очередью по приоритету (блокирующий - pyairtable вызывается в потоках).
+    Токен получает голова очереди: меньший приоритет, при равенстве - кто раньше пришёл.
+    """
+
+    def __init__(self, rate: float = REQUESTS_PER_SECOND, burst: int = BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+        self._waiters: list = []
+        self._sequence = itertools.count()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int = CATALOG) -> float:
+        """Ждёт токен; возвращает время ожидания в секундах"""
+        start = time.monotonic()
+        label = PRIORITY_NAMES.get(priority, str(priority))
+        with self._condition:
+            waiter = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, waiter)
+            QUEUE_DEPTH.set(self._count(priority), priority=label)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == waiter and self._tokens >= 1:
+                        self._tokens -= 1
+                        heapq.heappop(self._waiters)
+                        break
+                    # Голова ждёт ровно до следующего токена, остальные - пока их не разбудят
+                    timeout = (1 - self._tokens) / self.rate if self._waiters[0] == waiter else None
+                    self._condition.wait(timeout)
+            except BaseException:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                raise
+            finally:
+                QUEUE_DEPTH.set(self._count(priority), priority=label)
+                # Новая голова очереди должна начать ждать свой токен
+                self._condition.notify_all()
+        waited = time.monotonic() - start
+        QUEUE_WAIT.observe(waited, priority=label)
+        return waited
+
+    def _count(self, priority: int) -> int:
+        return sum(1 for waiter in self._waiters if waiter[0] == priority)
+
+
+class SharedApi(Api):
+    """pyairtable.Api, у которого каждый HTTP-запрос проходит через лимитер своей базы"""
+
+    def __init__(self, api_key: str, *, endpoint_url: str = "https://api.airtable.com", **kwargs):
+        super().__init__(api_key, endpoint_url=endpoint_url, **kwargs)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._table_priorities: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def table(self, base_id: str, table_name: str, *, priority: int = CATALOG, **kwargs):
+        table = super().table(base_id, table_name, **kwargs)
+        with self._lock:
+            self._table_priorities[table.url] = priority
+        return table
+
+    def bucket(self, base_id: str) -> TokenBucket:
+        with self._lock:
+            if base_id not in self._buckets:
+                self._buckets[base_id] = TokenBucket()
+            return self._buckets[base_id]
+
+    def _base_and_priority(self, method: str, url: str) -> Tuple[str, int]:
+        # .../v0/<base_id>/<table>..., .../v0/bases/<base_id>/webhooks..., .../v0/meta/bases/<base_id>/tables
+        path = url[len(self.endpoint_url):].strip("/").split("/")[1:]
+        if path[:2] == ["meta", "bases"]:
+            path = path[2:]
+        elif path[:1] == ["bases"]:
+            path = path[1:]
+        base_id = path[0] if path else ""
+        table_url = next((prefix for prefix in self._table_priorities if url == prefix or url.startswith(prefix + "/")), None)
+        if table_url is None:
+            # Схема базы и вебхуки - служебные запросы каталогов
+            return base_id, CATALOG
+        # Запись в таблицы Airtable - это запись гостей (каталоги только читаются)
+        priority = GUEST_WRITE if method.upper() != "GET" else self._table_priorities[table_url]
+        return base_id, priority
+
+    def request(self, method: str, url: str, *args, **kwargs):
+        base_id, priority = self._base_and_priority(method, url)
+        self.bucket(base_id).acquire(priority)
+        return super().request(method, url, *args, **kwargs)
+
+
+_SHARED: Dict[Tuple[str, str], SharedApi] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_api(token: str, endpoint_url: str = "https://api.airtable.com") -> SharedApi:
+    """Один клиент (сессия HTTP и лимитеры) на токен и адрес API для всего процесса"""
+    key = (token, endpoint_url)
+    with _SHARED_LOCK:
+        if key not in _SHARED:
+            _SHARED[key] = SharedApi(token, endpoint_url=endpoint_url)
+        return _SHARED[key]
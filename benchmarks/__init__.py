@@ -0,0 +1,6 @@
+"""
+Микробенчмарки горячих путей Weddy Bot: скоринг и поиск по каталогу,
+роутинг запросов, извлечение локации и рендеринг списков мест.
+
+Запуск: python -m benchmarks [--sizes 100,1000,5000] [--save-baseline]
+"""
@@ -0,0 +1,311 @@
+"""
+Микробенчмарки с сохранёнными базовыми замерами и отчётом сравнения.
+
+  python -m benchmarks                       # замер + сравнение с benchmarks/baseline.json
+  python -m benchmarks --sizes 100,5000      # только выбранные размеры каталога
+  python -m benchmarks --only relevance      # только кейсы, в имени которых есть подстрока
+  python -m benchmarks --save-baseline       # перезаписать базовые замеры
+  python -m benchmarks --only model_route --save-baseline  # добавить/обновить базу только своего кейса
+  python -m benchmarks --fail-on-regression  # код выхода 1, если что-то замедлилось
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.catalog import make_hotels_bot, make_restaurant_bot
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+DEFAULT_SIZES = [100, 1000, 5000]
+
+# Реалистичные запросы гостей: рестораны, йога, отели, общие вопросы
+QUERIES = [
+    "Где поесть в Убуде?",
+    "романтический ужин с видом на закат в Улувату",
+    "best italian restaurant in canggu",
+    "посоветуй йогу в Чангу",
+    "бутик отель в Семиньяке недорого",
+    "где остановиться рядом с пляжем",
+    "Какой дресс-код на свадьбе?",
+    "что посмотреть на Бали",
+    "spa с балийским массажем в Pererenan",
+    "fine dining tasting menu ubud",
+    "завтрак в Бингине",
+    "погода в январе",
+    "сколько стоит такси из аэропорта",
+    "vegan cafe seminyak",
+    "куда сходить вечером в Berawa",
+    "michelin level restaurant",
+    "йога студия с пилатесом",
+    "отель в Нуса Дуа",
+    "где купить сувениры в Убуде",
+    "арт галерея Санур",
+]
+
+SPECIFIC_QUERY = "romantic italian dinner with sunset view"
+
+
+class Case:
+    """Бенчмарк: setup(size) готовит данные и возвращает операцию для замера"""
+
+    def __init__(self, name: str, setup: Callable[[Optional[int]], Callable[[], object]], sized: bool = True):
+        self.name = name
+        self.setup = setup
+        self.sized = sized
+
+
+def _relevance_score(size):
+    from relevance import RelevanceIndex
+
+    db = make_restaurant_bot(size).restaurants_db
+    indexes = [RelevanceIndex(restaurants) for restaurants in db.values()]
+
+    def op():
+        for index in indexes:
+            index.scores(SPECIFIC_QUERY)
+    return op
+
+
+def _relevance_index_build(size):
+    from relevance import RelevanceIndex
+
+    db = make_restaurant_bot(size).restaurants_db
+
+    def op():
+        for restaurants in db.values():
+            RelevanceIndex(restaurants)
+    return op
+
+
+def _rank_top10(size):
+    bot = make_restaurant_bot(size)
+    return lambda: bot._rank_curated(bot.restaurants_db, SPECIFIC_QUERY, None, limit=10)
+
+
+def _search_curated_db(size):
+    bot = make_restaurant_bot(size)
+    return lambda: bot._search_curated_db(SPECIFIC_QUERY, None)
+
+
+def _search_curated_db_area(size):
+    bot = make_restaurant_bot(size)
+    return lambda: bot._search_curated_db("", "ubud")
+
+
+def _search_hotels(size):
+    bot = make_hotels_bot(size)
+    # Один цикл на все прогоны: asyncio.run на каждый вызов стоит дороже самого поиска
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(bot.search_hotels("бутик отель", None))
+
+
+def _place_lookup(size):
+    from place_names import NameIndex
+
+    db = make_restaurant_bot(size).restaurants_db
+    index = NameIndex({"restaurants": db})
+    name = next(iter(db.values()))[0]["name"]
+    # Точное название, опечатка и обычные вопросы, где названия нет
+    queries = [name, name.replace(name[1], "", 1), "Где поесть в Убуде?", "Какой дресс-код на свадьбе?"]
+
+    def op():
+        for query in queries:
+            index.lookup(query)
+    return op
+
+
+def _geo_nearest(size):
+    bot = make_restaurant_bot(size)
+    # Точки гостей: от Чангу до Улувату, одна - далеко за пределами каталога
+    points = [(-8.6478, 115.1385), (-8.8291, 115.0849), (-8.5069, 115.2625), (-8.6913, 115.1682), (-8.0, 114.5)]
+
+    def op():
+        for lat, lng in points:
+            bot.geo_index.nearest(lat, lng, k=3, max_km=15)
+    return op
+
+
+def _extract_location(size):
+    from query_routing import extract_location
+
+    def op():
+        for query in QUERIES:
+            extract_location(query)
+    return op
+
+
+def _route_queries(size):
+    from query_routing import is_restaurant_query, is_yoga_query, is_hotel_query, needs_perplexity_search
+
+    def op():
+        for query in QUERIES:
+            is_restaurant_query(query)
+            is_yoga_query(query)
+            is_hotel_query(query)
+            needs_perplexity_search(query)
+    return op
+
+
+def _model_route(size):
+    from model_routing import route_request
+
+    history = [{"role": "user", "content": "Гость: Привет"}, {"role": "assistant", "content": "Привет! Чем помочь?"}]
+
+    def op():
+        for query in QUERIES:
+            route_request(query, history)
+    return op
+
+
+def _render_restaurants(size):
+    from place_rendering import render_category_results
+
+    bot = make_restaurant_bot(size)
+    results = bot._merge_results(bot._rank_curated(bot.restaurants_db, "", "ubud"), None, "")
+    return lambda: render_category_results("restaurants", "ubud", results)
+
+
+def _render_hotels(size):
+    from place_rendering import render_category_results
+
+    bot = make_hotels_bot(size)
+    results = asyncio.run(bot.search_hotels("", "ubud"))
+    return lambda: render_category_results("hotels", "ubud", results)
+
+
+CASES = [
+    Case("relevance_score", _relevance_score),
+    Case("relevance_index_build", _relevance_index_build),
+    Case("rank_top10", _rank_top10),
+    Case("search_curated_db", _search_curated_db),
+    Case("search_curated_db_area", _search_curated_db_area),
+    Case("search_hotels", _search_hotels),
+    Case("place_lookup", _place_lookup),
+    Case("geo_nearest", _geo_nearest),
+    Case("render_restaurants", _render_restaurants),
+    Case("render_hotels", _render_hotels),
+    Case("extract_location", _extract_location, sized=False),
+    Case("route_queries", _route_queries, sized=False),
+    Case("model_route", _model_route, sized=False),
+]
+
+
+def measure(op: Callable[[], object], min_time: float, min_runs: int = 3, max_runs: int = 1000) -> Dict:
+    """Гоняем операцию, пока не наберём min_time секунд и min_runs прогонов"""
+    op()  # прогрев
+    timings: List[float] = []
+    total = 0.0
+    while (total < min_time or len(timings) < min_runs) and len(timings) < max_runs:
+        start = time.perf_counter()
+        op()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+    return {
+        "median_us": statistics.median(timings) * 1e6,
+        "min_us": min(timings) * 1e6,
+        "runs": len(timings),
+    }
+
+
+def run_cases(sizes: List[int], only: Optional[str], min_time: float) -> Dict[str, Dict]:
+    results = {}
+    for case in CASES:
+        if only and only not in case.name:
+            continue
+        for size in (sizes if case.sized else [None]):
+            key = f"{case.name}[{size}]" if size is not None else case.name
+            # Каталоги печатают DEBUG-вывод - глушим, чтобы не мешал отчёту
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                op = case.setup(size)
+                results[key] = measure(op, min_time)
+            print(f"  {key:<34} {_format_us(results[key]['median_us']):>12}  ({results[key]['runs']} прогонов)", file=sys.stderr)
+    return results
+
+
+def _format_us(value: float) -> str:
+    if value >= 1e6:
+        return f"{value / 1e6:.2f} s"
+    if value >= 1e3:
+        return f"{value / 1e3:.2f} ms"
+    return f"{value:.1f} µs"
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[Dict]:
+    rows = []
+    for key, current in results.items():
+        base = baseline.get(key)
+        ratio = current["median_us"] / base["median_us"] if base and base["median_us"] else None
+        if ratio is None:
+            status = "new"
+        elif ratio > 1 + threshold:
+            status = "REGRESSION"
+        elif ratio < 1 - threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append({"case": key, "current_us": current["median_us"], "baseline_us": base["median_us"] if base else None,
+                     "ratio": ratio, "status": status})
+    return rows
+
+
+def print_report(rows: List[Dict], baseline_meta: Dict):
+    if baseline_meta:
+        print(f"Базовые замеры: {baseline_meta.get('created')} · Python {baseline_meta.get('python')} · {baseline_meta.get('machine')}")
+    print(f"{'кейс':<34}{'сейчас':>12}{'база':>12}{'×':>8}  статус")
+    for row in rows:
+        baseline_text = _format_us(row["baseline_us"]) if row["baseline_us"] is not None else "—"
+        ratio_text = f"{row['ratio']:.2f}" if row["ratio"] is not None else "—"
+        print(f"{row['case']:<34}{_format_us(row['current_us']):>12}{baseline_text:>12}{ratio_text:>8}  {row['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Микробенчмарки горячих путей Weddy Bot")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="размеры синтетического каталога через запятую")
+    parser.add_argument("--only", help="запускать только кейсы, в имени которых есть подстрока")
+    parser.add_argument("--min-time", type=float, default=0.3, help="минимальное время замера одного кейса, с")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допуск отклонения от базы (0.25 = ±25%%)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить текущие замеры как базовые")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    # Корень репозитория в sys.path, чтобы импортировать модули бота
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    results = run_cases(sizes, args.only, args.min_time)
+
+    stored = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    rows = compare(results, stored.get("results", {}), args.threshold)
+    print()
+    print_report(rows, stored.get("meta", {}))
+
+    if args.save_baseline:
+        merged = dict(stored.get("results", {}))
+        merged.update(results)
+        payload = {
+            "meta": {
+                "created": time.strftime("%Y-%m-%d %H:%M"),
+                "python": platform.python_version(),
+                "machine": f"{platform.system()} {platform.machine()}",
+            },
+            "results": dict(sorted(merged.items())),
+        }
+        args.baseline.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\nБазовые замеры сохранены в {args.baseline}")
+
+    if args.fail_on_regression and any(row["status"] == "REGRESSION" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Синтетические каталоги для бенчмарков: записи в формате Airtable
+и боты каталогов, загруженные из них без сети.
+"""
+
+import random
+from typing import Dict, List
+
+AREAS = ["Ubud", "Canggu", "Pererenan", "Berawa", "Uluwatu", "Bingin", "Seminyak", "Kerobokan", "Sanur", "Nusa Dua"]
+CUISINES = ["Italian", "Japanese", "Modern Indonesian", "Balinese", "Mexican", "Vegan", "Seafood", "French", "Middle Eastern"]
+CATEGORIES = ["fine dining", "casual", "beach club", "cafe", "bistro", "warung", "boutique", "studio", "gallery"]
+VIBES = ["romantic sunset views", "casual beach vibe", "tasting menu experience", "cozy jungle garden",
+         "rooftop cocktails", "family friendly", "hidden gem", "ocean cliff view"]
+NAME_PARTS = ["Sari", "Locavore", "Mason", "Kinship", "Bambu", "Ulu", "Cire", "Mana", "Nook", "Kubu",
+              "Sea", "Jungle", "Lotus", "Coral", "Mango", "Salt", "Fire", "Ember", "Teak", "Koral"]
+PRICE_LEVELS = ["$", "$$", "$$$", "$$$$"]
+
+# Колонка с именем места в каждой таблице Airtable
+NAME_FIELDS = {
+    "restaurants": "restaurant_name_en",
+    "hotels": "hotel_name_en",
+    "yoga": "studio_name_en",
+    "breakfast": "restaurant_name_en",
+    "spa": "spa_name_en",
+    "shopping": "shop_name_en",
+    "art": "art_name_en",
+}
+
+
+def synthetic_records(category: str, size: int, seed: int = 7) -> List[Dict]:
+    """Записи одной таблицы каталога; одинаковый seed - одинаковый каталог"""
+    rng = random.Random(f"{category}:{size}:{seed}")
+    name_field = NAME_FIELDS[category]
+    records = []
+    for i in range(size):
+        name = f"{rng.choice(NAME_PARTS)} {rng.choice(NAME_PARTS)} {i}"
+        fields = {
+            "area": rng.choice(AREAS),
+            name_field: name,
+            name_field.replace("_en", "_ru"): name,
+            "category_en": rng.choice(CATEGORIES),
+            "category_ru": "Категория",
+            "cuisine_style_en": rng.choice(CUISINES),
+            "cuisine_style_ru": "Кухня",
+            "vibe_short_en": rng.choice(VIBES),
+            "vibe_short_ru": "Атмосфера",
+            "vibe_tags": ", ".join(rng.sample(["romantic", "view", "sunset", "family", "vegan", "cocktails"], 3)),
+            "type_en": rng.choice(["boutique hotel", "villa", "resort"]),
+            "type_ru": "Тип",
+            "style_ru": "Стиль",
+            "specialties_ru": "Специализация",
+            "highlights_ru": "Особенности",
+            "massage_type_ru": "Массаж",
+            "specialty_ru": "Специализация",
+            "booking_type": rng.choice(["drop-in", "booking"]),
+            "price_level": rng.choice(PRICE_LEVELS),
+            "prestige_tier": rng.choice(["A", "B", "C"]),
+            "rating": round(rng.uniform(3.5, 5.0), 1),
+            "rating_stars": rng.choice(["★★★", "★★★★", "★★★★★"]),
+            "instagram_link": f"https://instagram.com/place{i}",
+            # Юг Бали: от Улувату до Убуда
+            "latitude": round(rng.uniform(-8.85, -8.45), 6),
+            "longitude": round(rng.uniform(115.05, 115.30), 6),
+        }
+        records.append({"id": f"rec{i:014d}", "createdTime": "2025-01-01T00:00:00.000Z", "fields": fields})
+    return records
+
+
+class FakeTable:
+    """Замена pyairtable.Table: all() отдаёт заранее сгенерированные записи"""
+
+    def __init__(self, records: List[Dict]):
+        self.records = records
+
+    def all(self, **kwargs) -> List[Dict]:
+        return self.records
+
+
+def make_restaurant_bot(size: int):
+    """SmartBaliBot с синтетическим каталогом (без Airtable и Perplexity)"""
+    from smart_search import SmartBaliBot
+
+    bot = SmartBaliBot.__new__(SmartBaliBot)
+    bot.perplexity_api_key = ""
+    bot.restaurants_table = FakeTable(synthetic_records("restaurants", size))
+    bot.load_catalog()
+    bot.config = {"pipelined_search": False, "enrichment_deadline": 0}
+    return bot
+
+
+def make_hotels_bot(size: int):
+    """SmartHotelsBot с синтетическим каталогом"""
+    from smart_hotels import SmartHotelsBot
+
+    bot = SmartHotelsBot.__new__(SmartHotelsBot)
+    bot.hotels_table = FakeTable(synthetic_records("hotels", size))
+    bot.load_catalog()
+    return bot
@@ -0,0 +1,123 @@
+"""
+Перезагрузка каталогов на ходу (copy-on-write).
+
+Бот каталога собирает новый снимок целиком - данные из Airtable и все производные индексы - в отдельном
+потоке, а потом подменяет атрибуты одним вызовом на event loop. Читатели (хендлеры на том же loop)
+видят либо старый снимок, либо новый, никогда не половину, и ни на чём не ждут.
+
+  class SmartHotelsBot(ReloadableCatalog):
+      CATALOG_ATTR = "hotels_db"
+      CATALOG_TABLE = "hotels_table"
+      def catalog_from_records(self, records) -> dict: ...  - {атрибут: значение} из записей Airtable
+      def empty_catalog(self) -> dict: ...                  - снимок пустого каталога (старт без Airtable)
+
+  await bot.reload()                              - вся таблица заново; при ошибке старый снимок остаётся
+  await bot.apply_changes(changed_ids, removed)   - только изменённые записи (вебхуки Airtable, catalog_webhooks.py)
+
+Снимок хранит и исходные записи (catalog_records, {id записи: запись}): изменение одной записи -
+это запрос только за ней и пересборка каталога из записей в памяти, без чтения всей таблицы.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# RECORD_ID() в одной формуле: длина URL запроса остаётся далеко от лимита Airtable
+CHANGED_RECORDS_PER_REQUEST = 50
+
+
+class ReloadableCatalog:
+    CATALOG_ATTR = ""   # атрибут с каталогом {area: [place]}
+    CATALOG_NAME = ""   # для логов
+    CATALOG_TABLE = ""  # атрибут с таблицей pyairtable
+
+    loaded_at = 0.0
+    _reload_lock = None
+
+    def catalog_from_records(self, records: List[Dict]) -> Dict:
+        raise NotImplementedError
+
+    def empty_catalog(self) -> Dict:
+        raise NotImplementedError
+
+    @property
+    def _operation(self) -> str:
+        # hotels_table -> hotels (имя операции в weddy_upstream_*)
+        return self.CATALOG_TABLE.removesuffix("_table")
+
+    def fetch_records(self) -> List[Dict]:
+        with metrics.track_upstream("airtable", f"{self._operation}.all"):
+            return getattr(self, self.CATALOG_TABLE).all()
+
+    def fetch_changed(self, record_ids: Iterable[str]) -> List[Dict]:
+        """Текущие версии записей; удалённых записей в ответе нет"""
+        record_ids = sorted(record_ids)
+        table = getattr(self, self.CATALOG_TABLE)
+        records = []
+        for i in range(0, len(record_ids), CHANGED_RECORDS_PER_REQUEST):
+            chunk = record_ids[i:i + CHANGED_RECORDS_PER_REQUEST]
+            formula = "OR(" + ",".join(f"RECORD_ID()='{record_id}'" for record_id in chunk) + ")"
+            with metrics.track_upstream("airtable", f"{self._operation}.changed"):
+                records.extend(table.all(formula=formula))
+        return records
+
+    def snapshot_from_records(self, records: Dict[str, Dict]) -> Dict:
+        snapshot = self.catalog_from_records(list(records.values()))
+        snapshot["catalog_records"] = records
+        return snapshot
+
+    def build_catalog(self) -> Dict:
+        """Вся таблица из Airtable и индексы; ошибка загрузки - исключение"""
+        return self.snapshot_from_records({record["id"]: record for record in self.fetch_records()})
+
+    def apply_catalog(self, snapshot: Dict):
+        # dict.update со строковыми ключами не отпускает GIL - даже читатель из другого потока не увидит смесь
+        self.__dict__.update(snapshot)
+        self.loaded_at = time.time()
+
+    def load_catalog(self):
+        """Первая загрузка (в конструкторе): Airtable недоступен - пустой каталог"""
+        try:
+            self.apply_catalog(self.build_catalog())
+        except Exception as e:
+            logger.error(f"❌ Error loading {self.CATALOG_NAME} from Airtable: {e}")
+            self.apply_catalog({**self.empty_catalog(), "catalog_records": {}})
+
+    @property
+    def catalog_size(self) -> int:
+        return sum(len(places) for places in getattr(self, self.CATALOG_ATTR, {}).values())
+
+    def _lock(self) -> asyncio.Lock:
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        return self._reload_lock
+
+    async def reload(self) -> int:
+        """Новый снимок из Airtable вне event loop и атомарная подмена; возвращает число мест"""
+        # Две перезагрузки одного каталога подряд (кнопка + расписание) - вторая ждёт первую
+        async with self._lock():
+            snapshot = await asyncio.to_thread(self.build_catalog)
+            self.apply_catalog(snapshot)
+        return self.catalog_size
+
+    async def apply_changes(self, changed_ids: Iterable[str], removed_ids: Iterable[str] = ()) -> int:
+        """Перечитывает только изменённые записи и подменяет снимок; возвращает число мест"""
+        changed_ids, removed_ids = set(changed_ids), set(removed_ids)
+        async with self._lock():
+            fresh = await asyncio.to_thread(self.fetch_changed, changed_ids) if changed_ids else []
+            fresh_ids = {record["id"] for record in fresh}
+            records = dict(self.catalog_records)
+            # Изменённая и тут же удалённая запись в ответ не попадёт - удаляем её тоже
+            for record_id in (removed_ids | changed_ids) - fresh_ids:
+                records.pop(record_id, None)
+            # Изменённые записи остаются на своих местах, новые - в конце
+            records.update((record["id"], record) for record in fresh)
+            snapshot = await asyncio.to_thread(self.snapshot_from_records, records)
+            self.apply_catalog(snapshot)
+        logger.info(f"🔄 {self.CATALOG_NAME}: {len(fresh)} records updated, {len((changed_ids | removed_ids) - fresh_ids)} removed")
+        return self.catalog_size
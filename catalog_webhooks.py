@@ -0,0 +1,242 @@
+"""
+Свежесть каталогов по вебхукам Airtable вместо плановых полных перезагрузок.
+
+При старте бот регистрирует на базу вебхук изменений данных таблиц с адресом AIRTABLE_WEBHOOK_URL.
+Airtable присылает туда только сигнал "есть изменения" (подписанный HMAC). Бот забирает payloads
+начиная со своего курсора, собирает id изменённых и удалённых записей по таблицам каталогов
+и обновляет каталог категории (ReloadableCatalog.apply_changes): запрос только за этими записями,
+каталог и индексы - из записей в памяти.
+
+  webhooks = CatalogWebhooks(get_api, base_id, notification_url, {"hotels": ("Hotels", hotels_bot)}, on_change)
+  runner = await webhooks.start_receiver(host, port)   - HTTP приёмник сигналов Airtable
+  await webhooks.run()                                  - регистрация вебхука (с повторами) и догоняющая перезагрузка
+
+Курсор нового вебхука начинается с 1: правки, сделанные после загрузки снимка каталога, но до регистрации
+(в том числе за всё время повторов при недоступном Airtable), он не вернёт. Поэтому после регистрации
+загруженные и загружающиеся каталоги один раз перечитываются целиком (catch_up).
+
+Задачи планировщика (scheduler.py): Airtable не гарантирует доставку сигналов - раз в SYNC_INTERVAL
+бот сам забирает новые payloads (sync, один GET без чтения таблиц); вебхук живёт 7 дней
+без продления - extend раз в REFRESH_INTERVAL.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import metrics
+import startup
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL = 600
+REFRESH_INTERVAL = 24 * 3600
+REGISTER_RETRY = 60
+MAC_HEADER = "X-Airtable-Content-MAC"
+
+CHANGED_RECORDS = metrics.REGISTRY.counter(
+    "weddy_catalog_webhook_records_total",
+    "Записи каталогов, обновлённые по вебхукам Airtable",
+    ("category", "change")
+)
+SYNC_SECONDS = metrics.REGISTRY.histogram(
+    "weddy_catalog_webhook_sync_seconds",
+    "От сигнала вебхука до обновлённого каталога",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+# {категория: (id изменённых и созданных записей, id удалённых)}
+Changes = Dict[str, Tuple[Set[str], Set[str]]]
+
+
+class CatalogWebhooks:
+    def __init__(
+        self,
+        get_api: Callable,
+        base_id: str,
+        notification_url: str,
+        catalogs: Dict[str, Tuple[str, startup.Lazy]],
+        on_change: Optional[Callable[[], Awaitable]] = None,
+    ):
+        self.get_api = get_api
+        self.base_id = base_id
+        self.notification_url = notification_url
+        self.catalogs = catalogs
+        self.on_change = on_change
+        self.webhook_id = ""
+        self.cursor = 1
+        self.table_categories: Dict[str, str] = {}
+        self._mac_secret = b""
+        self._syncing = False
+        self._pending = False
+        self._sync_tasks = set()
+
+    # ── Airtable Webhooks API (блокирующие, вызываются в потоке) ──────────────
+    def _request(self, method: str, *components: str, **kwargs):
+        api = self.get_api()
+        return api.request(method, api.build_url(*components), **kwargs)
+
+    def _webhooks_path(self, *components: str) -> Tuple[str, ...]:
+        return ("bases", self.base_id, "webhooks", *components)
+
+    def register(self):
+        """Новый вебхук на базу; старые вебхуки с тем же адресом (прошлые запуски) удаляются"""
+        tables = self._request("GET", "meta/bases", self.base_id, "tables")["tables"]
+        table_ids = {table["name"]: table["id"] for table in tables}
+        # В настройках может стоять и имя таблицы, и её id
+        self.table_categories = {
+            table_ids.get(table_name, table_name): category
+            for category, (table_name, _) in self.catalogs.items()
+        }
+
+        for webhook in self._request("GET", *self._webhooks_path()).get("webhooks", []):
+            if webhook.get("notificationUrl") == self.notification_url:
+                self._request("DELETE", *self._webhooks_path(webhook["id"]))
+
+        created = self._request("POST", *self._webhooks_path(), json={
+            "notificationUrl": self.notification_url,
+            "specification": {"options": {"filters": {"dataTypes": ["tableData"]}}},
+        })
+        self.webhook_id = created["id"]
+        self._mac_secret = base64.b64decode(created["macSecretBase64"])
+        self.cursor = 1
+        logger.info(f"🪝 Airtable webhook {self.webhook_id} registered for {len(self.table_categories)} catalog tables")
+
+    def refresh(self):
+        self._request("POST", *self._webhooks_path(self.webhook_id, "refresh"))
+
+    def fetch_changes(self) -> Tuple[Changes, int]:
+        """Все payloads после курсора -> изменения по категориям и следующий курсор"""
+        changes: Changes = {}
+        cursor = self.cursor
+        while True:
+            page = self._request("GET", *self._webhooks_path(self.webhook_id, "payloads"), params={"cursor": cursor})
+            for payload in page.get("payloads", []):
+                for table_id, table in payload.get("changedTablesById", {}).items():
+                    category = self.table_categories.get(table_id)
+                    if category is None:
+                        continue  # гости и другие таблицы базы
+                    changed, removed = changes.setdefault(category, (set(), set()))
+                    changed.update(table.get("createdRecordsById", {}))
+                    changed.update(table.get("changedRecordsById", {}))
+                    removed.update(table.get("destroyedRecordIds", []))
+            cursor = page.get("cursor", cursor)
+            if not page.get("mightHaveMore"):
+                return changes, cursor
+
+    # ── Синхронизация ─────────────────────────────────────────────────────────
+    def verify(self, body: bytes, signature: str) -> bool:
+        if not self._mac_secret:
+            return False
+        expected = "hmac-sha256=" + hmac.new(self._mac_secret, body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature or "")
+
+    async def sync(self):
+        """Забирает и применяет изменения; сигналы во время синхронизации сливаются в один повтор"""
+        self._pending = True
+        if self._syncing or not self.webhook_id:
+            return
+        self._syncing = True
+        try:
+            while self._pending:
+                self._pending = False
+                await self._sync_once()
+        except Exception as e:
+            # Курсор не сдвинут - те же изменения заберём со следующим сигналом или по таймеру
+            logger.error(f"❌ Airtable webhook sync failed: {e}")
+        finally:
+            self._syncing = False
+
+    async def _sync_once(self):
+        start = time.perf_counter()
+        changes, cursor = await asyncio.to_thread(self.fetch_changes)
+        if changes:
+            await asyncio.gather(*(self._apply(category, changed, removed) for category, (changed, removed) in changes.items()))
+            if self.on_change:
+                await self.on_change()
+            SYNC_SECONDS.observe(time.perf_counter() - start)
+        # Сдвигаем курсор только после того, как все изменения применены
+        self.cursor = cursor
+
+    async def _apply(self, category: str, changed: Set[str], removed: Set[str]):
+        catalog_bot = self.catalogs[category][1]
+        # Каталог ещё грузится - дожидаемся: изменение могло не попасть в загружаемый снимок
+        await startup.ensure(catalog_bot)
+        await catalog_bot.apply_changes(changed, removed)
+        CHANGED_RECORDS.inc(len(changed - removed), category=category, change="changed")
+        CHANGED_RECORDS.inc(len(removed), category=category, change="removed")
+
+    def _schedule_sync(self):
+        task = asyncio.create_task(self.sync())
+        self._sync_tasks.add(task)
+        task.add_done_callback(self._sync_tasks.discard)
+
+    # ── HTTP приёмник ─────────────────────────────────────────────────────────
+    async def handle_notification(self, request):
+        from aiohttp import web
+
+        body = await request.read()
+        if not self.verify(body, request.headers.get(MAC_HEADER, "")):
+            logger.warning("⚠️ Airtable webhook notification with invalid signature")
+            return web.Response(status=403)
+        # Airtable ждёт быстрый ответ - изменения забираем в фоне
+        self._schedule_sync()
+        return web.Response(status=204)
+
+    async def start_receiver(self, host: str, port: int):
+        """HTTP сервер для сигналов Airtable по пути из notification_url; возвращает runner для остановки"""
+        from aiohttp import web
+
+        path = urlparse(self.notification_url).path or "/"
+        app = web.Application()
+        app.router.add_post(path, self.handle_notification)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"🪝 Airtable webhook receiver on http://{host}:{port}{path}")
+        return runner
+
+    async def run(self):
+        """Регистрация вебхука; Airtable недоступен - повтор через REGISTER_RETRY секунд"""
+        while True:
+            try:
+                await asyncio.to_thread(self.register)
+                break
+            except Exception as e:
+                logger.error(f"❌ Airtable webhook registration failed, retry in {REGISTER_RETRY} s: {e}")
+                await asyncio.sleep(REGISTER_RETRY)
+        await self.catch_up()
+
+    async def catch_up(self):
+        """
+        Полная перезагрузка каталогов, снимки которых могли быть прочитаны до регистрации вебхука.
+        Ещё не начатые загрузки пропускаем - они и так прочитают таблицу после регистрации
+        """
+        stale = [
+            (category, catalog_bot) for category, (_, catalog_bot) in self.catalogs.items()
+            if catalog_bot.built or catalog_bot.building
+        ]
+        if not stale:
+            return
+
+        async def reload_one(catalog_bot):
+            await startup.ensure(catalog_bot)
+            return await catalog_bot.reload()
+
+        results = await asyncio.gather(*(reload_one(catalog_bot) for _, catalog_bot in stale), return_exceptions=True)
+        for (category, _), result in zip(stale, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Catalog catch-up reload failed for {category}: {result}")
+        logger.info(f"🪝 Catalogs reloaded after webhook registration: {', '.join(category for category, _ in stale)}")
+        if self.on_change:
+            await self.on_change()
+
+    async def extend(self):
+        """Продление вебхука (задача планировщика)"""
+        if self.webhook_id:
+            await asyncio.to_thread(self.refresh)
@@ -0,0 +1,119 @@
+"""
+Справочник районов Бали: все написания района (латиница, кириллица, транслитерации, подрайоны)
+сведены в одну хеш-таблицу alias → канонический район.
+
+  normalize_area("Pererenan, Canggu")  -> "canggu"   (поле area из Airtable, при загрузке каталога)
+  find_area("Где поесть в Убуде?")     -> "ubud"     (извлечение района из запроса, один проход)
+
+Канонические районы совпадают с ключами каталогов (restaurants_db, hotels_db и т.д.).
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+# Канонический район -> написания и подрайоны, которые к нему относятся
+AREA_ALIASES: Dict[str, List[str]] = {
+    # Canggu включает: canggu, berawa, pererenan
+    "canggu": [
+        "canggu", "changgu", "changu", "чангу", "чанггу", "кангу",
+        "berawa", "берава", "pererenan", "переренан", "перерэнан",
+        "batu bolong", "бату болонг", "echo beach", "эхо бич", "seseh", "сесех", "cemagi", "чемаги",
+    ],
+    # Uluwatu включает: uluwatu, bingin и остальной Букит
+    "uluwatu": [
+        "uluwatu", "uluvatu", "улувату", "bingin", "бингин",
+        "padang padang", "паданг паданг", "balangan", "баланган", "pecatu", "печату",
+        "ungasan", "унгасан", "melasti", "меласти", "bukit", "букит",
+    ],
+    # Seminyak включает: seminyak, kerobokan
+    "seminyak": [
+        "seminyak", "seminiak", "семиньяк", "семиняк", "kerobokan", "керобокан",
+        "petitenget", "петитенгет", "batu belig", "бату белиг", "umalas", "умалас",
+    ],
+    "ubud": [
+        "ubud", "убуд", "penestanan", "пенестанан", "sayan",
+        "tegallalang", "tegalalang", "тегаллаланг", "тегалаланг", "mas village",
+    ],
+    "sanur": ["sanur", "санур"],
+    "nusa dua": ["nusa dua", "нуса дуа", "benoa", "беноа", "tanjung benoa", "танджунг беноа"],
+    "jimbaran": ["jimbaran", "джимбаран"],
+    "kuta": ["kuta", "кута"],
+    "legian": ["legian", "легиан"],
+    "denpasar": ["denpasar", "денпасар"],
+    "amed": ["amed", "амед"],
+    "sidemen": ["sidemen", "сидемен"],
+    "munduk": ["munduk", "мундук"],
+    "lovina": ["lovina", "ловина"],
+    "kintamani": ["kintamani", "кинтамани", "batur", "батур"],
+    "nusa penida": ["nusa penida", "нуса пенида"],
+    "nusa lembongan": ["nusa lembongan", "нуса лембонган", "lembongan", "лембонган"],
+}
+
+CANONICAL_AREAS = tuple(AREA_ALIASES)
+
+# Падежные окончания: "в Убуде", "из Семиньяка", "на Куте", "по Сануру"
+_CONSONANT_ENDINGS = ("е", "а", "у", "ом", "ы")
+_A_ENDINGS = ("е", "у", "ы", "ой")
+
+_TOKEN = re.compile(r"[a-zа-я]+")
+
+
+def _normalize_text(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def _inflections(alias: str) -> Iterable[str]:
+    """Написание и его падежные формы (склоняем последнее слово кириллических названий)"""
+    yield alias
+    if not re.search(r"[а-я]$", alias):
+        return
+    if alias.endswith("а"):
+        yield from (alias[:-1] + ending for ending in _A_ENDINGS)
+    elif alias[-1] not in "аеиоуыэюяь":
+        yield from (alias + ending for ending in _CONSONANT_ENDINGS)
+
+
+def _build_alias_map() -> Dict[str, str]:
+    alias_map: Dict[str, str] = {}
+    for area, aliases in AREA_ALIASES.items():
+        for alias in aliases:
+            for form in _inflections(" ".join(_TOKEN.findall(_normalize_text(alias)))):
+                alias_map.setdefault(form, area)
+    return alias_map
+
+
+ALIAS_TO_AREA: Dict[str, str] = _build_alias_map()
+
+# Первое слово многословного названия -> сколько слов проверять ("nusa" -> 2, "padang" -> 2)
+_PHRASE_HEADS: Dict[str, int] = {}
+for _alias in ALIAS_TO_AREA:
+    _words = _alias.split()
+    if len(_words) > 1:
+        _PHRASE_HEADS[_words[0]] = max(_PHRASE_HEADS.get(_words[0], 0), len(_words))
+
+
+def find_area(text: str) -> Optional[str]:
+    """
+    Первый район, упомянутый в тексте (один проход по словам, поиск в хеш-таблице).
+    ~3.5 µs на запрос (extract_location с трассировкой - ~5 µs, кейс extract_location в benchmarks);
+    поиск всех форм названий подстроками - ~14 µs
+    """
+    tokens = _TOKEN.findall(_normalize_text(text))
+    for i, token in enumerate(tokens):
+        # Сначала длинные совпадения: "nusa dua" раньше, чем отдельное слово
+        for n in range(_PHRASE_HEADS.get(token, 1), 1, -1):
+            area = ALIAS_TO_AREA.get(" ".join(tokens[i:i + n]))
+            if area:
+                return area
+        area = ALIAS_TO_AREA.get(token)
+        if area:
+            return area
+    return None
+
+
+@lru_cache(maxsize=1024)
+def normalize_area(area: str) -> str:
+    """Нормализует поле area из Airtable к каноническому району; неизвестное - в нижнем регистре как есть"""
+    area_lower = area.lower()
+    return ALIAS_TO_AREA.get(area_lower.strip()) or find_area(area_lower) or area_lower
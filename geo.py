@@ -0,0 +1,169 @@
+"""
+Координаты мест и пространственный индекс каталогов.
+
+  coordinates_from_fields(fields)  - координаты из записи Airtable (lat/lng, coordinates или ссылка Google Maps)
+  GeoGrid.from_catalog(db)         - сетка ~1 км × 1 км, строится при загрузке каталога
+  grid.nearest(lat, lng, k)        - k ближайших мест по расстоянию (обход колец ячеек вокруг точки)
+"""
+
+import heapq
+import math
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Шаг сетки в градусах: 0.01° ≈ 1.1 км по широте (и почти столько же по долготе на широте Бали)
+CELL_DEG = 0.01
+
+_LAT_FIELDS = ("latitude", "lat")
+_LNG_FIELDS = ("longitude", "lng", "lon")
+_LINK_FIELDS = ("google_maps_link", "maps_link", "google_maps", "location_link")
+_PAIR = re.compile(r"(-?\d{1,2}\.\d+)\s*,\s*(-?\d{1,3}\.\d+)")
+_MAPS_AT = re.compile(r"@(-?\d{1,2}\.\d+),(-?\d{1,3}\.\d+)")
+_MAPS_3D4D = re.compile(r"!3d(-?\d{1,2}\.\d+)!4d(-?\d{1,3}\.\d+)")
+
+Coordinates = Tuple[float, float]
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Расстояние по поверхности Земли, км"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _valid(lat: float, lng: float) -> Optional[Coordinates]:
+    if -90 <= lat <= 90 and -180 <= lng <= 180 and (lat, lng) != (0, 0):
+        return lat, lng
+    return None
+
+
+def parse_coordinates(text: str) -> Optional[Coordinates]:
+    """Координаты из строки "-8.6478, 115.1385" или ссылки Google Maps"""
+    if not text:
+        return None
+    for pattern in (_MAPS_3D4D, _MAPS_AT, _PAIR):
+        match = pattern.search(str(text))
+        if match:
+            return _valid(float(match.group(1)), float(match.group(2)))
+    return None
+
+
+def coordinates_from_fields(fields: Dict) -> Optional[Coordinates]:
+    """Координаты места из полей Airtable; None, если их нет"""
+    lat = next((fields[f] for f in _LAT_FIELDS if fields.get(f) not in (None, "")), None)
+    lng = next((fields[f] for f in _LNG_FIELDS if fields.get(f) not in (None, "")), None)
+    if lat is not None and lng is not None:
+        try:
+            return _valid(float(lat), float(lng))
+        except (TypeError, ValueError):
+            pass
+    for field in ("coordinates", *_LINK_FIELDS):
+        coordinates = parse_coordinates(fields.get(field, ""))
+        if coordinates:
+            return coordinates
+    return None
+
+
+def format_distance(km: float) -> str:
+    if km < 1:
+        return f"{int(round(km * 1000, -1))} м"
+    return f"{km:.1f} км"
+
+
+class GeoGrid:
+    """Хеш-сетка: ячейка (широта // CELL_DEG, долгота // CELL_DEG) -> места в ней"""
+
+    def __init__(self, cell_deg: float = CELL_DEG):
+        self.cell_deg = cell_deg
+        self.cells: Dict[Tuple[int, int], List[Tuple[float, float, Dict, str]]] = defaultdict(list)
+        self.size = 0
+        self._bounds: Optional[Tuple[int, int, int, int]] = None
+        self._max_abs_lat = 0.0
+
+    @classmethod
+    def from_catalog(cls, db: Dict[str, List[Dict]]) -> "GeoGrid":
+        """Индекс каталога {area: [place, ...]}; места без координат пропускаются"""
+        grid = cls()
+        for area, places in db.items():
+            for place in places:
+                if place.get("lat") is not None and place.get("lng") is not None:
+                    grid.add(place["lat"], place["lng"], place, area)
+        return grid
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def add(self, lat: float, lng: float, place: Dict, area: str):
+        cell = self._cell(lat, lng)
+        self.cells[cell].append((lat, lng, place, area))
+        self.size += 1
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[0], cell[1], cell[1])
+        else:
+            min_x, max_x, min_y, max_y = self._bounds
+            self._bounds = (min(min_x, cell[0]), max(max_x, cell[0]), min(min_y, cell[1]), max(max_y, cell[1]))
+        self._max_abs_lat = max(self._max_abs_lat, abs(lat))
+
+    def _cell_km(self, lat: float) -> float:
+        """Нижняя оценка ширины ячейки в км между точкой и местами (градус долготы сжимается к полюсам)"""
+        worst_lat = min(max(abs(lat), self._max_abs_lat) + self.cell_deg, 89.0)
+        return self.cell_deg * math.pi / 180 * EARTH_RADIUS_KM * math.cos(math.radians(worst_lat))
+
+    def nearest(self, lat: float, lng: float, k: int = 3, max_km: Optional[float] = None) -> List[Tuple[float, Dict, str]]:
+        """k ближайших мест: [(расстояние_км, place, area)] по возрастанию расстояния"""
+        if not self.size or k <= 0:
+            return []
+
+        cx, cy = self._cell(lat, lng)
+        cell_km = self._cell_km(lat)
+        min_x, max_x, min_y, max_y = self._bounds
+        # Сколько колец нужно, чтобы накрыть все занятые ячейки
+        rings_needed = max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+        if max_km is not None:
+            rings_needed = min(rings_needed, int(max_km / cell_km) + 1)
+
+        # Разреженная сетка или далёкая точка: перебрать все места дешевле, чем обойти пустые ячейки
+        if (2 * rings_needed + 1) ** 2 > self.size:
+            candidates = (entry for entries in self.cells.values() for entry in entries)
+            return self._closest(lat, lng, candidates, k, max_km)
+
+        found: List[Tuple[float, int, Dict, str]] = []
+        for ring in range(rings_needed + 1):
+            for cell in self._ring_cells(cx, cy, ring):
+                for p_lat, p_lng, place, area in self.cells.get(cell, ()):
+                    distance = haversine_km(lat, lng, p_lat, p_lng)
+                    if max_km is None or distance <= max_km:
+                        found.append((distance, len(found), place, area))
+            # Всё, что за пределами обойдённых колец, дальше ring * ширина ячейки
+            if len(found) >= k and heapq.nsmallest(k, found)[-1][0] <= ring * cell_km:
+                break
+        return [(distance, place, area) for distance, _, place, area in heapq.nsmallest(k, found)]
+
+    @staticmethod
+    def _ring_cells(cx: int, cy: int, ring: int):
+        if ring == 0:
+            yield cx, cy
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield x, cy - ring
+            yield x, cy + ring
+        for y in range(cy - ring + 1, cy + ring):
+            yield cx - ring, y
+            yield cx + ring, y
+
+    @staticmethod
+    def _closest(lat, lng, candidates, k, max_km) -> List[Tuple[float, Dict, str]]:
+        scored = []
+        for p_lat, p_lng, place, area in candidates:
+            distance = haversine_km(lat, lng, p_lat, p_lng)
+            if max_km is None or distance <= max_km:
+                scored.append((distance, len(scored), place, area))
+        return [(distance, place, area) for distance, _, place, area in heapq.nsmallest(k, scored)]
@@ -0,0 +1,117 @@
+"""
+Экспорт гостей для /export: CSV, XLSX и JSON Lines.
+
+Записи идут потоком - страница за страницей (GuestStore.iter_pages(), guests_table.iterate()) - прямо в writer,
+который пишет в один буфер в памяти: без списка всех записей, промежуточной строки и временного файла.
+
+  export_guests(pages, "xlsx", buffer)  - пишет файл в buffer, возвращает число гостей
+
+XLSX собирается стандартным zipfile: лист - потоковый XML с inline-строками, openpyxl не нужен.
+"""
+
+import csv
+import io
+import json
+import zipfile
+from typing import BinaryIO, Dict, Iterable, Iterator, List
+from xml.sax.saxutils import escape
+
+FIELDS = [
+    "Telegram ID", "Full Name", "Username", "Arrival Date",
+    "Tickets Bought", "Departure Date", "Guests Count",
+    "Drinks Preference", "Dietary Restrictions", "Allergies",
+    "Registration Date",
+]
+FORMATS = ("csv", "xlsx", "jsonl")
+
+
+def iter_fields(pages: Iterable[List[Dict]]) -> Iterator[Dict]:
+    """Страницы записей ({"id", "fields"}) -> поля гостей по одному"""
+    for page in pages:
+        for record in page:
+            yield record.get("fields", {})
+
+
+def write_csv(rows: Iterable[Dict], out: BinaryIO) -> int:
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(FIELDS)
+    count = 0
+    for fields in rows:
+        writer.writerow([fields.get(name, "") for name in FIELDS])
+        count += 1
+    # Буфер остаётся открытым для отправки
+    text.detach()
+    return count
+
+
+def write_jsonl(rows: Iterable[Dict], out: BinaryIO) -> int:
+    count = 0
+    for fields in rows:
+        line = json.dumps({name: fields.get(name, "") for name in FIELDS}, ensure_ascii=False)
+        out.write(line.encode("utf-8") + b"\n")
+        count += 1
+    return count
+
+
+# ── XLSX ──────────────────────────────────────────────────────────────────────
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Guests" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+_SHEET_HEAD = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+               '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_TAIL = "</sheetData></worksheet>"
+
+
+def _xlsx_cell(value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    text = escape(str(value if value is not None else ""))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values: Iterable) -> bytes:
+    return ("<row>" + "".join(_xlsx_cell(value) for value in values) + "</row>").encode("utf-8")
+
+
+def write_xlsx(rows: Iterable[Dict], out: BinaryIO) -> int:
+    count = 0
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/workbook.xml", _WORKBOOK)
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(_SHEET_HEAD.encode("utf-8"))
+            sheet.write(_xlsx_row(FIELDS))
+            for fields in rows:
+                sheet.write(_xlsx_row(fields.get(name, "") for name in FIELDS))
+                count += 1
+            sheet.write(_SHEET_TAIL.encode("utf-8"))
+    return count
+
+
+_WRITERS = {"csv": write_csv, "xlsx": write_xlsx, "jsonl": write_jsonl}
+
+
+def export_guests(pages: Iterable[List[Dict]], fmt: str, out: BinaryIO) -> int:
+    """Пишет гостей в out в формате fmt (csv/xlsx/jsonl); возвращает число записей"""
+    if fmt not in _WRITERS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+    return _WRITERS[fmt](iter_fields(pages), out)
@@ -0,0 +1,179 @@
+"""
+Статистика гостей для /stats: агрегаты считаются один раз из реестра гостей и дальше обновляются
+по одной записи - при каждой регистрации (save_registration) и сверке реестра с Airtable.
+
+Агрегаты ведутся по id записи: повторное применение той же записи заменяет её вклад,
+поэтому полная загрузка и параллельная регистрация не дают ни потерь, ни двойного счёта.
+"""
+
+import itertools
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Ответы "нет" в свободных полях: такие аллергии не показываем
+_NO_ANSWERS = {"", "нет", "no", "none", "-", "нету", "не", "нет особенностей"}
+_DATE = re.compile(r"(\d{1,2})[./-](\d{1,2})")
+# Свободный текст гостей уходит в Markdown: символы разметки ломают всё сообщение ("can't parse entities")
+_MARKDOWN = str.maketrans("", "", "*_`[]")
+# Лимит Telegram - 4096 символов на сообщение
+MESSAGE_LIMIT = 4000
+MAX_ALLERGIES = 50
+MAX_VALUE_LENGTH = 100
+
+
+def guests_count(fields: Dict) -> int:
+    try:
+        return int(fields.get("Guests Count") or 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def _value(fields: Dict, name: str, default: str = "Не указано") -> str:
+    value = fields.get(name)
+    return str(value).strip() if value not in (None, "") else default
+
+
+def _plain(value) -> str:
+    """Текст гостя для Markdown: без символов разметки, не длиннее MAX_VALUE_LENGTH"""
+    text = str(value).translate(_MARKDOWN)
+    return text if len(text) <= MAX_VALUE_LENGTH else text[:MAX_VALUE_LENGTH - 1] + "…"
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Длинный отчёт -> сообщения до limit символов, по границам строк"""
+    parts, current = [], ""
+    for line in text.splitlines(keepends=True):
+        if current and len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line[:limit]
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _date_key(date: str) -> Tuple:
+    """Сортировка дат в свободной форме: "05.01" раньше "10.01", нераспознанные - в конце"""
+    match = _DATE.search(date)
+    if match:
+        day, month = int(match.group(1)), int(match.group(2))
+        return (0, month, day)
+    return (1, date)
+
+
+class GuestStats:
+    """Материализованные агрегаты по гостям"""
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict] = {}
+        self._anonymous = itertools.count(1)  # ключи записей без id: не повторяются и после удалений
+        self.total_guests = 0
+        self.total_people = 0
+        self.tickets: Counter = Counter()
+        self.arrivals: Counter = Counter()            # дата -> регистраций (топ дат прилёта)
+        self.arrival_people: Counter = Counter()      # дата -> человек
+        self.departure_people: Counter = Counter()
+        self.drinks: Counter = Counter()              # -> человек
+        self.dietary: Counter = Counter()             # -> человек
+        self.allergies: List[Tuple[str, str]] = []    # (гость, аллергия)
+
+    def _contribute(self, fields: Dict, sign: int):
+        people = guests_count(fields)
+        self.total_guests += sign
+        self.total_people += sign * people
+        self.tickets[_value(fields, "Tickets Bought")] += sign
+        arrival = _value(fields, "Arrival Date")
+        self.arrivals[arrival] += sign
+        self.arrival_people[arrival] += sign * people
+        self.departure_people[_value(fields, "Departure Date")] += sign * people
+        self.drinks[_value(fields, "Drinks Preference")] += sign * people
+        self.dietary[_value(fields, "Dietary Restrictions")] += sign * people
+        allergy = _value(fields, "Allergies", default="")
+        if allergy.lower() not in _NO_ANSWERS:
+            entry = (_value(fields, "Full Name", default="Гость"), allergy)
+            if sign > 0:
+                self.allergies.append(entry)
+            elif entry in self.allergies:
+                self.allergies.remove(entry)
+
+    def apply(self, record: Dict):
+        """Новая или изменённая запись Airtable ({"id", "fields"})"""
+        with self._lock:
+            self._apply(record)
+
+    def _apply(self, record: Dict):
+        record_id = record.get("id") or f"anonymous:{next(self._anonymous)}"
+        previous = self._records.get(record_id)
+        if previous is not None:
+            self._contribute(previous, -1)
+        fields = dict(record.get("fields", {}))
+        self._records[record_id] = fields
+        self._contribute(fields, +1)
+
+    def remove(self, record_id: str):
+        with self._lock:
+            previous = self._records.pop(record_id, None)
+            if previous is not None:
+                self._contribute(previous, -1)
+
+    def load(self, records: List[Dict]):
+        """Полная загрузка (все записи реестра гостей)"""
+        with self._lock:
+            for record in records:
+                self._apply(record)
+            self.loaded = True
+
+    def top_arrival_dates(self, limit: int = 5) -> List[Tuple[str, int]]:
+        return [(date, count) for date, count in self.arrivals.most_common() if count > 0][:limit]
+
+    def report(self) -> str:
+        """Текст /stats (Markdown)"""
+        with self._lock:
+            if not self.total_guests:
+                return "📊 **Статистика:** Пока нет зарегистрированных гостей."
+            stats_text = (
+                f"📊 **Статистика гостей**\n\n"
+                f"👥 Всего зарегистрировано: **{self.total_guests}** гостей\n"
+                f"🧑‍🤝‍🧑 Всего прилетит людей: **{self.total_people}** человек\n\n"
+                f"✈️ **Билеты:**\n"
+                f"• ✅ Купили: {self.tickets['Да']}\n"
+                f"• ❌ Не купили: {self.tickets['Нет']}\n"
+                f"• 📅 Планируют: {self.tickets['Планирую']}\n\n"
+                f"📅 **Топ дат прилёта:**\n"
+            )
+            for date, count in self.top_arrival_dates():
+                stats_text += f"• {_plain(date)}: {count} гостей\n"
+
+            stats_text += "\n🛬 **Прилёты по дням (человек):**\n"
+            stats_text += _by_day(self.arrival_people)
+            stats_text += "\n🛫 **Вылеты по дням (человек):**\n"
+            stats_text += _by_day(self.departure_people)
+
+            stats_text += "\n🍷 **Напитки (человек):**\n"
+            stats_text += _top(self.drinks)
+            stats_text += "\n🥗 **Питание (человек):**\n"
+            stats_text += _top(self.dietary)
+
+            stats_text += f"\n⚠️ **Аллергии ({len(self.allergies)}):**\n"
+            if self.allergies:
+                stats_text += "".join(
+                    f"• {_plain(name)}: {_plain(allergy)}\n" for name, allergy in self.allergies[:MAX_ALLERGIES]
+                )
+                if len(self.allergies) > MAX_ALLERGIES:
+                    stats_text += f"• … и ещё {len(self.allergies) - MAX_ALLERGIES} (полный список - /export)\n"
+            else:
+                stats_text += "• Нет\n"
+            return stats_text
+
+
+def _by_day(counter: Counter) -> str:
+    days = sorted((date for date, count in counter.items() if count > 0), key=_date_key)
+    return "".join(f"• {_plain(date)}: {counter[date]}\n" for date in days) or "• Нет данных\n"
+
+
+def _top(counter: Counter, limit: Optional[int] = None) -> str:
+    return "".join(f"• {_plain(value)}: {count}\n" for value, count in counter.most_common(limit) if count > 0) or "• Нет данных\n"
@@ -0,0 +1,340 @@
+"""
+Локальный реестр гостей (SQLite в режиме WAL) с отложенной записью в Airtable.
+
+Регистрация сначала коммитится в локальную базу и сразу подтверждается гостю - Airtable
+не на пути ответа. Фоновый GuestWriter отправляет новые и изменённые записи пачками
+(до 10 записей на запрос - лимит batch API Airtable), при ошибке повторяет с экспоненциальной
+задержкой. На старте reconcile() сверяет реестр с Airtable.
+
+  store = GuestStore("weddy_guests.db")
+  store.upsert(fields)                  - регистрация или обновление анкеты по Telegram ID -> ({"id", "fields"}, created)
+  store.find(telegram_id)               - анкета гостя из индекса в памяти
+  push_pending(table, store)            - одна пачка в Airtable (в отдельном потоке)
+  reconcile(table, store)               - подтянуть записи Airtable, которых нет локально
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+
+PENDING_GAUGE = metrics.REGISTRY.gauge(
+    "weddy_guest_sync_pending",
+    "Регистрации гостей, ещё не записанные в Airtable",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS guests (
+    local_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    telegram_id TEXT,
+    fields TEXT NOT NULL,
+    airtable_id TEXT UNIQUE,
+    version INTEGER NOT NULL DEFAULT 1,         -- растёт при каждом локальном изменении
+    synced_version INTEGER NOT NULL DEFAULT 0,  -- последняя версия, записанная в Airtable
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS guests_pending ON guests (next_attempt) WHERE version > synced_version;
+"""
+
+# Один гость - одна строка: из повторных регистраций до upsert (дубли в Airtable) берём последнюю
+_CURRENT_ROWS = (
+    "SELECT local_id, telegram_id, fields FROM guests WHERE local_id IN "
+    "(SELECT MAX(local_id) FROM guests GROUP BY COALESCE(NULLIF(telegram_id, ''), 'local:' || local_id)) "
+    "ORDER BY local_id"
+)
+
+
+def telegram_id_of(fields: Dict) -> str:
+    value = fields.get("Telegram ID")
+    return str(value).strip() if value not in (None, "") else ""
+
+
+def record_id(local_id: int, telegram_id: str = "") -> str:
+    """Id записи для GuestStats: один на гостя, не меняется после записи в Airtable"""
+    return f"guest:{telegram_id}" if telegram_id else f"local:{local_id}"
+
+
+class GuestStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Регистрация подтверждается гостю после коммита - коммит должен пережить и сбой питания
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(_SCHEMA)
+        # Индекс гостей в памяти: Telegram ID -> {"local_id", "fields"} (поиск без запроса к базе)
+        self._guests: Dict[str, Dict] = {}
+        for local_id, telegram_id, fields in self._db.execute(_CURRENT_ROWS):
+            if telegram_id:
+                self._guests[telegram_id] = {"local_id": local_id, "fields": json.loads(fields)}
+        self._update_gauge()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _update_gauge(self):
+        PENDING_GAUGE.set(self.pending_count())
+
+    def find(self, telegram_id) -> Optional[Dict]:
+        """Анкета зарегистрированного гостя (копия полей) или None"""
+        with self._lock:
+            guest = self._guests.get(str(telegram_id))
+            return dict(guest["fields"]) if guest else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._guests)
+
+    def upsert(self, fields: Dict) -> Tuple[Dict, bool]:
+        """
+        Регистрация гостя (ждёт отправки в Airtable). Повторная регистрация с тем же Telegram ID
+        обновляет его строку: в Airtable уйдёт одно обновление, а не новая запись.
+        Возвращает ({"id", "fields"}, created).
+        """
+        telegram_id = telegram_id_of(fields)
+        with self._lock, self._db:
+            guest = self._guests.get(telegram_id) if telegram_id else None
+            if guest is None:
+                encoded = json.dumps(fields, ensure_ascii=False)
+                cursor = self._db.execute("INSERT INTO guests (telegram_id, fields) VALUES (?, ?)", (telegram_id, encoded))
+                guest = {"local_id": cursor.lastrowid, "fields": dict(fields)}
+                created = True
+            else:
+                # Дата регистрации - первая: по ней сверка находит запись, созданную перед сбоем
+                merged = {**fields, "Registration Date": guest["fields"].get("Registration Date", fields.get("Registration Date"))}
+                self._db.execute(
+                    "UPDATE guests SET fields = ?, version = version + 1, attempts = 0, next_attempt = 0 WHERE local_id = ?",
+                    (json.dumps(merged, ensure_ascii=False), guest["local_id"]),
+                )
+                guest = {"local_id": guest["local_id"], "fields": merged}
+                created = False
+            if telegram_id:
+                self._guests[telegram_id] = guest
+        self._update_gauge()
+        return {"id": record_id(guest["local_id"], telegram_id), "fields": dict(guest["fields"])}, created
+
+    def records(self) -> List[Dict]:
+        """Все гости (по одной записи на гостя) в формате записей Airtable ({"id", "fields"})"""
+        with self._lock:
+            rows = self._db.execute(_CURRENT_ROWS).fetchall()
+        return [{"id": record_id(local_id, telegram_id), "fields": json.loads(fields)} for local_id, telegram_id, fields in rows]
+
+    def iter_pages(self, page_size: int = 100) -> Iterator[List[Dict]]:
+        """Гости страницами, как guests_table.iterate(): отдельное соединение читает снимок WAL, не блокируя запись"""
+        reader = sqlite3.connect(self.path)
+        try:
+            cursor = reader.execute(_CURRENT_ROWS)
+            while True:
+                rows = cursor.fetchmany(page_size)
+                if not rows:
+                    break
+                yield [{"id": record_id(local_id, telegram_id), "fields": json.loads(fields)} for local_id, telegram_id, fields in rows]
+        finally:
+            reader.close()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM guests WHERE version > synced_version").fetchone()[0]
+
+    def pending(self, limit: int = BATCH_SIZE, now: Optional[float] = None) -> List[Dict]:
+        """Записи, которые пора отправить: [{"local_id", "airtable_id", "version", "fields"}]"""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT local_id, airtable_id, version, fields FROM guests "
+                "WHERE version > synced_version AND next_attempt <= ? ORDER BY local_id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+        return [
+            {"local_id": local_id, "airtable_id": airtable_id, "version": version, "fields": json.loads(fields)}
+            for local_id, airtable_id, version, fields in rows
+        ]
+
+    def mark_synced(self, local_id: int, airtable_id: str, version: int):
+        # Запись могли изменить, пока шла отправка: тогда версия выше и она останется в очереди
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE guests SET airtable_id = ?, synced_version = MAX(synced_version, ?), "
+                "attempts = 0, next_attempt = 0, last_error = NULL WHERE local_id = ?",
+                (airtable_id, version, local_id),
+            )
+        self._update_gauge()
+
+    def mark_failed(self, local_ids: List[int], error: str):
+        now = time.time()
+        with self._lock, self._db:
+            for local_id in local_ids:
+                row = self._db.execute("SELECT attempts FROM guests WHERE local_id = ?", (local_id,)).fetchone()
+                attempts = (row[0] if row else 0) + 1
+                delay = min(BACKOFF_BASE ** attempts, BACKOFF_MAX)
+                self._db.execute(
+                    "UPDATE guests SET attempts = ?, next_attempt = ?, last_error = ? WHERE local_id = ?",
+                    (attempts, now + delay, error[:500], local_id),
+                )
+
+    def merge_remote(self, remote_records: List[Dict]) -> List[Dict]:
+        """
+        Сверка с записями Airtable. Возвращает изменённые записи гостей ({"id", "fields"}).
+          - известная запись без локальных изменений -> поля из Airtable
+          - неотмеченная локальная запись с теми же Telegram ID и датой регистрации -> уже создана
+            в Airtable (процесс упал между запросом и отметкой): только проставляем airtable_id
+          - старый дубль уже известного гостя (повторная регистрация до upsert) -> пропускаем
+          - остальные -> новые локальные записи (добавлены в Airtable вручную или первый запуск)
+        """
+        changed = []
+        with self._lock, self._db:
+            for remote in remote_records:
+                airtable_id = remote["id"]
+                fields = remote.get("fields", {})
+                telegram_id = telegram_id_of(fields)
+                encoded = json.dumps(fields, ensure_ascii=False)
+                current = self._guests.get(telegram_id) if telegram_id else None
+                row = self._db.execute(
+                    "SELECT local_id, version, synced_version, fields FROM guests WHERE airtable_id = ?", (airtable_id,)
+                ).fetchone()
+                if row is not None:
+                    local_id, version, synced_version, local_fields = row
+                    if version == synced_version and local_fields != encoded:
+                        self._db.execute("UPDATE guests SET fields = ? WHERE local_id = ?", (encoded, local_id))
+                        # Дубли гостя в статистику и индекс не попадают
+                        if current is None or current["local_id"] == local_id:
+                            if telegram_id:
+                                self._guests[telegram_id] = {"local_id": local_id, "fields": dict(fields)}
+                            changed.append({"id": record_id(local_id, telegram_id), "fields": fields})
+                    continue
+
+                orphan = self._db.execute(
+                    "SELECT local_id, fields FROM guests WHERE airtable_id IS NULL AND telegram_id = ?", (telegram_id,)
+                ).fetchall()
+                match = next(
+                    (local_id for local_id, local_fields in orphan
+                     if json.loads(local_fields).get("Registration Date") == fields.get("Registration Date")),
+                    None,
+                )
+                if match is not None:
+                    # Версию не трогаем: если запись менялась, её изменения уйдут обновлением
+                    self._db.execute(
+                        "UPDATE guests SET airtable_id = ?, synced_version = 1 WHERE local_id = ?", (airtable_id, match)
+                    )
+                    continue
+
+                if current is not None and str(current["fields"].get("Registration Date", "")) >= str(fields.get("Registration Date", "")):
+                    continue
+
+                cursor = self._db.execute(
+                    "INSERT INTO guests (telegram_id, fields, airtable_id, version, synced_version) VALUES (?, ?, ?, 1, 1)",
+                    (telegram_id, encoded, airtable_id),
+                )
+                if telegram_id:
+                    self._guests[telegram_id] = {"local_id": cursor.lastrowid, "fields": dict(fields)}
+                changed.append({"id": record_id(cursor.lastrowid, telegram_id), "fields": fields})
+        self._update_gauge()
+        return changed
+
+
+# ── Синхронизация с Airtable (блокирующие вызовы pyairtable - в отдельном потоке) ──
+def push_pending(table, store: GuestStore, batch_size: int = BATCH_SIZE) -> int:
+    """Отправляет одну пачку: новые записи - batch_create, изменённые - batch_update. Возвращает число записанных"""
+    rows = store.pending(batch_size)
+    creates = [row for row in rows if not row["airtable_id"]]
+    updates = [row for row in rows if row["airtable_id"]]
+    synced = 0
+
+    if creates:
+        try:
+            with metrics.track_upstream("airtable", "guests.batch_create"):
+                created = table.batch_create([row["fields"] for row in creates])
+            # Airtable возвращает записи в порядке запроса
+            for row, record in zip(creates, created):
+                store.mark_synced(row["local_id"], record["id"], row["version"])
+            synced += len(created)
+        except Exception as e:
+            logger.error(f"❌ Airtable batch create failed ({len(creates)} guests): {e}")
+            store.mark_failed([row["local_id"] for row in creates], str(e))
+
+    if updates:
+        try:
+            with metrics.track_upstream("airtable", "guests.batch_update"):
+                table.batch_update([{"id": row["airtable_id"], "fields": row["fields"]} for row in updates])
+            for row in updates:
+                store.mark_synced(row["local_id"], row["airtable_id"], row["version"])
+            synced += len(updates)
+        except Exception as e:
+            logger.error(f"❌ Airtable batch update failed ({len(updates)} guests): {e}")
+            store.mark_failed([row["local_id"] for row in updates], str(e))
+
+    return synced
+
+
+def reconcile(table, store: GuestStore) -> List[Dict]:
+    """Полная сверка с Airtable на старте; возвращает изменённые локальные записи"""
+    with metrics.track_upstream("airtable", "guests.all"):
+        remote = table.all()
+    changed = store.merge_remote(remote)
+    logger.info(f"🔄 Guest registry reconciled: {len(remote)} in Airtable, {len(changed)} updated locally, "
+                f"{store.pending_count()} pending")
+    return changed
+
+
+class GuestWriter:
+    """
+    Фоновая отправка реестра в Airtable: по сигналу notify() или раз в interval секунд.
+    interval=None - только по сигналу, повторы после ошибок запускает планировщик (flush по расписанию).
+    get_table() -> None - отправлять пока нельзя (реестр ещё не сверен с Airtable): записи ждут следующего flush.
+    """
+
+    def __init__(self, store: GuestStore, get_table: Callable[[], Awaitable], interval: Optional[float] = 5.0):
+        self.store = store
+        self.get_table = get_table
+        self.interval = interval
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def notify(self):
+        self._wake.set()
+
+    async def flush(self):
+        """Отправляет пачки, пока есть что отправлять (записи в ожидании повтора не трогаем)"""
+        # Сигнал и плановый повтор не отправляют одни и те же записи дважды
+        async with self._flush_lock:
+            if not self.store.pending(1):
+                return
+            table = await self.get_table()
+            if table is None:
+                return
+            while await asyncio.to_thread(push_pending, table, self.store):
+                pass
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                try:
+                    await self.flush()
+                except Exception as e:
+                    logger.error(f"❌ Guest sync error: {e}")
+        finally:
+            # Остановка бота: последняя попытка отправить (не отправленное останется в базе до следующего старта)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Guest sync final flush failed: {e}")
@@ -0,0 +1,7 @@
+"""
+Нагрузочный тест Weddy Bot
+Настоящие Dispatcher и роутеры из wedding_bot_v2.py против локальных заглушек
+Telegram Bot API, Anthropic, Perplexity и Airtable с настраиваемыми задержками.
+
+Запуск: python -m loadtest --users 50 --rounds 2
+"""
@@ -0,0 +1,327 @@
+"""
+Нагрузочный тест: N симулированных гостей проходят /start, /form, /menu и свободный чат
+через настоящий Dispatcher, а бот ходит в локальные заглушки.
+
+Примеры:
+  python -m loadtest --users 50
+  python -m loadtest --users 200 --scenario chat --latency anthropic=lognormal:0.5,0.3
+  python -m loadtest --users 20 --rounds 3 --think 0.5 --json report.json
+  python -m loadtest --catalog-edits 20     # правки каталогов "куратором" по ходу теста, свежесть через вебхуки
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from loadtest.fake_servers import DEFAULT_LATENCIES, FakeUpstreams
+
+BOT_TOKEN = "123456:LOADTEST"
+FIRST_USER_ID = 10_000_000
+# Таблица Airtable каждой категории каталога
+CATALOG_TABLES = {
+    "restaurants": "Restaurants",
+    "yoga": "yoga_fitness_studios",
+    "hotels": "Hotels",
+    "breakfast": "Breakfast",
+    "spa": "Spa",
+    "shopping": "Shopping",
+    "art": "Art",
+}
+
+# Шаг сценария: ("message", текст) или ("callback", data)
+SCENARIOS: Dict[str, List[Tuple[str, str]]] = {
+    "start": [("message", "/start")],
+    "form": [
+        ("message", "/form"),
+        ("message", "Гость Нагрузочный"),
+        ("message", "05.01.2026"),
+        ("message", "Да"),
+        ("message", "10.01.2026"),
+        ("message", "2"),
+        ("message", "Вино"),
+        ("message", "Нет особенностей"),
+        ("message", "нет"),
+    ],
+    "menu": [
+        ("message", "/menu"),
+        ("callback", "category_restaurants"),
+        ("callback", "restaurants_ubud"),
+        ("callback", "back_to_menu"),
+        ("callback", "category_hotels"),
+        ("callback", "hotels_canggu"),
+    ],
+    "chat": [
+        ("message", "Где поесть в Убуде?"),
+        ("message", "Какой дресс-код на свадьбе?"),
+        ("message", "Посоветуй йогу в Чангу"),
+        ("message", "Что посмотреть на Бали?"),
+    ],
+}
+
+
+def step_label(scenario: str, kind: str, payload: str) -> str:
+    """Группа для статистики: сценарий + команда, callback-префикс или текст"""
+    if kind == "callback":
+        return f"{scenario}:callback:{payload.split('_')[0]}"
+    if payload.startswith("/"):
+        return f"{scenario}:{payload.split()[0]}"
+    return f"{scenario}:text"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.freshness: List[float] = []
+        self._update_id = 0
+        self._message_id = 0
+
+    def _next_ids(self) -> Tuple[int, int]:
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    def _build_update(self, app, user_id: int, kind: str, payload: str):
+        from aiogram.types import Update
+
+        update_id, message_id = self._next_ids()
+        user = {"id": user_id, "is_bot": False, "first_name": f"Guest{user_id}", "username": f"guest{user_id}"}
+        chat = {"id": user_id, "type": "private"}
+        if kind == "callback":
+            data = {
+                "update_id": update_id,
+                "callback_query": {
+                    "id": str(update_id),
+                    "from": user,
+                    "chat_instance": str(user_id),
+                    "data": payload,
+                    "message": {"message_id": message_id, "date": int(time.time()), "chat": chat, "text": "menu"},
+                },
+            }
+        else:
+            data = {
+                "update_id": update_id,
+                "message": {"message_id": message_id, "date": int(time.time()), "chat": chat, "from": user, "text": payload},
+            }
+        return Update.model_validate(data, context={"bot": app.bot})
+
+    async def _run_user(self, app, user_id: int, steps: List[Tuple[str, str, str]], rng: random.Random):
+        # Разносим старт пользователей по окну разгона
+        await asyncio.sleep(rng.uniform(0, self.args.ramp_up))
+        for _ in range(self.args.rounds):
+            for scenario, kind, payload in steps:
+                label = step_label(scenario, kind, payload)
+                update = self._build_update(app, user_id, kind, payload)
+                start = time.perf_counter()
+                try:
+                    await app.dp.feed_update(app.bot, update)
+                except Exception as e:
+                    self.errors[label] += 1
+                    logging.getLogger("loadtest").debug(f"{label}: {e!r}")
+                self.latencies[label].append(time.perf_counter() - start)
+                if self.args.think:
+                    await asyncio.sleep(rng.expovariate(1 / self.args.think))
+
+    async def _edit_catalogs(self, app, upstreams: FakeUpstreams, rng: random.Random):
+        """Куратор правит записи каталогов; замеряем, через сколько правка видна в каталоге бота"""
+        while not upstreams.webhooks:
+            await asyncio.sleep(0.05)
+        for i in range(self.args.catalog_edits):
+            category = rng.choice(list(CATALOG_TABLES))
+            table = CATALOG_TABLES[category]
+            record_id = f"rec{table[:3]}{rng.randrange(self.args.catalog_size):06d}"
+            vibe = f"edited vibe {i}"
+            start = time.perf_counter()
+            await upstreams.edit_record(table, record_id, {"vibe_short_en": vibe})
+            catalog_bot = app.CATALOG_BOTS[category]
+            while not (catalog_bot.built and catalog_bot.catalog_records.get(record_id, {}).get("fields", {}).get("vibe_short_en") == vibe):
+                if time.perf_counter() - start > 30:
+                    self.errors["catalog:webhook"] += 1
+                    break
+                await asyncio.sleep(0.01)
+            else:
+                self.freshness.append(time.perf_counter() - start)
+            await asyncio.sleep(rng.uniform(0, 2 * self.args.ramp_up / max(1, self.args.catalog_edits)))
+
+    async def run(self) -> Dict:
+        upstreams = FakeUpstreams(self.args.latency, catalog_size=self.args.catalog_size, seed=self.args.seed,
+                                  catalog_tables=list(CATALOG_TABLES.values()))
+        base_url = upstreams.start_in_thread()
+        # Приёмник вебхуков Airtable бота - на свободном порту
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            webhook_port = probe.getsockname()[1]
+
+        # Переменные окружения важнее .env.wedding (python-decouple смотрит их первыми),
+        # поэтому бот гарантированно ходит только в заглушки
+        os.environ.update({
+            "WEDDING_BOT_TOKEN": BOT_TOKEN,
+            "CLAUDE_API_KEY": "loadtest",
+            "PERPLEXITY_API_KEY": "loadtest",
+            "AIRTABLE_TOKEN": "loadtest",
+            "AIRTABLE_BASE_ID": "appLOADTEST",
+            "AIRTABLE_TABLE_NAME": upstreams.guests_table,
+            "AIRTABLE_RESTAURANTS_TABLE": CATALOG_TABLES["restaurants"],
+            "AIRTABLE_YOGA_TABLE": CATALOG_TABLES["yoga"],
+            "AIRTABLE_HOTELS_TABLE": CATALOG_TABLES["hotels"],
+            "AIRTABLE_BREAKFAST_TABLE": CATALOG_TABLES["breakfast"],
+            "AIRTABLE_SPA_TABLE": CATALOG_TABLES["spa"],
+            "AIRTABLE_SHOPPING_TABLE": CATALOG_TABLES["shopping"],
+            "AIRTABLE_ART_TABLE": CATALOG_TABLES["art"],
+            "METRICS_PORT": "0",
+            "TELEGRAM_API_URL": f"{base_url}/tg",
+            "ANTHROPIC_BASE_URL": f"{base_url}/anthropic",
+            "PERPLEXITY_API_URL": f"{base_url}/perplexity/chat/completions",
+            "AIRTABLE_ENDPOINT_URL": f"{base_url}/airtable",
+            # Реестр гостей - во временной папке, чтобы прогоны не копили регистрации
+            "GUEST_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="weddy-loadtest-"), "guests.db"),
+            "AIRTABLE_WEBHOOK_URL": f"http://127.0.0.1:{webhook_port}/airtable/webhook",
+            "AIRTABLE_WEBHOOK_HOST": "127.0.0.1",
+            "AIRTABLE_WEBHOOK_PORT": str(webhook_port),
+        })
+
+        import wedding_bot_v2 as app
+
+        app.setup_dispatcher()
+        # Регистрации уходят в Airtable фоновым писателем, как в main()
+        guest_writer_task = asyncio.create_task(app.GUEST_WRITER.run())
+        webhook_runner, webhook_task = await app.start_catalog_webhooks()
+
+        scenario_names = list(SCENARIOS) if self.args.scenario == "all" else [self.args.scenario]
+        steps = [(name, kind, payload) for name in scenario_names for kind, payload in SCENARIOS[name]]
+        rng = random.Random(self.args.seed)
+        upstream_calls_before = dict(upstreams.calls)
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            self._edit_catalogs(app, upstreams, random.Random(rng.random())),
+            *(self._run_user(app, FIRST_USER_ID + i, steps, random.Random(rng.random())) for i in range(self.args.users)),
+        )
+        wall = time.perf_counter() - started
+
+        guest_writer_task.cancel()
+        webhook_task.cancel()
+        await asyncio.gather(guest_writer_task, webhook_task, return_exceptions=True)
+        await webhook_runner.cleanup()
+        await app.bot.session.close()
+        upstreams.stop()
+
+        upstream_calls = {k: v - upstream_calls_before.get(k, 0) for k, v in upstreams.calls.items()}
+        return self._report(wall, upstream_calls)
+
+    def _report(self, wall: float, upstream_calls: Dict[str, int]) -> Dict:
+        all_latencies = sorted(v for values in self.latencies.values() for v in values)
+        steps = {}
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            steps[label] = {
+                "count": len(values),
+                "errors": self.errors.get(label, 0),
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+        return {
+            "users": self.args.users,
+            "rounds": self.args.rounds,
+            "scenario": self.args.scenario,
+            "latencies": {service: self.args.latency.get(service, spec) for service, spec in DEFAULT_LATENCIES.items()},
+            "wall_seconds": wall,
+            "updates": len(all_latencies),
+            "throughput_updates_per_s": len(all_latencies) / wall if wall else 0.0,
+            "overall": {
+                "p50_ms": percentile(all_latencies, 0.50) * 1000,
+                "p95_ms": percentile(all_latencies, 0.95) * 1000,
+                "p99_ms": percentile(all_latencies, 0.99) * 1000,
+            },
+            "steps": steps,
+            "catalog_freshness": {
+                "edits": self.args.catalog_edits,
+                "errors": self.errors.get("catalog:webhook", 0),
+                "p50_ms": percentile(sorted(self.freshness), 0.50) * 1000,
+                "max_ms": max(self.freshness, default=0.0) * 1000,
+            },
+            "upstream_calls": upstream_calls,
+        }
+
+
+def print_report(report: Dict):
+    print()
+    print(f"Пользователей: {report['users']} × {report['rounds']} раунд(а), сценарий: {report['scenario']}")
+    print("Задержки заглушек: " + ", ".join(f"{k}={v}" for k, v in report["latencies"].items()))
+    print(f"Апдейтов: {report['updates']} за {report['wall_seconds']:.1f} с → {report['throughput_updates_per_s']:.1f} апдейтов/с")
+    overall = report["overall"]
+    print(f"Общая задержка: p50 {overall['p50_ms']:.0f} ms · p95 {overall['p95_ms']:.0f} ms · p99 {overall['p99_ms']:.0f} ms")
+    print()
+    print(f"{'шаг':<26}{'кол-во':>8}{'ошибки':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, s in report["steps"].items():
+        print(f"{label:<26}{s['count']:>8}{s['errors']:>8}{s['p50_ms']:>10.0f}{s['p95_ms']:>10.0f}{s['p99_ms']:>10.0f}{s['max_ms']:>10.0f}")
+    freshness = report["catalog_freshness"]
+    if freshness["edits"]:
+        print(f"Правки каталогов по вебхукам: {freshness['edits']} (ошибок {freshness['errors']}), "
+              f"видны в каталоге через p50 {freshness['p50_ms']:.0f} ms · max {freshness['max_ms']:.0f} ms")
+    print()
+    print("Вызовы внешних API: " + ", ".join(f"{k}={v}" for k, v in sorted(report["upstream_calls"].items())))
+
+
+def parse_latency(values: List[str]) -> Dict[str, str]:
+    latencies = {}
+    for value in values or []:
+        service, _, spec = value.partition("=")
+        if service not in DEFAULT_LATENCIES or not spec:
+            raise argparse.ArgumentTypeError(f"Ожидается <service>=<spec>, service из {list(DEFAULT_LATENCIES)}: '{value}'")
+        latencies[service] = spec
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description="Нагрузочный тест Weddy Bot против локальных заглушек")
+    parser.add_argument("--users", type=int, default=20, help="число одновременных гостей")
+    parser.add_argument("--rounds", type=int, default=1, help="сколько раз каждый гость проходит сценарий")
+    parser.add_argument("--scenario", choices=["all", *SCENARIOS], default="all")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза между шагами гостя, с")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="окно разгона: гости стартуют равномерно в течение N секунд")
+    parser.add_argument("--catalog-size", type=int, default=40, help="записей в каждой таблице каталога")
+    parser.add_argument("--catalog-edits", type=int, default=5, help="правок каталогов в Airtable по ходу теста (0 - без правок)")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=SPEC",
+                        help="задержка заглушки, напр. anthropic=lognormal:0,0.35 или airtable=fixed:0.2")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", metavar="PATH", help="сохранить отчёт в JSON")
+    parser.add_argument("--verbose", action="store_true", help="не глушить логи бота")
+    args = parser.parse_args()
+    args.latency = parse_latency(args.latency)
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            # Бот печатает DEBUG-вывод на каждый запрос - под нагрузкой он только мешает замерам
+            logging.disable(logging.WARNING)
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        report = asyncio.run(LoadTest(args).run())
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Локальные заглушки внешних API для нагрузочного теста.
+Один aiohttp сервер в отдельном потоке (бот ходит в Airtable синхронно,
+поэтому заглушки не должны жить в его event loop):
+  /tg/bot<token>/<method>          - Telegram Bot API
+  /anthropic/v1/messages           - Anthropic Messages
+  /perplexity/chat/completions     - Perplexity chat completions
+  /airtable/v0/<base>/<table>      - Airtable REST
+  /airtable/v0/bases/<base>/webhooks, /airtable/v0/meta/bases/<base>/tables - вебхуки и схема базы
+
+edit_record() меняет запись каталога так, как это сделал бы куратор в Airtable:
+payload для вебхуков и подписанный сигнал на их notificationUrl.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+AREAS = ["Ubud", "Canggu", "Pererenan", "Uluwatu", "Bingin", "Seminyak", "Berawa"]
+CUISINES = ["Italian", "Japanese", "Modern Indonesian", "Balinese", "Mexican", "Vegan", "Seafood", "French"]
+VIBES = ["romantic sunset views", "casual beach vibe", "fine dining tasting menu", "cozy garden", "rooftop cocktails"]
+PRICE_LEVELS = ["$", "$$", "$$$", "$$$$"]
+
+
+class LatencyModel:
+    """
+    Распределение задержки в секундах, задаётся строкой:
+      fixed:0.05 | uniform:0.02,0.2 | normal:0.3,0.1 | lognormal:<mu>,<sigma> | zero
+    """
+
+    def __init__(self, spec: str = "zero", rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")] if params else []
+        expected = {"zero": 0, "fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Неверное описание задержки: '{spec}'")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(*self.params))
+        if self.kind == "lognormal":
+            return self.rng.lognormvariate(*self.params)
+        return 0.0
+
+
+DEFAULT_LATENCIES = {
+    "telegram": "uniform:0.03,0.12",
+    "anthropic": "lognormal:0.0,0.35",     # медиана ~1 с
+    "perplexity": "lognormal:1.2,0.3",     # медиана ~3.3 с
+    "airtable": "uniform:0.15,0.4",
+}
+
+
+def table_id(name: str) -> str:
+    return "tbl" + hashlib.md5(name.encode("utf-8")).hexdigest()[:14]
+
+
+def _synthetic_records(table: str, size: int, rng: random.Random) -> List[Dict]:
+    """Записи каталога со всеми вариантами полей-имён (у каждой таблицы своё имя колонки)"""
+    records = []
+    for i in range(size):
+        name = f"{table.title()} Place {i}"
+        fields = {
+            "area": rng.choice(AREAS),
+            "restaurant_name_en": name, "restaurant_name_ru": name,
+            "hotel_name_en": name, "hotel_name_ru": name,
+            "studio_name_en": name,
+            "spa_name_en": name, "spa_name_ru": name,
+            "shop_name_en": name, "shop_name_ru": name,
+            "art_name_en": name, "art_name_ru": name,
+            "category_en": rng.choice(["restaurant", "cafe", "boutique", "studio"]),
+            "category_ru": "Категория",
+            "cuisine_style_en": rng.choice(CUISINES),
+            "cuisine_style_ru": "Кухня",
+            "vibe_short_en": rng.choice(VIBES),
+            "vibe_short_ru": "Атмосфера",
+            "vibe_tags": "romantic, view, sunset",
+            "price_level": rng.choice(PRICE_LEVELS),
+            "prestige_tier": rng.choice(["A", "B", "C"]),
+            "rating": round(rng.uniform(3.5, 5.0), 1),
+            "rating_stars": rng.choice(["★★★", "★★★★", "★★★★★"]),
+            "instagram_link": f"https://instagram.com/place{i}",
+            # Юг Бали: от Улувату до Убуда
+            "latitude": round(rng.uniform(-8.85, -8.45), 6),
+            "longitude": round(rng.uniform(115.05, 115.30), 6),
+        }
+        records.append({"id": f"rec{table[:3]}{i:06d}", "createdTime": "2025-01-01T00:00:00.000Z", "fields": fields})
+    return records
+
+
+class FakeUpstreams:
+    """Все заглушки в одном сервере; считает вызовы по сервисам"""
+
+    def __init__(self, latencies: Dict[str, str], catalog_size: int = 40, seed: int = 42, guests_table: str = "Wedding Guests",
+                 catalog_tables: List[str] = ()):
+        self.rng = random.Random(seed)
+        self.latency = {
+            service: LatencyModel(latencies.get(service, default), random.Random(seed + i))
+            for i, (service, default) in enumerate(DEFAULT_LATENCIES.items())
+        }
+        self.catalog_size = catalog_size
+        self.guests_table = guests_table
+        self.tables: Dict[str, List[Dict]] = {}
+        # Схема базы для /meta: таблицы каталогов и гостей известны заранее
+        self.table_names = [*catalog_tables, guests_table]
+        self.webhooks: Dict[str, Dict] = {}
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    # ── Запуск в отдельном потоке ─────────────────────────────────────────────
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start(host, port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _start(self, host: str, port: int):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/tg/bot{token}/{method}", self.telegram)
+        app.router.add_post("/anthropic/v1/messages", self.anthropic)
+        app.router.add_post("/perplexity/chat/completions", self.perplexity)
+        # Служебные маршруты Airtable - раньше общих /{base}/{table}
+        app.router.add_get("/airtable/v0/meta/bases/{base}/tables", self.airtable_schema)
+        app.router.add_route("*", "/airtable/v0/bases/{base}/webhooks", self.airtable_webhooks)
+        app.router.add_route("*", "/airtable/v0/bases/{base}/webhooks/{webhook_id}", self.airtable_webhooks)
+        app.router.add_route("*", "/airtable/v0/bases/{base}/webhooks/{webhook_id}/{action}", self.airtable_webhooks)
+        app.router.add_route("*", "/airtable/v0/{base}/{table}", self.airtable)
+        app.router.add_route("*", "/airtable/v0/{base}/{table}/{record_id}", self.airtable)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        sockets = site._server.sockets
+        self.base_url = f"http://{host}:{sockets[0].getsockname()[1]}"
+
+    async def _delay(self, service: str):
+        with self._lock:
+            self.calls[service] += 1
+        await asyncio.sleep(self.latency[service].sample())
+
+    # ── Telegram Bot API ──────────────────────────────────────────────────────
+    async def telegram(self, request: web.Request) -> web.Response:
+        await self._delay("telegram")
+        method = request.match_info["method"].lower()
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method in ("sendmessage", "editmessagetext", "senddocument"):
+            with self._lock:
+                self._message_id += 1
+                message_id = self._message_id
+            chat_id = int(params.get("chat_id") or 0)
+            result = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": str(params.get("text", ""))[:100],
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    # ── Anthropic Messages ────────────────────────────────────────────────────
+    async def anthropic(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await self._delay("anthropic")
+        input_chars = len(body.get("system", "")) + sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        return web.json_response({
+            "id": f"msg_{self.rng.randrange(10**12)}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "claude"),
+            "content": [{"type": "text", "text": "Окей, вот что я знаю (ответ заглушки нагрузочного теста)."}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_chars // 4, "output_tokens": 40},
+        })
+
+    # ── Perplexity ────────────────────────────────────────────────────────────
+    async def perplexity(self, request: web.Request) -> web.Response:
+        await request.json()
+        await self._delay("perplexity")
+        return web.json_response({
+            "id": "pplx",
+            "model": "sonar",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "Актуальные данные (заглушка)."}}],
+            "citations": ["https://example.com/bali"],
+            "usage": {"prompt_tokens": 300, "completion_tokens": 120, "total_tokens": 420},
+        })
+
+    # ── Airtable REST ─────────────────────────────────────────────────────────
+    def _table(self, name: str) -> List[Dict]:
+        with self._lock:
+            if name not in self.tables:
+                size = 0 if name == self.guests_table else self.catalog_size
+                self.tables[name] = _synthetic_records(name, size, self.rng)
+            return self.tables[name]
+
+    def _store(self, table: str, fields: Dict, record_id: Optional[str] = None) -> Dict:
+        records = self._table(table)
+        with self._lock:
+            for record in records:
+                if record_id and record["id"] == record_id:
+                    record["fields"].update(fields)
+                    return record
+            record = {
+                "id": record_id or f"rec{self.rng.randrange(16**14):014x}",
+                "createdTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+                "fields": dict(fields),
+            }
+            records.append(record)
+            return record
+
+    async def airtable(self, request: web.Request) -> web.Response:
+        await self._delay("airtable")
+        table = request.match_info["table"]
+        record_id = request.match_info.get("record_id")
+
+        if request.method == "GET":
+            records = self._table(table)
+            if record_id:
+                found = next((r for r in records if r["id"] == record_id), None)
+                return web.json_response(found or {"error": "NOT_FOUND"}, status=200 if found else 404)
+            formula = request.query.get("filterByFormula")
+            if formula:
+                # OR(RECORD_ID()='rec...', ...) - выборка изменённых записей
+                wanted = set(re.findall(r"RECORD_ID\(\)='(\w+)'", formula))
+                records = [r for r in records if r["id"] in wanted]
+            page_size = int(request.query.get("pageSize", 100))
+            offset = int(request.query.get("offset", 0))
+            page = {"records": records[offset:offset + page_size]}
+            if offset + page_size < len(records):
+                page["offset"] = str(offset + page_size)
+            return web.json_response(page)
+
+        body = json.loads(await request.text() or "{}")
+        if request.method == "DELETE":
+            return web.json_response({"id": record_id, "deleted": True})
+        if "records" in body:
+            stored = [self._store(table, r.get("fields", {}), r.get("id")) for r in body["records"]]
+            return web.json_response({"records": stored})
+        return web.json_response(self._store(table, body.get("fields", {}), record_id))
+
+    # ── Airtable: схема базы и вебхуки ────────────────────────────────────────
+    async def airtable_schema(self, request: web.Request) -> web.Response:
+        await self._delay("airtable")
+        return web.json_response({"tables": [{"id": table_id(name), "name": name} for name in self.table_names]})
+
+    async def airtable_webhooks(self, request: web.Request) -> web.Response:
+        await self._delay("airtable")
+        webhook_id = request.match_info.get("webhook_id")
+        action = request.match_info.get("action")
+
+        if webhook_id is None:
+            if request.method == "GET":
+                return web.json_response({"webhooks": [
+                    {"id": hook_id, "notificationUrl": hook["notificationUrl"], "cursorForNextPayload": len(hook["payloads"]) + 1}
+                    for hook_id, hook in self.webhooks.items()
+                ]})
+            body = await request.json()
+            secret = self.rng.randbytes(32)
+            hook_id = f"ach{self.rng.randrange(16**14):014x}"
+            with self._lock:
+                self.webhooks[hook_id] = {"notificationUrl": body.get("notificationUrl"), "secret": secret, "payloads": []}
+            return web.json_response({
+                "id": hook_id,
+                "macSecretBase64": base64.b64encode(secret).decode("ascii"),
+                "expirationTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() + 7 * 86400)),
+            })
+
+        hook = self.webhooks.get(webhook_id)
+        if hook is None:
+            return web.json_response({"error": "NOT_FOUND"}, status=404)
+        if request.method == "DELETE":
+            with self._lock:
+                self.webhooks.pop(webhook_id, None)
+            return web.json_response({})
+        if action == "refresh":
+            return web.json_response({"expirationTime": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() + 7 * 86400))})
+        if action == "payloads":
+            cursor = int(request.query.get("cursor", 1))
+            with self._lock:
+                payloads = hook["payloads"][cursor - 1:cursor - 1 + 50]
+                total = len(hook["payloads"])
+            next_cursor = cursor + len(payloads)
+            return web.json_response({"payloads": payloads, "cursor": next_cursor, "mightHaveMore": next_cursor <= total})
+        return web.json_response({"error": "NOT_FOUND"}, status=404)
+
+    async def _edit_record(self, table: str, record_id: str, fields: Dict):
+        from aiohttp import ClientSession
+
+        self._store(table, fields, record_id)
+        payload = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "baseTransactionNumber": self.rng.randrange(10**6),
+            "changedTablesById": {table_id(table): {"changedRecordsById": {record_id: {"current": {"cellValuesByFieldId": {}}}}}},
+        }
+        with self._lock:
+            hooks = list(self.webhooks.items())
+            for _, hook in hooks:
+                hook["payloads"].append(payload)
+        async with ClientSession() as session:
+            for hook_id, hook in hooks:
+                body = json.dumps({"base": {"id": "app"}, "webhook": {"id": hook_id}, "timestamp": payload["timestamp"]}).encode("utf-8")
+                mac = "hmac-sha256=" + hmac.new(hook["secret"], body, hashlib.sha256).hexdigest()
+                async with session.post(hook["notificationUrl"], data=body, headers={"X-Airtable-Content-MAC": mac}) as response:
+                    response.raise_for_status()
+
+    def edit_record(self, table: str, record_id: str, fields: Dict) -> asyncio.Future:
+        """Правка записи "куратором": запись, payload вебхука и сигнал боту; future для await из другого loop"""
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._edit_record(table, record_id, fields), self._loop))
@@ -0,0 +1,352 @@
+"""
+Метрики Weddy Bot в формате Prometheus
+Гистограммы задержек хендлеров и внешних API, счётчики ошибок, кэшей и лаг event loop.
+Отдаются по HTTP на локальном порту: GET /metrics
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов (секунды): от быстрых хендлеров до долгих ответов Perplexity
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Собирает строку лейблов {a="x",b="y"} для текстового формата Prometheus"""
+    parts = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Общая часть всех метрик: имя, описание, лейблы и блокировка (метрики пишут и из потоков)"""
+
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются лейблы {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # {labels: [счётчики по бакетам, сумма, количество]}
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока with (работает и вокруг await)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Оценка квантиля по бакетам (верхняя граница бакета, как histogram_quantile без интерполяции)"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if not state or not state[2]:
+                return None
+            counts, total = list(state[0]), state[2]
+        rank = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        for key, counts, total_sum, total_count in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total_sum)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {total_count}"
+
+
+class MetricsRegistry:
+    """Реестр всех метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# ── Метрики бота ──────────────────────────────────────────────────────────────
+HANDLER_LATENCY = REGISTRY.histogram(
+    "weddy_handler_duration_seconds",
+    "Время обработки апдейта хендлером aiogram",
+    ("handler", "event")
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "weddy_handler_errors_total",
+    "Необработанные исключения в хендлерах",
+    ("handler", "event")
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "weddy_upstream_duration_seconds",
+    "Время вызова внешнего сервиса (Claude, Perplexity, Airtable, Telegram)",
+    ("service", "operation")
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "weddy_upstream_requests_total",
+    "Вызовы внешних сервисов по статусу (ok/error)",
+    ("service", "operation", "status")
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "weddy_cache_requests_total",
+    "Обращения к кэшам и кураторской базе (hit - ответили без платного API)",
+    ("cache", "result")
+)
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "weddy_event_loop_lag_seconds",
+    "Задержка пробуждения event loop относительно запланированной",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+EVENT_LOOP_LAG_LAST = REGISTRY.gauge(
+    "weddy_event_loop_lag_last_seconds",
+    "Последний замер задержки event loop"
+)
+
+
+class _UpstreamCall:
+    """Хэндл вызова внешнего сервиса: позволяет пометить ответ как ошибочный (например, HTTP 500)"""
+
+    def __init__(self):
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+
+@contextmanager
+def track_upstream(service: str, operation: str):
+    """
+    Замеряет вызов внешнего сервиса и открывает для него спан трассировки.
+    Исключение внутри блока считается ошибкой; неуспешный ответ помечается через call.fail()
+    """
+    call = _UpstreamCall()
+    start = time.perf_counter()
+    # Каждый вызов внешнего сервиса - ещё и спан текущего трейса
+    with tracing.span(f"{service}.{operation}") as trace_span:
+        try:
+            yield call
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - start, service=service, operation=operation)
+            UPSTREAM_REQUESTS.inc(service=service, operation=operation, status="error" if call.failed else "ok")
+            if call.failed:
+                trace_span.set_attribute("error", True)
+
+
+def record_cache(cache: str, hit: bool):
+    """Учитывает попадание/промах кэша"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# ── aiogram middlewares ───────────────────────────────────────────────────────
+async def handler_middleware(handler, event, data):
+    """
+    Inner middleware aiogram: гистограмма задержки по имени хендлера
+    (cmd_start, show_results, ...) - ограниченное число лейблов вместо текста команд
+    """
+    handler_object = data.get("handler")
+    callback = getattr(handler_object, "callback", None)
+    handler_name = getattr(callback, "__name__", "unknown")
+    event_name = type(event).__name__
+    start = time.perf_counter()
+    try:
+        return await handler(event, data)
+    except Exception:
+        HANDLER_ERRORS.inc(handler=handler_name, event=event_name)
+        raise
+    finally:
+        HANDLER_LATENCY.observe(time.perf_counter() - start, handler=handler_name, event=event_name)
+
+
+async def telegram_request_middleware(make_request, bot, method):
+    """Request middleware сессии бота: задержка каждого вызова Telegram Bot API"""
+    with track_upstream("telegram", type(method).__name__) as call:
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            call.fail()
+            raise
+
+
+# ── Event loop lag ────────────────────────────────────────────────────────────
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Фоновая задача: насколько позже запланированного просыпается event loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - scheduled)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+
+# ── HTTP endpoint ─────────────────────────────────────────────────────────────
+async def start_metrics_server(host: str = "127.0.0.1", port: int = 9108, extra_routes: Optional[Dict] = None):
+    """Поднимает HTTP сервер с GET /metrics (и доп. GET маршрутами {path: handler}); возвращает runner для остановки"""
+    from aiohttp import web
+
+    async def metrics_handler(request):
+        return web.Response(
+            body=REGISTRY.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    for path, handler in (extra_routes or {}).items():
+        app.router.add_get(path, handler)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
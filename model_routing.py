@@ -0,0 +1,153 @@
+"""
+Выбор модели Claude под запрос: "спасибо" не должно ждать и стоить как план поездки на неделю.
+
+Запрос дёшево классифицируется по тексту, истории и наличию доп. контекста (поиск Perplexity, пустая выдача каталога):
+  short    - благодарность, приветствие, "ок"            -> быстрая модель, короткий ответ
+  chat     - обычный вопрос                              -> быстрая модель
+  search   - ответ по найденному контексту               -> быстрая модель, ответ длиннее
+  complex  - план/маршрут/сравнение, длинный или многосоставный вопрос -> сильная модель
+
+  route = route_request(user_message, history, has_context)
+  model = {"fast": CLAUDE_FAST_MODEL, "strong": CLAUDE_STRONG_MODEL}[route.tier]
+  record(route, model, seconds, response.usage)   - задержка, токены и стоимость по классам (метрики)
+"""
+
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import metrics
+
+
+class Route(NamedTuple):
+    name: str
+    tier: str  # fast | strong
+    max_tokens: int
+    temperature: float
+
+
+ROUTES: Dict[str, Route] = {
+    "short": Route("short", "fast", 150, 0.5),
+    "chat": Route("chat", "fast", 500, 0.3),
+    "search": Route("search", "fast", 600, 0.3),
+    "complex": Route("complex", "strong", 1200, 0.4),
+}
+
+# Вежливость и подтверждения: сообщение только из этих слов (и эмодзи) - класс short
+ACK_WORDS = {
+    "спасибо", "спс", "благодарю", "большое", "огромное", "thanks", "thank", "you", "thx",
+    "ок", "окей", "ok", "okay", "хорошо", "понял", "поняла", "поняли", "ясно", "супер", "класс",
+    "отлично", "круто", "здорово", "ура", "привет", "здравствуйте", "добрый", "день", "вечер",
+    "hi", "hello", "hey", "пока", "bye", "да", "нет", "ага", "угу", "yes", "no", "cool", "great",
+}
+SHORT_MAX_WORDS = 4
+
+# План, маршрут, сравнение - ответ длинный и требует рассуждения. Только намерения целиком:
+# "планирую прилететь", "по плану", "бюджетно поесть" - обычные вопросы (и "Планирую" - ответ кнопки анкеты)
+PLANNING_PATTERN = re.compile(
+    r"\bплан\s+(?:поездки|отдыха|путешествия|на\s+(?:\d|недел|выходн|день|дни|несколько))|"
+    r"\b(?:рас|с)планир\w*|\bсостав\w*\s+(?:план|программ)|\bмаршрут\w*|\bпо\s+дням\b|\bсравни\w*|"
+    r"\bна\s+\d+\s+(?:дн|дня|дней|ноч)|\bна\s+недел|\bна\s+несколько\s+дней|"
+    r"\bitinerar\w*|\bplan\s+(?:a|my|our|the)\s+(?:trip|day|days|week|stay)\b|\bcompare\b|"
+    r"\bfor\s+\d+\s+days?\b|\b\d+-day\b"
+)
+COMPLEX_MIN_WORDS = 40
+COMPLEX_MIN_QUESTIONS = 3
+
+_WORD = re.compile(r"\w+")
+
+
+def _bot_asked(history: List[Dict]) -> bool:
+    """Последний ответ бота - вопрос: "да"/"нет" гостя - это ответ на него, а не вежливость"""
+    return bool(history) and history[-1].get("role") == "assistant" and str(history[-1].get("content", "")).rstrip().endswith("?")
+
+
+def classify(message: str, history: Optional[List[Dict]] = None, has_context: bool = False) -> str:
+    """
+    >>> classify("Планирую")
+    'chat'
+    >>> classify("планирую прилететь 7 января")
+    'chat'
+    >>> classify("Во сколько начало по плану?")
+    'chat'
+    >>> classify("а бюджетно где поесть")
+    'chat'
+    >>> classify("составь план поездки на 5 дней по Бали")
+    'complex'
+    >>> classify("распланируй нам неделю после свадьбы")
+    'complex'
+    >>> classify("plan my trip to Ubud")
+    'complex'
+    """
+    text = message.lower()
+    words = _WORD.findall(text)
+    if len(words) <= SHORT_MAX_WORDS and set(words) <= ACK_WORDS and not _bot_asked(history or []):
+        return "short"
+    if PLANNING_PATTERN.search(text) or len(words) >= COMPLEX_MIN_WORDS or text.count("?") >= COMPLEX_MIN_QUESTIONS:
+        return "complex"
+    if has_context:
+        return "search"
+    return "chat"
+
+
+def route_request(message: str, history: Optional[List[Dict]] = None, has_context: bool = False) -> Route:
+    """Класс запроса и параметры вызова Claude; history - без текущего сообщения"""
+    return ROUTES[classify(message, history, has_context)]
+
+
+# ── Статистика по классам ─────────────────────────────────────────────────────
+# Цена за миллион токенов (input, output), USD; модель ищется по самому длинному префиксу
+PRICES_PER_MTOK: Dict[str, Tuple[float, float]] = {
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-haiku-4-5": (1.00, 5.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+    "claude-sonnet-4": (3.00, 15.00),
+    "claude-opus-4": (15.00, 75.00),
+}
+
+ROUTE_REQUESTS = metrics.REGISTRY.counter(
+    "weddy_claude_route_requests_total",
+    "Вызовы Claude по классу запроса и модели",
+    ("route", "model")
+)
+ROUTE_DURATION = metrics.REGISTRY.histogram(
+    "weddy_claude_route_duration_seconds",
+    "Задержка ответа Claude по классу запроса",
+    ("route",),
+    buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0)
+)
+ROUTE_TOKENS = metrics.REGISTRY.counter(
+    "weddy_claude_route_tokens_total",
+    "Токены Claude по классу запроса (input, output)",
+    ("route", "direction")
+)
+ROUTE_COST = metrics.REGISTRY.counter(
+    "weddy_claude_route_cost_usd_total",
+    "Стоимость вызовов Claude по классу запроса, USD",
+    ("route",)
+)
+
+
+def price_for(model: str) -> Tuple[float, float]:
+    """(input, output) USD за миллион токенов; неизвестная модель - (0, 0)"""
+    prefix = max((prefix for prefix in PRICES_PER_MTOK if model.startswith(prefix)), key=len, default=None)
+    return PRICES_PER_MTOK.get(prefix, (0.0, 0.0))
+
+
+def cost_usd(model: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = price_for(model)
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def record(route: Route, model: str, seconds: float, usage=None):
+    """Учитывает вызов: usage - response.usage Anthropic (input_tokens, output_tokens) или None"""
+    ROUTE_REQUESTS.inc(route=route.name, model=model)
+    ROUTE_DURATION.observe(seconds, route=route.name)
+    if usage is None:
+        return
+    input_tokens = getattr(usage, "input_tokens", 0) or 0
+    output_tokens = getattr(usage, "output_tokens", 0) or 0
+    ROUTE_TOKENS.inc(input_tokens, route=route.name, direction="input")
+    ROUTE_TOKENS.inc(output_tokens, route=route.name, direction="output")
+    ROUTE_COST.inc(cost_usd(model, input_tokens, output_tokens), route=route.name)
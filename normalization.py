@@ -0,0 +1,164 @@
+"""
+Нормализация текста для поиска по каталогу: русские и английские формы слова сводятся к одному термину.
+
+  terms("Итальянскую кухню с видом на закат")  -> {"italian", "кухн", "view", "sunset", ...}
+  terms("italian restaurant, sunset views")     -> {"italian", "restaurant", "sunset", "view"}
+
+  1. слова: нижний регистр, ё -> е
+  2. лёгкий стемминг: русские окончания и уменьшительные суффиксы, английские -s/-es/-ies/-ing/-ed
+  3. двуязычные синонимы: русская основа -> английский термин (ключевые слова каталога - английские)
+  4. транслитерация кириллицы для нечёткого сравнения с латинскими названиями ("Локавор" -> "lokavor")
+
+Поля каталога нормализуются при загрузке, запрос - один раз (LRU-кэш normalize_query).
+"""
+
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple
+
+_WORD = re.compile(r"[a-zа-я0-9]+")
+
+# Окончания: длинные раньше коротких; основа не короче _MIN_STEM букв
+_RU_ENDINGS = tuple(sorted((
+    "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ой", "ей", "ий", "ый", "ая", "яя",
+    "ое", "ее", "ую", "юю", "ом", "ем", "ах", "ях", "ов", "ев", "ам", "ям", "ые", "ие", "ым", "им",
+    "ых", "их", "ать", "ять", "ить", "еть", "ть", "ешь", "ете", "ют", "ут", "ет", "ит",
+    "а", "я", "о", "е", "у", "ю", "ы", "и", "й", "ь",
+), key=len, reverse=True))
+# Уменьшительные суффиксы после окончания: "ресторанчик" -> "ресторан", "кафешк(а)" -> "кафе"
+_RU_DIMINUTIVES = ("чик", "ечк", "очк", "ашк", "ешк", "шк")
+_MIN_STEM = 3
+
+# Русская основа (после стемминга) -> английский термин каталога
+SYNONYMS = {
+    "italian": ("итальянск", "итальянц"),
+    "japanese": ("японск",),
+    "indonesian": ("индонезийск",),
+    "balinese": ("балийск",),
+    "mexican": ("мексиканск",),
+    "french": ("французск",),
+    "thai": ("тайск",),
+    "indian": ("индийск",),
+    "chinese": ("китайск",),
+    "korean": ("корейск",),
+    "georgian": ("грузинск",),
+    "mediterranean": ("средиземноморск",),
+    "asian": ("азиатск",),
+    "vegan": ("веган", "веганск"),
+    "vegetarian": ("вегетарианск",),
+    "seafood": ("морепродукт",),
+    "fish": ("рыб", "рыбн"),
+    "steak": ("стейк",),
+    "sushi": ("суш",),
+    "pizza": ("пицц",),
+    "burger": ("бургер",),
+    "coffee": ("коф",),
+    "breakfast": ("завтрак",),
+    "brunch": ("бранч",),
+    "dinner": ("ужин", "поужин"),
+    "lunch": ("обед", "пообед"),
+    "eat": ("поес", "покуша"),
+    "restaurant": ("ресторан",),
+    "cafe": ("каф", "кафе"),
+    "bar": ("бар",),
+    "cocktail": ("коктейл",),
+    "wine": ("вин", "винн"),
+    "romantic": ("романтическ", "романтичн", "романтик"),
+    "view": ("вид",),
+    "sunset": ("закат",),
+    "ocean": ("океан",),
+    "beach": ("пляж", "пляжн"),
+    "jungle": ("джунгл",),
+    "rooftop": ("крыш",),
+    "family": ("семейн",),
+    "cozy": ("уютн",),
+    "garden": ("сад",),
+    "fine": ("изысканн",),
+    "tasting": ("дегустац", "дегустационн"),
+    "michelin": ("мишлен",),
+    "luxury": ("люкс", "роскошн"),
+    "cheap": ("дешев", "недорог", "бюджетн"),
+    "new": ("нов",),
+    "spa": ("спа",),
+    "massage": ("массаж",),
+    "yoga": ("йог",),
+    "hotel": ("отел", "гостиниц"),
+    "villa": ("вилл",),
+    "resort": ("курорт",),
+}
+
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s",
+    "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+})
+
+
+class NormalizedQuery(NamedTuple):
+    text: str                 # нижний регистр, ё -> е
+    latin: str                # транслитерация (совпадает с text, если кириллицы нет)
+    terms: FrozenSet[str]     # нормализованные термины
+
+
+def _prepare(text: str) -> str:
+    return str(text or "").lower().replace("ё", "е")
+
+
+def stem_ru(word: str) -> str:
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            word = word[:-len(ending)]
+            break
+    for suffix in _RU_DIMINUTIVES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM + 1:
+            return word[:-len(suffix)]
+    return word
+
+
+def stem_en(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    if len(word) > 6 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 5 and word.endswith("ed"):
+        return word[:-2]
+    return word
+
+
+# Английский термин проходит тот же стемминг, что и слова каталога ("tasting" -> "tast")
+_RU_TO_TERM = {stem: stem_en(term) for term, stems in SYNONYMS.items() for stem in stems}
+
+
+@lru_cache(maxsize=16384)
+def term(word: str) -> str:
+    """Одно слово (уже в нижнем регистре) -> термин"""
+    if word.isascii():
+        return stem_en(word)
+    stem = stem_ru(word)
+    return _RU_TO_TERM.get(stem, stem)
+
+
+def terms(text: str) -> FrozenSet[str]:
+    """Термины текста (поле каталога или запрос)"""
+    return frozenset(term(word) for word in _WORD.findall(_prepare(text)))
+
+
+def term_list(text: str) -> List[str]:
+    """Термины текста с повторами и в порядке слов (для частот терминов)"""
+    return [term(word) for word in _WORD.findall(_prepare(text))]
+
+
+def transliterate(text: str) -> str:
+    return _prepare(text).translate(_TRANSLIT)
+
+
+@lru_cache(maxsize=4096)
+def normalize_query(query: str) -> NormalizedQuery:
+    """Запрос гостя: текст, транслитерация и термины (кэш - гости часто повторяют одни и те же вопросы)"""
+    text = _prepare(query)
+    return NormalizedQuery(text, text.translate(_TRANSLIT), terms(text))
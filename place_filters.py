@@ -0,0 +1,202 @@
+"""
+Фильтры по тексту запроса для каталогов отелей, йоги, спа, завтраков, шоппинга и арта.
+
+  "недорогой бутик-отель"  -> цена $-$$ И тип boutique
+  "vinyasa"                -> стиль vinyasa (specialties студий)
+  "balinese massage"       -> стиль balinese (massage_type спа)
+
+Индекс строится при загрузке каталога поверх ranking.rank_catalog: у каждого места номер бита
+в общем отсортированном списке, у каждого значения атрибута (цена, тип, стиль, атмосфера) и района -
+битовая маска (int). Запрос - AND масок групп (OR внутри группы), обход установленных битов
+сразу даёт места в порядке рейтинга.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Группы атрибутов в порядке ослабления: если ничего не нашлось, сначала снимаем атмосферу, потом стиль...
+GROUPS = ("price", "type", "style", "vibe")
+
+# Общие слова категорий и служебные слова: не сужают выдачу ("отель" в запросе об отелях).
+# Латиница - целые слова, кириллица - основы (окончания у них разные)
+STOPWORDS = {
+    "hotel", "spa", "yoga", "studio", "cafe", "shop", "gallery", "art", "place", "bali",
+    "massage", "breakfast", "restaurant",
+    "the", "and", "with", "for", "best", "good", "near",
+}
+STOP_STEMS = (
+    "отел", "спа", "йог", "студи", "кафе", "магаз", "галер", "арт", "мест", "бали",
+    "массаж", "завтрак", "ресторан",
+    "для", "где", "что", "как", "или", "самы", "лучш", "хочу", "нужн", "посов", "хорош",
+)
+
+# Синонимы RU/EN: основа слова -> общий токен индекса (значения в Airtable бывают на обоих языках)
+SYNONYMS = {
+    "boutique": ("boutique", "бутик"),
+    "villa": ("villa", "вилл"),
+    "resort": ("resort", "курорт"),
+    "glamping": ("glamping", "глэмпинг", "глемпинг"),
+    "guesthouse": ("guesthouse", "гестхаус"),
+    "balinese": ("balinese", "балийск"),
+    "thai": ("thai", "тайск"),
+    "aroma": ("aroma", "аромат"),
+    "stone": ("stone", "камн", "камен"),
+    "vinyasa": ("vinyasa", "виньяс"),
+    "hatha": ("hatha", "хатх"),
+    "yin": ("yin", "инь"),
+    "kundalini": ("kundalini", "кундалин"),
+    "pilates": ("pilates", "пилатес"),
+    "meditation": ("meditat", "медитац"),
+    "vegan": ("vegan", "веган"),
+    "vegetarian": ("vegetarian", "вегетариан"),
+    "coffee": ("coffee", "кофе"),
+    "brunch": ("brunch", "бранч"),
+    "romantic": ("romantic", "романт"),
+    "beach": ("beach", "пляж"),
+    "jungle": ("jungle", "джунгл"),
+    "ocean": ("ocean", "океан"),
+    "sunset": ("sunset", "закат"),
+    "family": ("family", "семейн", "детск"),
+    "quiet": ("quiet", "тих", "спокойн"),
+    "cozy": ("cozy", "уютн"),
+    "pool": ("pool", "бассейн"),
+    "design": ("design", "дизайн"),
+    "jewelry": ("jewel", "ювелир", "украшен"),
+    "ceramics": ("ceramic", "керамик"),
+    "textile": ("textile", "текстил", "ткан"),
+    "silver": ("silver", "серебр"),
+    "contemporary": ("contemporary", "современ"),
+    "traditional": ("traditional", "традиц"),
+}
+_SYNONYM_STEMS = sorted(((stem, token) for token, stems in SYNONYMS.items() for stem in stems), key=lambda item: -len(item[0]))
+
+# Цена: слова запроса -> уровни ($ - $$$$). Целые слова с окончаниями прилагательных:
+# "дорогой" - цена, "дорога"/"у дороги" - нет; "mid" - только "mid-range", не "midnight"
+_ADJECTIVE = r"(?:ой|ий|ая|яя|ое|ее|ие|ые|ого|его|ую|юю|их|ых|им|ым|ими|ыми|ом|ем|о)"
+_PRICE_WORDS = tuple((re.compile(pattern), levels) for pattern, levels in (
+    (rf"\b(?:недорог{_ADJECTIVE}|(?:по)?дешевл\w*|деш[её]в\w*|бюджетн{_ADJECTIVE}|эконом\w*"
+     r"|cheap\w*|budget|affordable|inexpensive|low[- ]cost)\b", {1, 2}),
+    (rf"\b(?:средн{_ADJECTIVE}|mid[- ]?range|mid[- ]?priced|moderate\w*)\b", {2, 3}),
+    (rf"\b(?:дорог{_ADJECTIVE}|(?:по)?дороже|люкс\w*|роскошн{_ADJECTIVE}|премиум\w*"
+     r"|luxur\w*|premium|expensive|upscale|high[- ]end)\b", {3, 4}),
+))
+_DOLLARS = re.compile(r"\${1,4}")
+_WORD = re.compile(r"[a-zа-яё]+")
+
+
+def normalize_token(word: str) -> Optional[str]:
+    """Слово -> токен индекса: синоним, основа (кириллица - первые 5 букв, латиница - без -s) или None"""
+    word = word.lower().replace("ё", "е")
+    if len(word) < 3:
+        return None
+    for stem, token in _SYNONYM_STEMS:
+        if word.startswith(stem):
+            return token
+    if word.isascii():
+        token = word[:-1] if len(word) > 3 and word.endswith("s") else word
+        return None if token in STOPWORDS or word in STOPWORDS else token
+    return None if word.startswith(STOP_STEMS) else word[:5]
+
+
+def tokens(text: str) -> set:
+    result = set()
+    for word in _WORD.findall(str(text or "").lower()):
+        token = normalize_token(word)
+        if token:
+            result.add(token)
+    return result
+
+
+def price_level(value) -> Optional[int]:
+    """price_level места ("$$", "2", 2) -> 1..4"""
+    if value in (None, ""):
+        return None
+    text = str(value)
+    dollars = text.count("$")
+    if dollars:
+        return min(dollars, 4)
+    digits = re.search(r"\d", text)
+    return min(max(int(digits.group()), 1), 4) if digits else None
+
+
+def price_constraint(query: str) -> Optional[set]:
+    """Уровни цены из запроса: слова ("недорогой") или явные "$$"; None - цена не упомянута"""
+    query_lower = query.lower()
+    explicit = _DOLLARS.findall(query_lower)
+    if explicit:
+        return {len(dollars) for dollars in explicit}
+    # Первое по тексту ценовое слово ("недорогой" - целое слово, "дорогой" внутри него не находится)
+    found = [(match.start(), levels) for pattern, levels in _PRICE_WORDS for match in [pattern.search(query_lower)] if match]
+    return min(found, key=lambda item: item[0])[1] if found else None
+
+
+def _iter_bits(mask: int) -> Iterable[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class FilterIndex:
+    """
+    Битовые индексы атрибутов поверх списка [(area, place)], отсортированного по рейтингу.
+    fields: группа -> ключи места, из которых берутся токены ("type": ("type", "type_ru")).
+    """
+
+    def __init__(self, ranked_places: List[Tuple[str, Dict]], fields: Dict[str, Tuple[str, ...]]):
+        self.places = ranked_places
+        self.all_mask = (1 << len(ranked_places)) - 1
+        self.area_masks: Dict[str, int] = {}
+        self.price_masks: Dict[int, int] = {}
+        self.token_masks: Dict[str, Dict[str, int]] = {group: {} for group in fields}
+
+        for position, (area, place) in enumerate(ranked_places):
+            bit = 1 << position
+            self.area_masks[area] = self.area_masks.get(area, 0) | bit
+            level = price_level(place.get("price_level"))
+            if level is not None:
+                self.price_masks[level] = self.price_masks.get(level, 0) | bit
+            for group, keys in fields.items():
+                masks = self.token_masks[group]
+                for token in set().union(*(tokens(place.get(key, "")) for key in keys)):
+                    masks[token] = masks.get(token, 0) | bit
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def constraints(self, query: str) -> List[Tuple[str, int]]:
+        """[(группа, маска)] для запроса в порядке GROUPS; токены вне словаря каталога игнорируются"""
+        result = []
+        levels = price_constraint(query or "")
+        if levels:
+            mask = 0
+            for level in levels:
+                mask |= self.price_masks.get(level, 0)
+            result.append(("price", mask))
+
+        query_tokens = tokens(query)
+        for group in GROUPS[1:]:
+            masks = self.token_masks.get(group, {})
+            mask = 0
+            for token in query_tokens & masks.keys():
+                mask |= masks[token]
+            if mask:
+                result.append((group, mask))
+        return result
+
+    def search(self, query: str, location: Optional[str] = None) -> List[Tuple[str, Dict]]:
+        """Места района (или всех районов), подходящие под запрос, в порядке рейтинга"""
+        base = self.area_masks.get(location, 0) if location else self.all_mask
+        if not base:
+            return []
+        constraints = self.constraints(query)
+        # Слишком строгий запрос: снимаем группы с конца, пока что-то не найдётся
+        while constraints:
+            mask = base
+            for _, group_mask in constraints:
+                mask &= group_mask
+            if mask:
+                base = mask
+                break
+            constraints.pop()
+        return [self.places[position] for position in _iter_bits(base)]
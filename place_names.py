@@ -0,0 +1,203 @@
+"""
+Поиск места по названию с опечатками: "Locavor", "Mason Canggu", "Кинг Кол".
+
+Индекс в стиле SymSpell строится один раз на загрузку каталогов: для каждого названия (английского
+и русского, в латинице) заранее сгенерированы все варианты с удалением до 2 букв. Подряд идущие
+слова запроса дают свои удаления - совпадение ищется в словаре, без перебора каталога.
+
+  index_for(catalogs)           - индекс по {category: {area: [place]}}; пересобирается после перезагрузки каталога
+  index.lookup("где Locavor?")  - NameMatch(category, area, place, distance) или None
+"""
+
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from rapidfuzz.distance import DamerauLevenshtein
+
+import gazetteer
+import normalization
+
+MAX_EDIT_DISTANCE = 2
+MIN_KEY_LENGTH = 3
+# Название из одного короткого или обычного слова ("Home", "The Slow", "Dear Bali") совпадает,
+# только если сообщение целиком - это название: иначе "wifi is slow" - карточка The Slow
+WEAK_KEY_LENGTH = 6
+COMMON_WORDS = {
+    "home", "slow", "dear", "clear", "love", "life", "nice", "fine", "blue", "green", "white", "black",
+    "room", "time", "day", "night", "sun", "moon", "sea", "sky", "fire", "wave", "hello", "friends", "family",
+    "please", "here", "there", "open", "free", "fresh", "local", "secret", "simple", "little", "small", "happy",
+    "sunset", "garden", "market", "nature", "island", "jungle", "forest", "organic", "healthy", "wifi", "today",
+}
+
+# Слова, которые сами по себе не называют место ("beach", "cafe", районы): n-грамма только из них не ищется
+GENERIC_WORDS = {
+    "the", "and", "bali", "cafe", "restaurant", "resto", "bar", "spa", "hotel", "villa", "resort", "yoga",
+    "studio", "beach", "club", "house", "kitchen", "coffee", "gallery", "art", "shop", "store", "warung",
+    "where", "what", "how", "about", "near", "best", "good", "is", "in", "at", "to",
+}
+GENERIC_WORDS |= {normalization.transliterate(word) for word in ("где", "как", "что", "про", "это", "рядом", "лучший")}
+GENERIC_WORDS |= {word for alias in gazetteer.ALIAS_TO_AREA for word in normalization.transliterate(alias).split()}
+GENERIC_WORDS |= set(normalization.SYNONYMS)
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_CYRILLIC = re.compile(r"[а-яё]")
+
+
+class NameMatch(NamedTuple):
+    category: str
+    area: str
+    place: Dict
+    distance: int
+
+
+def normalize_name(text: str) -> str:
+    """Название или запрос -> латиница, нижний регистр, слова через один пробел"""
+    return _NON_WORD.sub(" ", normalization.transliterate(text)).strip()
+
+
+def name_keys(name: str) -> Set[str]:
+    """
+    Ключи названия: полное и без служебных слов по краям -
+    "The Lawn" -> "lawn", "Como Uma Canggu" -> "como uma", "King Cole Gallery" -> "king cole"
+    """
+    words = normalize_name(name).split()
+    keys = {" ".join(words)}
+    if words and words[0] == "the":
+        words = words[1:]
+    while len(words) > 1 and words[-1] in GENERIC_WORDS:
+        words = words[:-1]
+    keys.add(" ".join(words))
+    return keys
+
+
+def allowed_distance(length: int, transliterated: bool = False) -> int:
+    """
+    Сколько опечаток допускаем: короткие названия - только точно.
+    Кириллица в латинице на одну правку дальше от названия ("Локавор" -> "lokavor" против "locavore")
+    """
+    if length <= 4:
+        return 0
+    if length <= 8:
+        return 2 if transliterated else 1
+    return MAX_EDIT_DISTANCE
+
+
+def _content_words(words: Iterable[str]) -> List[str]:
+    return [word for word in words if word not in GENERIC_WORDS]
+
+
+def is_weak_key(key: str) -> bool:
+    """Ключ из одного значимого слова, короткого или обычного"""
+    content = _content_words(key.split())
+    return len(content) == 1 and (len(content[0]) < WEAK_KEY_LENGTH or content[0] in COMMON_WORDS)
+
+
+def deletes(word: str, distance: int) -> Set[str]:
+    """Слово и все варианты с удалением до distance символов"""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))}
+        result |= frontier
+    return result
+
+
+class NameIndex:
+    def __init__(self, catalogs: Dict[str, Dict[str, List[Dict]]]):
+        self.entries: List[Tuple[str, str, Dict]] = []
+        self.keys: Dict[str, List[int]] = {}
+        self._deletes: Dict[str, Set[str]] = defaultdict(set)
+        self.max_words = 1
+        self.max_key_length = 0
+
+        for category, db in catalogs.items():
+            for area, places in db.items():
+                for place in places:
+                    position = len(self.entries)
+                    self.entries.append((category, area, place))
+                    for name in (place.get("name", ""), place.get("name_ru", "")):
+                        for key in name_keys(name):
+                            self._add_key(key, position)
+
+    def _add_key(self, key: str, position: int):
+        if len(key) < MIN_KEY_LENGTH or all(word in GENERIC_WORDS for word in key.split()):
+            return
+        if key not in self.keys:
+            self.keys[key] = []
+            # Удаления - с запасом на транслитерацию: запрос на кириллице сравнивается с той же глубиной
+            for variant in deletes(key, allowed_distance(len(key), transliterated=True)):
+                self._deletes[variant].add(key)
+            self.max_words = max(self.max_words, len(key.split()))
+            self.max_key_length = max(self.max_key_length, len(key))
+        self.keys[key].append(position)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _grams(self, words: List[str]) -> Iterable[str]:
+        """Подряд идущие слова запроса, длинные раньше коротких"""
+        for n in range(min(self.max_words, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                gram_words = words[i:i + n]
+                if all(word in GENERIC_WORDS for word in gram_words):
+                    continue
+                gram = " ".join(gram_words)
+                # Длиннее любого названия с запасом на опечатки - совпасть не может
+                if len(gram) <= self.max_key_length + MAX_EDIT_DISTANCE:
+                    yield gram
+
+    def lookup(self, text: str) -> Optional[NameMatch]:
+        """Лучшее совпадение названия в тексте: меньше опечаток, затем длиннее название"""
+        words = normalize_name(text).split()
+        if not words or not self.keys:
+            return None
+        grams = list(self._grams(words))
+        message_content = _content_words(words)
+        transliterated = bool(_CYRILLIC.search(text.lower()))
+
+        def fits(gram: str, key: str) -> bool:
+            # Слабое название - только если кроме него в сообщении ничего значимого нет
+            return not is_weak_key(key) or _content_words(gram.split()) == message_content
+
+        # Точное совпадение - просто поиск в словаре
+        exact = [gram for gram in grams if gram in self.keys and fits(gram, gram)]
+        if exact:
+            return self._match(max(exact, key=len), 0)
+
+        best: Optional[Tuple[int, int, str]] = None
+        for gram in grams:
+            limit = allowed_distance(len(gram), transliterated)
+            if not limit:
+                continue
+            for variant in deletes(gram, limit):
+                for key in self._deletes.get(variant, ()):
+                    distance = DamerauLevenshtein.distance(gram, key, score_cutoff=limit)
+                    if distance <= min(limit, allowed_distance(len(key), transliterated)) and fits(gram, key):
+                        candidate = (distance, -len(key), key)
+                        if best is None or candidate < best:
+                            best = candidate
+        return self._match(best[2], best[0]) if best else None
+
+    def _match(self, key: str, distance: int) -> NameMatch:
+        # Одинаковые названия в разных категориях: берём первое (порядок категорий каталога)
+        category, area, place = self.entries[self.keys[key][0]]
+        return NameMatch(category, area, place, distance)
+
+
+# (ключ, индекс, объекты каталогов): ссылки на объекты держим, чтобы их id не переиспользовались
+_INDEX_CACHE: Optional[Tuple[tuple, NameIndex, tuple]] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def index_for(catalogs: Dict[str, Dict[str, List[Dict]]]) -> NameIndex:
+    """Индекс для текущих каталогов; перезагрузка каталога (новый объект db) - пересборка"""
+    global _INDEX_CACHE
+    key = tuple((category, id(db)) for category, db in catalogs.items())
+    with _INDEX_LOCK:
+        if _INDEX_CACHE is not None and _INDEX_CACHE[0] == key:
+            return _INDEX_CACHE[1]
+        index = NameIndex(catalogs)
+        _INDEX_CACHE = (key, index, tuple(catalogs.values()))
+        return index
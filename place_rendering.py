@@ -0,0 +1,272 @@
+"""
+Рендеринг списков мест для меню категорий (/menu → категория → регион).
+Чистые функции: результаты search_* → текст сообщения Telegram.
+"""
+
+from typing import Dict, List, Tuple
+
+import geo
+
+
+# ── Рестораны ────────────────────────────────────────────────────────────────
+def render_restaurants(location: str, search_results: Dict) -> str:
+    if search_results.get("curated_restaurants"):
+        response_text = f"🍽 Рестораны в {location.capitalize()}:\n\n"
+        for i, rest in enumerate(search_results.get("curated_restaurants", []), 1):
+            response_text += f"{i}. {rest['name']}"
+            if rest.get('price_range'):
+                response_text += f" · {rest['price_range']}"
+            response_text += "\n"
+            if rest.get('cuisine_ru'):
+                response_text += f"{rest['cuisine_ru']}\n"
+            if rest.get('vibe_ru'):
+                response_text += f"{rest['vibe_ru']}\n"
+            if rest.get('instagram_link'):
+                response_text += f"{rest['instagram_link']}\n"
+            response_text += "\n"
+    else:
+        response_text = f"В базе нет ресторанов в {location.capitalize()}"
+    return response_text
+
+# ── Йога / Фитнес ────────────────────────────────────────────────────────────
+def render_yoga(location: str, search_results: Dict) -> str:
+    if search_results.get("curated_studios"):
+        response_text = f"🧘 Студии йоги в {location.capitalize()}:\n\n"
+        for i, studio in enumerate(search_results.get("curated_studios", []), 1):
+            response_text += f"{i}. {studio['name']}"
+            if studio.get('booking_type'):
+                response_text += f" · {studio['booking_type']}"
+            response_text += "\n"
+            if studio.get('category_ru'):
+                response_text += f"{studio['category_ru']}\n"
+            if studio.get('specialties_ru'):
+                response_text += f"{studio['specialties_ru']}\n"
+            if studio.get('highlights_ru'):
+                response_text += f"{studio['highlights_ru']}\n"
+            if studio.get('instagram_link'):
+                response_text += f"{studio['instagram_link']}\n"
+            response_text += "\n"
+    else:
+        response_text = f"В базе нет студий йоги в {location.capitalize()}"
+    return response_text
+
+# ── Отели ────────────────────────────────────────────────────────────────────
+def render_hotels(location: str, search_results: Dict) -> str:
+    if search_results.get("curated_hotels"):
+        response_text = f"🏨 Отели в {location.capitalize()}:\n\n"
+        for i, hotel in enumerate(search_results.get("curated_hotels", []), 1):
+            response_text += f"{i}. {hotel['name']}"
+            if hotel.get('price_level'):
+                response_text += f" · {hotel['price_level']}"
+            response_text += "\n"
+            if hotel.get('type_ru'):
+                response_text += f"{hotel['type_ru']}\n"
+            if hotel.get('style_ru'):
+                response_text += f"{hotel['style_ru']}\n"
+            if hotel.get('vibe_ru'):
+                response_text += f"{hotel['vibe_ru']}\n"
+            if hotel.get('instagram_handle'):
+                response_text += f"{hotel['instagram_handle']}\n"
+            if hotel.get('booking_link'):
+                response_text += f"{hotel['booking_link']}\n"
+            response_text += "\n"
+    else:
+        response_text = f"В базе нет отелей в {location.capitalize()}"
+    return response_text
+
+# ── Завтраки / Ланчи ─────────────────────────────────────────────────────────
+def render_breakfast(location: str, search_results: Dict) -> str:
+    if search_results.get("curated_cafes"):
+        response_text = f"☕ Завтраки/Ланчи в {location.capitalize()}:\n\n"
+        for i, cafe in enumerate(search_results.get("curated_cafes", []), 1):
+            response_text += f"{i}. {cafe['name']}"
+            if cafe.get('price_level'):
+                response_text += f" · {cafe['price_level']}"
+            response_text += "\n"
+            if cafe.get('category_ru'):
+                response_text += f"{cafe['category_ru']}\n"
+            if cafe.get('cuisine_ru'):
+                response_text += f"{cafe['cuisine_ru']}\n"
+            if cafe.get('vibe_ru'):
+                response_text += f"{cafe['vibe_ru']}\n"
+            if cafe.get('instagram_link'):
+                response_text += f"{cafe['instagram_link']}\n"
+            response_text += "\n"
+    else:
+        response_text = f"В базе нет кафе в {location.capitalize()}"
+    return response_text
+
+# ── Спа ──────────────────────────────────────────────────────────────────────
+def render_spa(location: str, search_results: Dict) -> str:
+    if search_results.get("curated_spas"):
+        response_text = f"💆 Спа в {location.capitalize()}:\n\n"
+        for i, spa in enumerate(search_results.get("curated_spas", []), 1):
+            response_text += f"{i}. {spa['name']}"
+            if spa.get('price_level'):
+                response_text += f" · {spa['price_level']}"
+            response_text += "\n"
+            if spa.get('category_ru'):
+                response_text += f"{spa['category_ru']}\n"
+            if spa.get('massage_type_ru'):
+                response_text += f"{spa['massage_type_ru']}\n"
+            if spa.get('vibe_ru'):
+                response_text += f"{spa['vibe_ru']}\n"
+            if spa.get('instagram_link'):
+                response_text += f"{spa['instagram_link']}\n"
+            response_text += "\n"
+    else:
+        response_text = f"В базе нет спа в {location.capitalize()}"
+    return response_text
+
+# ── Шоппинг ──────────────────────────────────────────────────────────────────
+def render_shopping(location: str, search_results: Dict) -> str:
+    if search_results.get("curated_shops"):
+        response_text = f"🛍 Шоппинг в {location.capitalize()}:\n\n"
+        for i, shop in enumerate(search_results.get("curated_shops", []), 1):
+            response_text += f"{i}. {shop['name']}"
+            if shop.get('price_level'):
+                response_text += f" · {shop['price_level']}"
+            response_text += "\n"
+            if shop.get('category_ru'):
+                response_text += f"{shop['category_ru']}\n"
+            if shop.get('specialty_ru'):
+                response_text += f"{shop['specialty_ru']}\n"
+            if shop.get('vibe_ru'):
+                response_text += f"{shop['vibe_ru']}\n"
+            if shop.get('instagram_link'):
+                response_text += f"{shop['instagram_link']}\n"
+            response_text += "\n"
+    else:
+        response_text = f"В базе нет магазинов в {location.capitalize()}"
+    return response_text
+
+# ── Арт ──────────────────────────────────────────────────────────────────────
+def render_art(location: str, search_results: Dict) -> str:
+    if search_results.get("curated_art"):
+        response_text = f"🎨 Арт в {location.capitalize()}:\n\n"
+        for i, art in enumerate(search_results.get("curated_art", []), 1):
+            response_text += f"{i}. {art['name']}"
+            if art.get('price_level'):
+                response_text += f" · {art['price_level']}"
+            response_text += "\n"
+            if art.get('category_ru'):
+                response_text += f"{art['category_ru']}\n"
+            if art.get('specialty_ru'):
+                response_text += f"{art['specialty_ru']}\n"
+            if art.get('vibe_ru'):
+                response_text += f"{art['vibe_ru']}\n"
+            if art.get('instagram_link'):
+                response_text += f"{art['instagram_link']}\n"
+            response_text += "\n"
+    else:
+        response_text = f"В базе нет арт-мест в {location.capitalize()}"
+    return response_text
+
+
+RENDERERS = {
+    "restaurants": render_restaurants,
+    "yoga": render_yoga,
+    "hotels": render_hotels,
+    "breakfast": render_breakfast,
+    "spa": render_spa,
+    "shopping": render_shopping,
+    "art": render_art,
+}
+
+
+def render_category_results(category: str, location: str, search_results: Dict) -> str:
+    """Текст ответа для категории и региона"""
+    renderer = RENDERERS.get(category)
+    if renderer is None:
+        return "Неизвестная категория"
+    return renderer(location, search_results)
+
+
+# ── Ближайшие места (гость прислал геолокацию) ───────────────────────────────
+NEARBY_TITLES = {
+    "restaurants": "🍽 Рестораны",
+    "breakfast": "☕ Завтраки/Ланчи",
+    "yoga": "🧘 Йога",
+    "hotels": "🏨 Отели",
+    "spa": "💆 Спа",
+    "shopping": "🛍 Шоппинг",
+    "art": "🎨 Арт",
+}
+
+
+def render_nearby(nearby: Dict[str, List[Tuple[float, Dict, str]]]) -> str:
+    """Текст ответа на геолокацию: {category: [(км, place, area)]} из GeoGrid.nearest"""
+    sections = []
+    for category, title in NEARBY_TITLES.items():
+        places = nearby.get(category)
+        if not places:
+            continue
+        section = f"{title}:\n"
+        for i, (distance, place, area) in enumerate(places, 1):
+            section += f"{i}. {place['name']} · {geo.format_distance(distance)}"
+            if area:
+                section += f" · {area.capitalize()}"
+            section += "\n"
+            if place.get('instagram_link'):
+                section += f"{place['instagram_link']}\n"
+        sections.append(section)
+    if not sections:
+        return "Рядом с этой точкой в нашей базе пока нет мест 🙈"
+    return "📍 Ближайшие места из нашей базы:\n\n" + "\n".join(sections)
+
+
+def render_proximity(anchor_name: str, nearby: Dict[str, List[Tuple[float, int, Dict, str]]]) -> str:
+    """Текст ответа "что рядом с ...": {category: [(км, минуты, place, area)]} из proximity.DistanceTable"""
+    sections = []
+    for category, title in NEARBY_TITLES.items():
+        places = nearby.get(category)
+        if not places:
+            continue
+        section = f"{title}:\n"
+        for i, (distance, minutes, place, area) in enumerate(places, 1):
+            section += f"{i}. {place['name']} · {geo.format_distance(distance)} · ~{minutes} мин на машине"
+            if area:
+                section += f" · {area.capitalize()}"
+            section += "\n"
+            if place.get('instagram_link'):
+                section += f"{place['instagram_link']}\n"
+        sections.append(section)
+    if not sections:
+        return f"Рядом с {anchor_name} в нашей базе пока нет мест 🙈"
+    return f"📍 Рядом с {anchor_name}:\n\n" + "\n".join(sections)
+
+
+# ── Карточка места (гость назвал место) ──────────────────────────────────────
+# Описательные поля разных каталогов в порядке показа
+CARD_DETAIL_FIELDS = (
+    "type_ru", "category_ru", "cuisine_ru", "style_ru", "specialties_ru", "specialty_ru",
+    "massage_type_ru", "vibe_ru", "highlights_ru", "description_ru_short", "awards_ru",
+)
+CARD_LINK_FIELDS = ("instagram_link", "instagram_handle", "booking_link", "phone")
+
+
+def render_place_card(category: str, area: str, place: Dict) -> str:
+    """Карточка одного места из каталога"""
+    emoji = NEARBY_TITLES.get(category, "📍").split()[0]
+    card = f"{emoji} {place['name']}"
+    if place.get('name_ru') and place['name_ru'] != place['name']:
+        card += f" ({place['name_ru']})"
+    card += "\n"
+
+    summary = [area.capitalize()] if area else []
+    price = place.get('price_level') or place.get('price_range')
+    if price:
+        summary.append(str(price))
+    if place.get('rating_stars'):
+        summary.append(str(place['rating_stars']))
+    if summary:
+        card += " · ".join(summary) + "\n"
+
+    card += "\n"
+    for field in CARD_DETAIL_FIELDS:
+        if place.get(field):
+            card += f"{place[field]}\n"
+    for field in CARD_LINK_FIELDS:
+        if place.get(field):
+            card += f"{place[field]}\n"
+    return card.rstrip("\n")
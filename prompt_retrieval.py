@@ -0,0 +1,285 @@
+"""
+Системный промпт под вопрос: вместо всего WEDDY_SYSTEM_PROMPT - обязательные разделы и только подходящие к вопросу.
+
+Промпт режется на разделы по заголовкам "## ", длинные разделы - ещё и по жирным подзаголовкам ("**Деньги:**").
+Куски индексируются BM25 по терминам normalization (стемминг, ru/en синонимы) вместе с темами раздела -
+ключевыми словами, которых нет в тексте ("регистрация" для RSVP, "обмен" для денег).
+
+  index = PromptIndex(WEDDY_SYSTEM_PROMPT, pinned=("ТВОЙ СТИЛЬ", ...), topics={"КОНТАКТЫ": "организатор связаться ..."})
+  prompt = index.assemble(user_message, history, context=perplexity_result, note="В базе нет отелей...")
+  prompt.text, prompt.tokens, prompt.sections
+
+Бюджет токенов жёсткий: закреплённые разделы и note - всегда, затем контекст поиска (до context_tokens,
+самые релевантные абзацы), затем разделы по убыванию BM25, пока помещаются. Порядок в промпте - исходный.
+Токены оцениваются по длине текста; фактические input_tokens - в метриках model_routing.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import metrics
+import normalization
+
+# Грубая оценка для смеси русского и английского (кириллица дробится мельче латиницы)
+CHARS_PER_TOKEN = 3.0
+
+# BM25
+K1 = 1.5
+B = 0.75
+# Порог отбора зависит от вопроса, а не от абсолютного BM25 (на полутора десятках кусков одно слово из topics
+# набирает 1.2-2.4): кусок берём, если в нём есть отличительный термин вопроса - встречающийся не больше
+# чем в DISTINCTIVE_SHARE кусков промпта ("свадьба" есть почти везде и раздел не выбирает), - и он набрал
+# не меньше RELATIVE_SCORE от лучшего куска
+DISTINCTIVE_SHARE = 0.25
+RELATIVE_SCORE = 0.4
+# Вес терминов из прошлых сообщений гостя (уточнения вида "а сколько это стоит?")
+HISTORY_WEIGHT = 0.5
+HISTORY_MESSAGES = 2
+
+# Служебные и вопросительные слова: есть почти в любом вопросе и в любом разделе
+STOPWORDS = frozenset(normalization.term(word) for word in (
+    "и", "в", "во", "на", "не", "с", "со", "к", "по", "за", "из", "у", "о", "об", "от", "до", "для", "а", "но",
+    "или", "что", "как", "где", "когда", "какой", "какая", "какие", "кто", "это", "этот", "там", "тут", "то",
+    "так", "же", "ли", "бы", "мне", "мы", "вы", "я", "ты", "он", "она", "они", "нам", "вам", "нас", "вас",
+    "есть", "быть", "будет", "если", "сколько", "можно", "нужно", "надо", "все", "всё", "еще", "ещё", "уже", "очень", "просто",
+    "лучший", "лучше", "хороший",
+    "the", "a", "an", "and", "or", "to", "of", "in", "on", "at", "for", "is", "are", "be", "what", "how",
+    "where", "when", "which", "who", "can", "do", "does", "i", "you", "we", "it", "this", "that", "with",
+))
+
+_SECTION_SPLIT = re.compile(r"\n(?=## )")
+# Жирный подзаголовок на отдельной строке: "**Деньги (важно!):**"
+_SUBHEADING = re.compile(r"^\*\*[^*\n]+\*\*:?[ \t]*$", re.MULTILINE)
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n|\n(?=\s*(?:[-*•]|\d+[.)]) )")
+
+PROMPT_TOKENS = metrics.REGISTRY.histogram(
+    "weddy_prompt_system_tokens",
+    "Оценка токенов системного промпта после отбора разделов",
+    buckets=(250, 500, 750, 1000, 1500, 2000, 2500, 3000, 4000, 6000)
+)
+PROMPT_SECTIONS = metrics.REGISTRY.counter(
+    "weddy_prompt_sections_total",
+    "Разделы системного промпта, попавшие в запрос",
+    ("section",)
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class Chunk(NamedTuple):
+    title: str   # строка заголовка "## ..." раздела ("" - вступление до первого заголовка)
+    body: str    # текст куска без заголовка раздела
+    tokens: int  # оценка с заголовком
+    pinned: bool
+
+
+class AssembledPrompt(NamedTuple):
+    text: str
+    tokens: int
+    sections: List[str]  # заголовки выбранных незакреплённых разделов
+    context_tokens: int  # из них - контекст поиска и note
+
+
+def _query_weights(message: str, history: Optional[List[Dict]] = None) -> Dict[str, float]:
+    """Термины вопроса с весом 1, прошлых сообщений гостя - HISTORY_WEIGHT"""
+    weights: Dict[str, float] = {}
+    previous = [entry for entry in (history or []) if entry.get("role") == "user"][-HISTORY_MESSAGES:]
+    for entry in previous:
+        # В истории сообщения гостя хранятся как "Имя: текст" - имя в поиск не берём
+        text = str(entry.get("content", "")).split(": ", 1)[-1]
+        for term in normalization.term_list(text):
+            if term not in STOPWORDS:
+                weights[term] = HISTORY_WEIGHT
+    for term in normalization.term_list(message):
+        if term not in STOPWORDS:
+            weights[term] = 1.0
+    return weights
+
+
+class BM25:
+    """BM25 по небольшому набору документов (списки терминов)"""
+
+    def __init__(self, documents: Sequence[List[str]]):
+        self.frequencies = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        document_counts = Counter(term for frequencies in self.frequencies for term in frequencies)
+        total = len(documents)
+        self.shares = {term: count / total for term, count in document_counts.items()}
+        self.idf = {
+            term: math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for term, count in document_counts.items()
+        }
+
+    def scores(self, weights: Dict[str, float]) -> List[float]:
+        result = []
+        for frequencies, length in zip(self.frequencies, self.lengths):
+            norm = K1 * (1 - B + B * length / self.average_length) if self.average_length else K1
+            score = 0.0
+            for term, weight in weights.items():
+                frequency = frequencies.get(term)
+                if frequency:
+                    score += weight * self.idf[term] * frequency * (K1 + 1) / (frequency + norm)
+            result.append(score)
+        return result
+
+
+def _pick(candidates: Iterable[Tuple[float, int, int]], budget: int) -> List[int]:
+    """
+    (score, tokens, позиция) подходящих кусков -> позиции лучших, помещающихся в budget;
+    куски слабее RELATIVE_SCORE от лучшего не берём, меньшие куски добирают остаток
+    """
+    chosen = []
+    ranked = sorted(candidates, key=lambda item: (-item[0], item[2]))
+    threshold = RELATIVE_SCORE * ranked[0][0] if ranked else 0.0
+    for score, tokens, position in ranked:
+        if score <= 0 or score < threshold:
+            break
+        if tokens <= budget:
+            chosen.append(position)
+            budget -= tokens
+    return sorted(chosen)
+
+
+def _truncate(text: str, tokens: int) -> str:
+    """Обрезка по границе слова до оценки в tokens"""
+    limit = int(tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+class PromptIndex:
+    def __init__(
+        self,
+        prompt: str,
+        pinned: Iterable[str] = (),
+        topics: Optional[Dict[str, str]] = None,
+        budget: int = 2000,
+        context_tokens: int = 600,
+        max_chunk_tokens: int = 400,
+    ):
+        """
+        pinned - начала заголовков закреплённых разделов без "## " ("ФАКТЫ"); вступление закреплено всегда.
+        topics - ключевые слова по началу заголовка раздела или жирного подзаголовка ("Деньги"):
+        слова раздела достаются его первому куску, чтобы не размывать IDF по всем кускам
+        """
+        self.budget = budget
+        self.context_tokens = context_tokens
+        pinned = tuple(pinned)
+        topics = topics or {}
+        self.chunks: List[Chunk] = []
+        documents: List[List[str]] = []
+
+        for section in _SECTION_SPLIT.split(prompt.strip()):
+            if section.startswith("## "):
+                title, _, body = section.partition("\n")
+                name = title[3:]
+            else:
+                title, body, name = "", section, ""
+            is_pinned = not title or name.startswith(pinned)
+            bodies = [body.strip("\n")]
+            if not is_pinned and estimate_tokens(section) > max_chunk_tokens:
+                bodies = self._split(body)
+            for number, part in enumerate(bodies):
+                topic = " ".join(
+                    words for prefix, words in topics.items()
+                    if (number == 0 and name.startswith(prefix)) or part.startswith(f"**{prefix}")
+                )
+                self.chunks.append(Chunk(title, part, estimate_tokens(f"{title}\n\n{part}\n\n"), is_pinned))
+                documents.append(normalization.term_list(f"{name} {topic} {part}"))
+
+        self._searchable = [position for position, chunk in enumerate(self.chunks) if not chunk.pinned]
+        # IDF - по всему промпту: слово из закреплённых разделов ("свадьба") - общее, раздел им не выбирается
+        self.bm25 = BM25(documents)
+        self.pinned_tokens = sum(chunk.tokens for chunk in self.chunks if chunk.pinned)
+
+    @staticmethod
+    def _split(body: str) -> List[str]:
+        """Раздел -> куски по жирным подзаголовкам (текст до первого - отдельный кусок)"""
+        starts = [match.start() for match in _SUBHEADING.finditer(body)]
+        bounds = [0] + [start for start in starts if start > 0] + [len(body)]
+        parts = (body[start:end].strip("\n") for start, end in zip(bounds, bounds[1:]))
+        return [part for part in parts if part.strip()]
+
+    def select(self, message: str, history: Optional[List[Dict]] = None, budget: Optional[int] = None) -> List[int]:
+        """Позиции незакреплённых кусков по вопросу и истории в пределах budget токенов"""
+        budget = self.budget - self.pinned_tokens if budget is None else budget
+        weights = _query_weights(message, history)
+        if not weights or budget <= 0:
+            return []
+        distinctive = [term for term in weights if self.bm25.shares.get(term, 1.0) <= DISTINCTIVE_SHARE]
+        if not distinctive:
+            return []
+        scores = self.bm25.scores(weights)
+        candidates = (
+            (scores[position], self.chunks[position].tokens, position)
+            for position in self._searchable
+            if any(term in self.bm25.frequencies[position] for term in distinctive)
+        )
+        return _pick(candidates, budget)
+
+    def _select_context(self, context: str, message: str, history: Optional[List[Dict]], budget: int) -> str:
+        """Самые релевантные абзацы результата поиска в исходном порядке, не больше budget токенов"""
+        paragraphs = [part.strip() for part in _PARAGRAPH_SPLIT.split(context.strip()) if part.strip()]
+        total = sum(estimate_tokens(part) for part in paragraphs)
+        if total <= budget:
+            return "\n\n".join(paragraphs)
+        scores = BM25([normalization.term_list(part) for part in paragraphs]).scores(_query_weights(message, history))
+        # Абзац без совпадений с вопросом тоже годится в контекст - порог не применяем, порядок по релевантности
+        ranked = sorted(range(len(paragraphs)), key=lambda position: (-scores[position], position))
+        chosen, left = [], budget
+        for position in ranked:
+            tokens = estimate_tokens(paragraphs[position])
+            if tokens <= left:
+                chosen.append(position)
+                left -= tokens
+        if not chosen:
+            return _truncate(paragraphs[ranked[0]], budget)
+        return "\n\n".join(paragraphs[position] for position in sorted(chosen))
+
+    def assemble(
+        self,
+        message: str,
+        history: Optional[List[Dict]] = None,
+        context: Optional[str] = None,
+        note: Optional[str] = None,
+        context_title: str = "## Current Bali Information (from search):",
+    ) -> AssembledPrompt:
+        """Системный промпт: закреплённые разделы, подходящие к вопросу разделы, контекст поиска и note"""
+        left = self.budget - self.pinned_tokens
+        tail = []
+        if note:
+            tail.append(note)
+            left -= estimate_tokens(note)
+        if context:
+            context_budget = min(self.context_tokens, left - estimate_tokens(context_title))
+            if context_budget > 0:
+                selected_context = self._select_context(context, message, history, context_budget)
+                tail.append(f"{context_title}\n{selected_context}")
+                left -= estimate_tokens(tail[-1])
+
+        selected = set(self.select(message, history, left))
+        parts, sections, last_title = [], [], None
+        for position, chunk in enumerate(self.chunks):
+            if not chunk.pinned and position not in selected:
+                continue
+            if chunk.title != last_title:
+                if chunk.title:
+                    parts.append(chunk.title)
+                    if not chunk.pinned:
+                        sections.append(chunk.title[3:])
+                last_title = chunk.title
+            parts.append(chunk.body)
+        text = "\n\n".join(parts + tail)
+
+        tokens = estimate_tokens(text)
+        PROMPT_TOKENS.observe(tokens)
+        for section in sections:
+            PROMPT_SECTIONS.inc(section=section)
+        context_tokens = sum(estimate_tokens(part) for part in tail)
+        return AssembledPrompt(text, tokens, sections, context_tokens)
@@ -0,0 +1,148 @@
+"""
+Таблица расстояний от мест каталогов до свадебной площадки и до каждого отеля из hotels_db.
+
+  table_for(hotels_db, venue, catalogs)  - таблица точек отсчёта; пересобирается, когда перезагружен каталог отелей
+  table.find_anchor("нашим отелем")      - точка отсчёта: площадка или отель, названный в запросе
+  table.nearby(anchor, category)         - [(км, минуты, place, area)] по возрастанию расстояния
+
+Точки отсчёта известны без остальных каталогов, поэтому запрос сначала ищет точку и только потом грузит нужные
+категории. Соседства категории считаются один раз на снимок её каталога (GeoGrid), ответ на запрос - поиск в словаре.
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from rapidfuzz import fuzz, process
+
+import geo
+
+VENUE_KEY = "venue"
+
+# Соседи точки отсчёта: не дальше RADIUS_KM, не больше PER_CATEGORY на категорию
+RADIUS_KM = 20
+PER_CATEGORY = 10
+
+# Время в пути: дороги Бали извилистые (×1.4 к прямой), средняя скорость с пробками ~25 км/ч
+ROAD_FACTOR = 1.4
+AVERAGE_SPEED_KMH = 25
+
+# Площадку гости называют по-разному. "Наш отель" - это тоже она: гости свадьбы живут на площадке (глэмпинг),
+# своего отеля в анкете нет; отель из каталога, названный в вопросе, важнее
+_VENUE_PATTERN = re.compile(
+    r"свадьб|площадк|церемони|глэмпинг|глемпинг|glamping|venue|wedding|ceremony"
+    r"|наш\w*\s+(?:отел|гостиниц|жиль)|our\s+(?:hotel|place)"
+)
+# Нечёткое совпадение названия отеля (опечатки, без "Hotel"/"Resort"); короткие названия - только точно
+_MIN_FUZZY_NAME = 5
+_FUZZY_CUTOFF = 90
+
+Neighbour = Tuple[float, int, Dict, str]
+
+
+def travel_minutes(km: float) -> int:
+    """Оценка времени в пути на машине, минуты"""
+    return max(1, round(km * ROAD_FACTOR / AVERAGE_SPEED_KMH * 60))
+
+
+class Anchor:
+    """Точка отсчёта и её ближайшие места по категориям"""
+
+    def __init__(self, key: str, name: str, lat: float, lng: float, area: str = "", place: Optional[Dict] = None):
+        self.key = key
+        self.name = name
+        self.lat = lat
+        self.lng = lng
+        self.area = area
+        self.place = place  # запись отеля: сам себе не сосед
+        self.nearby: Dict[str, List[Neighbour]] = {}
+
+
+class DistanceTable:
+    """Площадка и все отели с координатами; соседи - по категориям, переданным в update"""
+
+    def __init__(self, hotels_db: Dict[str, List[Dict]], venue: Tuple[str, float, float]):
+        self.anchors: Dict[str, Anchor] = {}
+        self._hotel_names: Dict[str, str] = {}
+        self._grids: Dict[str, geo.GeoGrid] = {}  # снимки каталогов, по которым посчитаны соседи
+        self._lock = threading.Lock()
+
+        venue_name, venue_lat, venue_lng = venue
+        self.anchors[VENUE_KEY] = Anchor(VENUE_KEY, venue_name, venue_lat, venue_lng)
+
+        for area, hotels in hotels_db.items():
+            for hotel in hotels:
+                if hotel.get("lat") is None or hotel.get("lng") is None:
+                    continue
+                key = hotel["name"].lower()
+                self.anchors[key] = Anchor(key, hotel["name"], hotel["lat"], hotel["lng"], area, place=hotel)
+                for name in (hotel["name"], hotel.get("name_ru", "")):
+                    if name:
+                        self._hotel_names.setdefault(name.lower(), key)
+
+        # Длинные названия первыми: "Como Uma Canggu" раньше, чем "Como". Только целыми словами:
+        # отель "Uma" не должен находиться в "виллой в Umalas"
+        names_by_length = sorted(self._hotel_names, key=len, reverse=True)
+        self._name_pattern = re.compile(
+            r"(?<!\w)(?:" + "|".join(re.escape(name) for name in names_by_length) + r")(?!\w)"
+        ) if names_by_length else None
+        self._fuzzy_names = [name for name in names_by_length if len(name) >= _MIN_FUZZY_NAME]
+
+    def update(self, catalogs: Dict[str, geo.GeoGrid]):
+        """Соседи для категорий, которых ещё нет или чей каталог перезагружен (новый GeoGrid)"""
+        with self._lock:
+            # Под замком: параллельные запросы не посчитают одну и ту же категорию дважды
+            for category, grid in catalogs.items():
+                if self._grids.get(category) is grid:
+                    continue
+                for anchor in self.anchors.values():
+                    # +1 на случай, если среди соседей окажется сама точка отсчёта (отель в каталоге отелей)
+                    found = grid.nearest(anchor.lat, anchor.lng, k=PER_CATEGORY + 1, max_km=RADIUS_KM)
+                    anchor.nearby[category] = [
+                        (km, travel_minutes(km), place, area) for km, place, area in found if place is not anchor.place
+                    ][:PER_CATEGORY]
+                self._grids[category] = grid
+
+    def __len__(self) -> int:
+        return len(self.anchors)
+
+    def find_anchor(self, text: str) -> Optional[Anchor]:
+        """Точка отсчёта по тексту: отель из каталога по названию, иначе свадебная площадка"""
+        text_lower = text.lower()
+        match = self._name_pattern.search(text_lower) if self._name_pattern else None
+        if match:
+            return self.anchors[self._hotel_names[match.group()]]
+        if _VENUE_PATTERN.search(text_lower):
+            return self.anchors[VENUE_KEY]
+        match = process.extractOne(text_lower, self._fuzzy_names, scorer=fuzz.partial_ratio, score_cutoff=_FUZZY_CUTOFF)
+        if match:
+            return self.anchors[self._hotel_names[match[0]]]
+        return None
+
+    def nearby(self, anchor: Anchor, category: str, k: int = 3) -> List[Neighbour]:
+        return anchor.nearby.get(category, [])[:k]
+
+
+# (ключ, таблица, hotels_db): ссылку на каталог держим, чтобы его id не переиспользовался
+_TABLE_CACHE: Optional[Tuple[tuple, DistanceTable, Dict]] = None
+_TABLE_LOCK = threading.Lock()
+
+
+def table_for(
+    hotels_db: Dict[str, List[Dict]],
+    venue: Tuple[str, float, float],
+    catalogs: Optional[Dict[str, geo.GeoGrid]] = None,
+) -> DistanceTable:
+    """
+    Таблица точек отсчёта с соседями по catalogs. Перезагрузка каталога создаёт новый hotels_db и новый GeoGrid,
+    поэтому таблица пересобирается по идентичности hotels_db, а соседи категории - по идентичности её GeoGrid.
+    """
+    global _TABLE_CACHE
+    key = (id(hotels_db), venue)
+    with _TABLE_LOCK:
+        if _TABLE_CACHE is None or _TABLE_CACHE[0] != key:
+            _TABLE_CACHE = (key, DistanceTable(hotels_db, venue), hotels_db)
+        table = _TABLE_CACHE[1]
+    if catalogs:
+        table.update(catalogs)
+    return table
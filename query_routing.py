@@ -0,0 +1,187 @@
+"""
+Роутинг запросов гостей: определение темы, категории и локации по тексту.
+Чистые функции без обращения к внешним API - их можно дёшево вызывать и бенчмаркать.
+"""
+
+import re
+
+import gazetteer
+import normalization
+import tracing
+
+# Вопрос о самой свадьбе (программа, ужин, церемония) - не поиск по Бали и не каталог
+WEDDING_KEYWORDS = ['свадьб', 'wedding', 'церемони', 'ceremony', 'праздник', 'celebration']
+
+
+def _is_about_wedding(question_lower: str) -> bool:
+    return any(kw in question_lower for kw in WEDDING_KEYWORDS)
+
+# ── Helper: Проверка нужен ли поиск через Perplexity ─────────────────────────
+@tracing.traced("route.needs_perplexity_search")
+def needs_perplexity_search(question: str) -> bool:
+    """Определяет, нужен ли актуальный поиск через Perplexity"""
+
+    question_lower = question.lower()
+
+    # Если вопрос о свадьбе - не ищем через Perplexity
+    if _is_about_wedding(question_lower):
+        return False
+
+    # Ключевые слова для поиска актуальной информации о Бали
+    search_keywords = [
+        'погода', 'weather', 'температура', 'temperature',
+        'ресторан', 'restaurant', 'кафе', 'cafe', 'еда', 'food',
+        'посетить', 'visit', 'достопримечательност', 'attractions',
+        'что посмотреть', 'what to see', 'what to do',
+        'отель', 'hotel', 'где остановиться', 'where to stay', 'accommodation',
+        'цены', 'prices', 'стоимость', 'cost', 'сколько стоит', 'how much',
+        'такси', 'taxi', 'транспорт', 'transport', 'transfer',
+        'экскурси', 'excursion', 'тур', 'tour',
+        'убуд', 'ubud', 'чангу', 'canggu', 'улувату', 'uluwatu',
+        'пляж', 'beach', 'spa', 'спа', 'йога', 'yoga'
+    ]
+
+    return any(keyword in question_lower for keyword in search_keywords)
+
+# ── Helper: Определить тему запроса ──────────────────────────────────────────
+def get_search_topic(query: str) -> str:
+    """Определяет тему запроса для адаптивного сообщения"""
+    query_lower = query.lower()
+
+    # Рестораны и еда
+    if any(kw in query_lower for kw in ['ресторан', 'restaurant', 'кафе', 'cafe', 'еда', 'food', 'поесть', 'поужинать', 'пообедать']):
+        return "о ресторанах"
+
+    # Отели
+    if any(kw in query_lower for kw in ['отель', 'hotel', 'где остановиться', 'accommodation', 'жильё']):
+        return "об отелях"
+
+    # Достопримечательности
+    if any(kw in query_lower for kw in ['посетить', 'visit', 'посмотреть', 'see', 'достопримечательност', 'attractions']):
+        return "о местах"
+
+    # Пляжи
+    if any(kw in query_lower for kw in ['пляж', 'beach', 'побережье']):
+        return "о пляжах"
+
+    # Погода
+    if any(kw in query_lower for kw in ['погода', 'weather', 'температура', 'temperature']):
+        return "о погоде"
+
+    # Цены
+    if any(kw in query_lower for kw in ['цены', 'prices', 'стоимость', 'cost', 'сколько стоит']):
+        return "о ценах"
+
+    # SPA и йога
+    if any(kw in query_lower for kw in ['spa', 'спа', 'йога', 'yoga', 'массаж', 'massage']):
+        return "о SPA и йоге"
+
+    # По умолчанию
+    return "актуальную информацию"
+
+# ── Helper: Совпадение по нормализованным терминам ───────────────────────────
+# Формы слов, которые не ловятся подстроками ("йоге", "гостиница", "итальянскую кухню", "brunches").
+# Без dinner/lunch/eat: "ужин", "обед" и "поесть" бывают и про свадьбу ("Во сколько ужин на свадьбе?")
+RESTAURANT_TERMS = normalization.terms(
+    "restaurant brunch sushi pizza steak burger seafood "
+    "italian japanese mexican french indian chinese korean georgian mediterranean asian"
+)
+YOGA_TERMS = normalization.terms("yoga pilates")
+HOTEL_TERMS = normalization.terms("hotel villa resort")
+
+
+def _has_terms(query: str, terms: frozenset) -> bool:
+    return not normalization.normalize_query(query).terms.isdisjoint(terms)
+
+# ── Helper: Определение запроса о ресторанах ──────────────────────────────────
+@tracing.traced("route.is_restaurant_query")
+def is_restaurant_query(query: str) -> bool:
+    """
+    Определяет, является ли запрос о ресторанах; вопросы о программе свадьбы - не о ресторанах:
+
+    >>> is_restaurant_query("Во сколько ужин на свадьбе?")
+    False
+    >>> is_restaurant_query("Будет ли обед после церемонии?")
+    False
+    >>> is_restaurant_query("What time is dinner at the wedding?")
+    False
+    >>> is_restaurant_query("итальянскую кухню в Чангу")
+    True
+    """
+    query_lower = query.lower()
+    restaurant_keywords = [
+        'ресторан', 'restaurant', 'кафе', 'cafe', 'еда', 'food',
+        'поесть', 'поужинать', 'пообедать', 'где поужинать', 'где поесть',
+        'fine dining', 'файн дайнинг', 'michelin', 'мишлен'
+    ]
+    if any(kw in query_lower for kw in restaurant_keywords):
+        return True
+    # Нормализованные термины - только для вопросов не о свадьбе
+    return not _is_about_wedding(query_lower) and _has_terms(query, RESTAURANT_TERMS)
+
+# ── Helper: Проверка запросов о йоге/фитнесе ──────────────────────────────────
+@tracing.traced("route.is_yoga_query")
+def is_yoga_query(query: str) -> bool:
+    """Определяет, является ли запрос о йоге/фитнесе"""
+    query_lower = query.lower()
+    yoga_keywords = [
+        'йога', 'yoga', 'фитнес', 'fitness', 'спортзал', 'gym',
+        'pilates', 'пилатес', 'студия', 'studio', 'тренировка', 'workout',
+        'йога студи', 'yoga studi', 'йогу', 'фитнесу', 'тренажерк'
+    ]
+    return any(kw in query_lower for kw in yoga_keywords) or _has_terms(query, YOGA_TERMS)
+
+# ── Helper: Проверка запросов об отелях ───────────────────────────────────────
+@tracing.traced("route.is_hotel_query")
+def is_hotel_query(query: str) -> bool:
+    """Определяет, является ли запрос об отелях"""
+    query_lower = query.lower()
+    hotel_keywords = [
+        'отель', 'hotel', 'отел', 'отдел', 'отедел', 'где остановиться', 'where to stay',
+        'accommodation', 'жильё', 'жилье', 'villa', 'вилла', 'resort', 'курорт',
+        'guesthouse', 'бутик отель', 'boutique', 'проживан', 'размещен'
+    ]
+    return any(kw in query_lower for kw in hotel_keywords) or _has_terms(query, HOTEL_TERMS)
+
+# ── Helper: Извлечение локации из запроса ──────────────────────────────────────
+@tracing.traced("route.extract_location")
+def extract_location(query: str) -> str | None:
+    """Извлекает район из запроса пользователя (канонический, как ключи каталогов)"""
+    return gazetteer.find_area(query)
+
+# ── Helper: Запросы "что рядом с ..." ─────────────────────────────────────────
+# Слова категорий каталога: по ним понимаем, ЧТО ищут рядом ("ужин рядом с отелем" -> restaurants)
+PLACE_CATEGORY_KEYWORDS = {
+    "restaurants": ['ресторан', 'restaurant', 'поесть', 'поужин', 'пообед', 'ужин', 'обед', 'dinner', 'lunch', 'еда', 'food', 'dining'],
+    "breakfast": ['завтрак', 'breakfast', 'бранч', 'brunch', 'кафе', 'cafe', 'кофе', 'coffee'],
+    "yoga": ['йог', 'yoga', 'фитнес', 'fitness', 'пилатес', 'pilates', 'спортзал', 'gym'],
+    "spa": ['спа', 'spa', 'массаж', 'massage'],
+    "shopping": ['шопинг', 'шоппинг', 'shopping', 'магазин', 'shop', 'сувенир', 'souvenir'],
+    "art": ['галере', 'gallery', 'арт', 'art', 'музе', 'museum'],
+    "hotels": ['отел', 'hotel', 'вилл', 'villa', 'жиль', 'остановиться', 'stay'],
+}
+
+_PROXIMITY_MARKER = re.compile(
+    r"\b(?:рядом\s+со?|недалеко\s+от|неподал[её]ку\s+от|поблизости\s+от|близко\s+к|около|возле"
+    r"|near|nearby|close\s+to|next\s+to|walking\s+distance\s+from)\b"
+)
+
+
+def detect_categories(text: str) -> list[str]:
+    """Категории каталога, упомянутые в тексте (в порядке PLACE_CATEGORY_KEYWORDS)"""
+    text_lower = text.lower()
+    return [category for category, keywords in PLACE_CATEGORY_KEYWORDS.items() if any(kw in text_lower for kw in keywords)]
+
+
+@tracing.traced("route.parse_proximity_query")
+def parse_proximity_query(query: str) -> tuple[list[str], str] | None:
+    """
+    "ужин рядом с нашим отелем" -> (["restaurants"], "нашим отелем").
+    Категории ищем до слова "рядом" (после него - точка отсчёта, там "отель" - не категория);
+    пустой список - все категории. None - запрос не про "рядом с".
+    """
+    query_lower = query.lower()
+    marker = _PROXIMITY_MARKER.search(query_lower)
+    if marker is None:
+        return None
+    return detect_categories(query_lower[:marker.start()]), query_lower[marker.end():].strip()
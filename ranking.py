@@ -0,0 +1,103 @@
+"""
+Ранжирование мест каталогов (отели, йога, спа, завтраки, шоппинг, арт) по данным из Airtable.
+
+Составной балл считается один раз при загрузке каталога:
+  prestige_tier  - уровень места (A/B/C, 1/2/3, S/Top/Premium...)
+  rating         - рейтинг 0-5
+  rating_stars   - звёзды "★★★★" или число
+Списки районов сортируются по баллу на месте, плюс общий список всех районов -
+поиск отдаёт лучшие места первыми без сортировки на каждый запрос.
+"""
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+TIER_WEIGHT = 0.5
+RATING_WEIGHT = 0.3
+STARS_WEIGHT = 0.2
+# Нет данных - середина шкалы: место без рейтинга не топим ниже места с плохим рейтингом
+NEUTRAL = 0.5
+
+# Уровни престижа: буквы (S лучше A), цифры (1 лучше 3), слова
+_TIER_LETTERS = {"s": 1.0, "a": 0.85, "b": 0.6, "c": 0.35, "d": 0.15}
+_TIER_WORDS = {"top": 1.0, "premium": 1.0, "luxury": 1.0, "high": 0.85, "mid": 0.6, "medium": 0.6, "standard": 0.6, "budget": 0.35, "low": 0.35}
+_TIER_NUMBER = re.compile(r"\d+")
+_STAR_CHARS = ("★", "⭐")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def tier_value(tier) -> Optional[float]:
+    """prestige_tier -> 0..1 (1 - высший уровень); None, если не распознан"""
+    text = str(tier or "").strip().lower()
+    if not text:
+        return None
+    for word in re.findall(r"[a-z]+", text):
+        if word in _TIER_WORDS:
+            return _TIER_WORDS[word]
+        if word.startswith("tier"):
+            continue
+        if len(word) == 1 and word in _TIER_LETTERS:
+            return _TIER_LETTERS[word]
+    number = _TIER_NUMBER.search(text)
+    if number:
+        # Tier 1 - лучший, каждый следующий уровень на четверть ниже
+        return max(0.0, 1.0 - (int(number.group()) - 1) * 0.25)
+    return None
+
+
+def rating_value(rating) -> Optional[float]:
+    """rating ("4.7", 4.7, "4,7/5") -> 0..1"""
+    if rating in (None, ""):
+        return None
+    if isinstance(rating, (int, float)):
+        value = float(rating)
+    else:
+        match = _NUMBER.search(str(rating))
+        if not match:
+            return None
+        value = float(match.group().replace(",", "."))
+    return min(max(value / 5.0, 0.0), 1.0)
+
+
+def stars_value(stars) -> Optional[float]:
+    """rating_stars ("★★★★", "4", 4) -> 0..1"""
+    if stars in (None, ""):
+        return None
+    text = str(stars)
+    count = sum(text.count(char) for char in _STAR_CHARS)
+    if count:
+        return min(count / 5.0, 1.0)
+    return rating_value(text)
+
+
+def composite_score(place: Dict) -> float:
+    """Составной балл места 0..100"""
+    tier = tier_value(place.get("prestige_tier"))
+    rating = rating_value(place.get("rating"))
+    stars = stars_value(place.get("rating_stars"))
+    # Рейтинг и звёзды - одно и то же в разной записи: если есть только одно, оно заменяет другое
+    if rating is None:
+        rating = stars
+    if stars is None:
+        stars = rating
+    score = (
+        TIER_WEIGHT * (NEUTRAL if tier is None else tier)
+        + RATING_WEIGHT * (NEUTRAL if rating is None else rating)
+        + STARS_WEIGHT * (NEUTRAL if stars is None else stars)
+    )
+    return round(score * 100, 2)
+
+
+def rank_catalog(db: Dict[str, List[Dict]]) -> List[Tuple[str, Dict]]:
+    """
+    Проставляет place["rank_score"], сортирует список каждого района по убыванию балла
+    (при равенстве - порядок Airtable) и возвращает общий список [(area, place)] всех районов.
+    """
+    ranked = []
+    for area, places in db.items():
+        for place in places:
+            place["rank_score"] = composite_score(place)
+        places.sort(key=lambda place: -place["rank_score"])
+        ranked.extend((area, place) for place in places)
+    ranked.sort(key=lambda item: -item[1]["rank_score"])
+    return ranked
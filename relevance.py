@@ -0,0 +1,203 @@
+"""
+Пакетный скоринг релевантности ресторанов: запрос оценивается против всех мест района за один вызов.
+
+  - ключевые слова и теги: разреженная матрица место × слово (CSR), совпадения считаются одним bincount
+  - нечёткое совпадение названия, кухни и типа: rapidfuzz.process.cdist по уникальным строкам
+  - спецтермины (michelin, romantic, view...): булевы векторы, посчитанные при построении индекса
+  - top-k: np.partition по k-му значению вместо полной сортировки каталога
+  - ключевые слова сравниваются и как подстроки, и как нормализованные термины (normalization):
+    "итальянскую" находит italian, "brunches" - brunch; названия - ещё и по транслитерации запроса
+
+Релевантность места (0..MAX_SCORE):
+  partial_ratio(запрос, название) * NAME_WEIGHT (по транслитерации кириллического запроса - лучшее из двух)
+  + partial_ratio(запрос, кухня) * CUISINE_WEIGHT + partial_ratio(запрос, тип) * TYPE_WEIGHT
+  + KEYWORD_BONUS за каждое ключевое слово места, найденное в запросе (подстрокой или всеми терминами)
+  + SPECIAL_TERM_BONUS за каждую категорию SPECIAL_TERMS, которая есть и в запросе, и в highlights/distinction/keywords
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+import normalization
+
+# Спецтермины: если в запросе есть слово категории и оно же есть у места - бонус
+SPECIAL_TERMS = {
+    "michelin": ["michelin", "starred", "star"],
+    "fine dining": ["fine dining", "tasting menu", "degustation"],
+    "romantic": ["romantic", "date", "anniversary"],
+    "view": ["view", "ocean", "sunset", "cliff"],
+    "новый": ["new", "2024", "2025", "opening"],
+    "дешевый": ["cheap", "budget", "affordable"],
+    "дорогой": ["expensive", "luxury", "premium"]
+}
+
+# Одна регулярка на категорию: при построении индекса - один поиск вместо проверки каждого термина
+_SPECIAL_PATTERNS = [re.compile("|".join(map(re.escape, terms))) for terms in SPECIAL_TERMS.values()]
+
+NAME_WEIGHT = 0.4
+CUISINE_WEIGHT = 0.2
+TYPE_WEIGHT = 0.2
+KEYWORD_BONUS = 20
+SPECIAL_TERM_BONUS = 15
+MAX_SCORE = 100
+
+
+def _dedupe(values: List[str]) -> Tuple[List[str], np.ndarray]:
+    """Уникальные строки и индекс каждой исходной строки в них (кухонь и типов в каталоге единицы)"""
+    positions: Dict[str, int] = {}
+    inverse = np.fromiter((positions.setdefault(v, len(positions)) for v in values), dtype=np.intp, count=len(values))
+    return list(positions), inverse
+
+
+class RelevanceIndex:
+    """Индекс списка ресторанов одного района; строки - в порядке списка"""
+
+    def __init__(self, restaurants: List[Dict]):
+        self.items: List[Dict] = list(restaurants)
+        self.size = len(self.items)
+
+        names, cuisines, types = [], [], []
+        vocabulary: Dict[str, int] = {}
+        keyword_rows, keyword_cols = [], []
+        special = [[] for _ in SPECIAL_TERMS]
+
+        for row, restaurant in enumerate(self.items):
+            names.append(restaurant["name"].lower())
+            cuisines.append(restaurant.get("cuisine", "").lower())
+            types.append(restaurant.get("type", "").lower())
+
+            for keyword in restaurant.get("keywords", []):
+                keyword_rows.append(row)
+                keyword_cols.append(vocabulary.setdefault(keyword, len(vocabulary)))
+
+            # Поля склеены через перевод строки - в терминах его нет, так что совпадение не «перешагнёт» поле
+            searchable = "\n".join((
+                str(restaurant.get("highlights", "")),
+                str(restaurant.get("distinction", "")),
+                str(restaurant.get("keywords", "")),
+            )).lower()
+            for flags, pattern in zip(special, _SPECIAL_PATTERNS):
+                flags.append(pattern.search(searchable) is not None)
+
+        self._names = _dedupe(names)
+        self._cuisines = _dedupe(cuisines)
+        self._types = _dedupe(types)
+        self._vocabulary = list(vocabulary)
+        # Термины ключевых слов считаются один раз на индекс (т.е. на загрузку каталога)
+        self._vocabulary_terms = [normalization.terms(keyword) for keyword in self._vocabulary]
+        self._keyword_rows = np.array(keyword_rows, dtype=np.intp)
+        self._keyword_cols = np.array(keyword_cols, dtype=np.intp)
+        self._special = np.array(special, dtype=bool).reshape(len(SPECIAL_TERMS), self.size)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @staticmethod
+    def _fuzzy(query: str, field: Tuple[List[str], np.ndarray]) -> np.ndarray:
+        unique, inverse = field
+        if not unique:
+            return np.zeros(len(inverse))
+        return process.cdist([query], unique, scorer=fuzz.partial_ratio, dtype=np.float64)[0][inverse]
+
+    def scores(self, query: str) -> np.ndarray:
+        """Релевантность запроса для каждой строки индекса (0-100)"""
+        normalized = normalization.normalize_query(query)
+        query = normalized.text
+        if not self.size:
+            return np.zeros(0)
+
+        names = self._fuzzy(query, self._names)
+        if normalized.latin != query:
+            # Кириллица в запросе: "Локавор" сравниваем с "Locavore" ещё и в транслитерации
+            names = np.maximum(names, self._fuzzy(normalized.latin, self._names))
+
+        score = (
+            names * NAME_WEIGHT
+            + self._fuzzy(query, self._cuisines) * CUISINE_WEIGHT
+            + self._fuzzy(query, self._types) * TYPE_WEIGHT
+        )
+
+        # Ключевые слова: проверяем словарь один раз, а не ключевые слова каждого места
+        if self._vocabulary:
+            in_query = np.fromiter(
+                (keyword in query or bool(terms) and terms <= normalized.terms
+                 for keyword, terms in zip(self._vocabulary, self._vocabulary_terms)),
+                dtype=bool, count=len(self._vocabulary)
+            )
+            score += KEYWORD_BONUS * np.bincount(self._keyword_rows, weights=in_query[self._keyword_cols], minlength=self.size)
+
+        for flags, terms in zip(self._special, SPECIAL_TERMS.values()):
+            if any(term in query or term in normalized.terms for term in terms):
+                score += SPECIAL_TERM_BONUS * flags
+
+        return np.minimum(score, MAX_SCORE)
+
+
+def top_k(scores: np.ndarray, rows: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """Строки по убыванию релевантности (при равенстве - в исходном порядке); не больше k"""
+    if k is not None and k < len(rows):
+        if k <= 0:
+            return rows[:0]
+        # Берём всё, что не хуже k-го значения: при равенстве на границе порядок тот же, что у полной сортировки
+        kth = np.partition(-scores[rows], k - 1)[k - 1]
+        rows = rows[-scores[rows] <= kth]
+    ordered = rows[np.lexsort((rows, -scores[rows]))]
+    return ordered if k is None else ordered[:k]
+
+
+_INDEX_CACHE: "OrderedDict[int, Tuple[List[Dict], RelevanceIndex]]" = OrderedDict()
+_INDEX_CACHE_SIZE = 64  # районы × (загруженная база + последняя перезагрузка)
+_INDEX_LOCK = threading.Lock()
+
+
+def index_for(restaurants: List[Dict]) -> RelevanceIndex:
+    """Индекс для списка ресторанов района; строится один раз на объект списка (после загрузки он не меняется)"""
+    key = id(restaurants)
+    with _INDEX_LOCK:
+        cached = _INDEX_CACHE.get(key)
+        if cached is not None and cached[0] is restaurants:
+            _INDEX_CACHE.move_to_end(key)
+            return cached[1]
+
+    index = RelevanceIndex(restaurants)
+    with _INDEX_LOCK:
+        # Храним ссылку на сам список, чтобы id не переиспользовался, пока запись в кэше
+        _INDEX_CACHE[key] = (restaurants, index)
+        _INDEX_CACHE.move_to_end(key)
+        while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def rank(
+    db: Dict[str, List[Dict]],
+    query: str,
+    locations: Iterable[str],
+    min_score: Optional[float] = None,
+    limit: Optional[int] = None
+) -> List[Tuple[Dict, str, float]]:
+    """
+    Ранжирует рестораны выбранных районов: [(restaurant, location, score)] по убыванию score,
+    при равенстве - в порядке обхода базы. min_score - строгий порог, limit - топ-N.
+    """
+    items: List[Dict] = []
+    item_locations: List[str] = []
+    parts = []
+    for loc in locations:
+        if loc not in db:
+            continue
+        index = index_for(db[loc])
+        items.extend(index.items)
+        item_locations.extend([loc] * len(index))
+        parts.append(index.scores(query))
+
+    if not parts:
+        return []
+    scores = np.concatenate(parts)
+    rows = np.arange(len(scores)) if min_score is None else np.flatnonzero(scores > min_score)
+    return [(items[row], item_locations[row], float(scores[row])) for row in top_k(scores, rows, limit)]
@@ -0,0 +1,220 @@
+"""
+Планировщик фоновых задач обслуживания: перезагрузка каталогов, продление вебхуков, повтор записи гостей,
+экспорт трейсов, очистка истории и лимитов. Работает в процессе бота, на его event loop.
+
+  SCHEDULER.every("trace_export", 5, TRACER.flush)                 - раз в N секунд
+  SCHEDULER.cron("quota_reset", "0 0 * * *", reset_quotas)         - по расписанию cron (местное время)
+  SCHEDULER.start() / await SCHEDULER.stop()
+
+- jitter: к каждому сроку добавляется случайная задержка 0..jitter секунд, чтобы задачи не совпадали.
+- Перекрытий нет: пока запуск идёт, следующий не начнётся; пропущенные интервальные слоты
+  не догоняются, а считаются в weddy_job_runs_total{status="skipped"}.
+- stop() даёт идущим запускам закончиться (до timeout), ждущие задачи отменяет сразу.
+
+Метрики: weddy_job_runs_total{job,status}, weddy_job_duration_seconds{job},
+weddy_job_last_success_timestamp_seconds{job}.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_RUNS = metrics.REGISTRY.counter(
+    "weddy_job_runs_total",
+    "Запуски фоновых задач по статусу (ok, error, skipped)",
+    ("job", "status")
+)
+JOB_DURATION = metrics.REGISTRY.histogram(
+    "weddy_job_duration_seconds",
+    "Длительность запуска фоновой задачи",
+    ("job",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+JOB_LAST_SUCCESS = metrics.REGISTRY.gauge(
+    "weddy_job_last_success_timestamp_seconds",
+    "Время последнего успешного запуска фоновой задачи (unix time)",
+    ("job",)
+)
+
+
+# ── Cron ──────────────────────────────────────────────────────────────────────
+# minute hour day-of-month month day-of-week (0 и 7 - воскресенье)
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _parse_cron_field(text: str, low: int, high: int) -> Set[int]:
+    values = set()
+    for part in text.split(","):
+        part, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step_text else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Неверное поле cron: '{text}'")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Выражение cron из 5 полей: списки, диапазоны и шаги ("*/15 9-18 * * 1-5")"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Ожидается 5 полей cron: '{expression}'")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(text, low, high) for text, (low, high) in zip(fields, _CRON_FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        # Как в cron: если заданы и день месяца, и день недели - подходит любой из них
+        self._any_day = fields[2] == "*" or fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_month = moment.day in self.days
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays
+        return in_month and in_week if self._any_day else in_month or in_week
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайшая подходящая минута строго после moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Расписание cron никогда не срабатывает: '{self.expression}'")
+
+
+# ── Планировщик ───────────────────────────────────────────────────────────────
+class Job:
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval: Optional[float] = None,
+                 cron: Optional[CronSchedule] = None, jitter: float = 0.0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = cron
+        self.jitter = jitter
+        self.running = False
+        self._next_slot: Optional[float] = None
+
+    def delay(self) -> float:
+        """Секунды до следующего запуска (с jitter)"""
+        if self.cron is not None:
+            now = datetime.now()
+            delay = (self.cron.next_after(now) - now).total_seconds()
+        else:
+            now = time.monotonic()
+            if self._next_slot is None:
+                self._next_slot = now + self.interval
+            elif self._next_slot <= now:
+                # Запуск шёл дольше интервала - пропущенные слоты не догоняем
+                missed = int((now - self._next_slot) // self.interval) + 1
+                JOB_RUNS.inc(missed, job=self.name, status="skipped")
+                self._next_slot += missed * self.interval
+            delay = self._next_slot - now
+            self._next_slot += self.interval
+        return delay + random.uniform(0, self.jitter)
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._started = False
+        self._stopping = False
+
+    def every(self, name: str, seconds: float, func: Callable[[], Awaitable], jitter: float = 0.0) -> Job:
+        if seconds <= 0:
+            raise ValueError(f"Интервал задачи {name} должен быть положительным")
+        return self._add(Job(name, func, interval=seconds, jitter=jitter))
+
+    def cron(self, name: str, expression: str, func: Callable[[], Awaitable], jitter: float = 0.0) -> Job:
+        return self._add(Job(name, func, cron=CronSchedule(expression), jitter=jitter))
+
+    def _add(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError(f"Задача {job.name} уже запланирована")
+        self.jobs[job.name] = job
+        # Задача, добавленная после старта, запускается сразу
+        if self._started:
+            self._start_job(job)
+        return job
+
+    def _start_job(self, job: Job):
+        self._tasks[job.name] = asyncio.create_task(self._loop(job), name=f"job:{job.name}")
+
+    def start(self):
+        self._started = True
+        self._stopping = False
+        for job in self.jobs.values():
+            self._start_job(job)
+        logger.info(f"⏰ Scheduler started: {', '.join(self.jobs) or 'no jobs'}")
+
+    async def _loop(self, job: Job):
+        while not self._stopping:
+            await asyncio.sleep(job.delay())
+            await self.run_job(job.name)
+
+    async def run_job(self, name: str) -> bool:
+        """Запуск задачи вне расписания или по нему; False - задача уже выполняется"""
+        job = self.jobs[name]
+        if job.running:
+            JOB_RUNS.inc(job=name, status="skipped")
+            return False
+        job.running = True
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            await job.func()
+            JOB_LAST_SUCCESS.set(time.time(), job=name)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status = "error"
+            logger.error(f"❌ Job {name} failed: {e}")
+        finally:
+            job.running = False
+            JOB_RUNS.inc(job=name, status=status)
+            JOB_DURATION.observe(time.perf_counter() - start, job=name)
+        return True
+
+    async def stop(self, timeout: float = 10.0):
+        """Ждущие задачи отменяются сразу, идущие запуски - после timeout секунд"""
+        self._started = False
+        self._stopping = True
+        tasks: List[asyncio.Task] = list(self._tasks.values())
+        busy = [self._tasks[name] for name, job in self.jobs.items() if job.running and name in self._tasks]
+        for task in tasks:
+            if task not in busy:
+                task.cancel()
+        if busy:
+            _, pending = await asyncio.wait(busy, timeout=timeout)
+            for task in pending:
+                logger.warning(f"⚠️ {task.get_name()} did not finish in {timeout:.0f} s, cancelling")
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+SCHEDULER = Scheduler()
@@ -3,69 +3,86 @@ Smart Art Search для Бали
 Поиск арт-галерей в Airtable
 """
 
-from pyairtable import Api
 import logging
+import gazetteer
+import geo
+import place_filters
+import ranking
+import airtable_client
+import catalog_reload
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Поля места для фильтров запроса (place_filters): тип, стиль, атмосфера
+FILTER_FIELDS = {
+    "type": ("category", "category_ru"),
+    "style": ("specialty_ru",),
+    "vibe": ("vibe_ru",),
+}
 
-class SmartArtBot:
-    def __init__(self, airtable_token: str, airtable_base_id: str, art_table_name: str):
-        """Инициализация бота для поиска арт-галерей"""
-        self.airtable_api = Api(airtable_token)
-        self.art_table = self.airtable_api.table(airtable_base_id, art_table_name)
-        self.art_db = {}
-        self._load_art_from_airtable()
-    def _normalize_area(self, area: str) -> str:
-        """Нормализует название района к стандартному виду"""
-        area_lower = area.lower()
-        if any(x in area_lower for x in ['canggu', 'berawa', 'pererenan']):
-            return 'canggu'
-        elif any(x in area_lower for x in ['uluwatu', 'bingin']):
-            return 'uluwatu'
-        elif any(x in area_lower for x in ['seminyak', 'kerobokan']):
-            return 'seminyak'
-        elif 'ubud' in area_lower:
-            return 'ubud'
-        else:
-            return area_lower
-
-
-    def _load_art_from_airtable(self):
-        """Загружает арт-галереи из Airtable"""
-        try:
-            records = self.art_table.all()
-            db = {}
-
-            for record in records:
-                fields = record['fields']
-
-                area_raw = fields.get('area', 'unknown')
-                area = self._normalize_area(area_raw)
-                if area not in db:
-                    db[area] = []
-
-                art = {
-                    "name": fields.get('art_name_en', 'Unknown'),
-                    "name_ru": fields.get('art_name_ru', ''),
-                    "category": fields.get('category_en', ''),
-                    "category_ru": fields.get('category_ru', ''),
-                    "specialty_ru": fields.get('specialty_ru', ''),
-                    "vibe_ru": fields.get('vibe_short_ru', ''),
-                    "price_level": fields.get('price_level', ''),
-                    "instagram_link": fields.get('instagram_link', ''),
-                    "phone": fields.get('phone', '')
-                }
 
-                db[area].append(art)
+class SmartArtBot(catalog_reload.ReloadableCatalog):
+    CATALOG_ATTR = "art_db"
+    CATALOG_NAME = "art places"
+    CATALOG_TABLE = "art_table"
 
-            self.art_db = db
-            logger.info(f"✅ Loaded {sum(len(art) for art in db.values())} art places from Airtable")
+    def __init__(self, airtable_token: str, airtable_base_id: str, art_table_name: str, airtable_endpoint_url: str = "https://api.airtable.com"):
+        """Инициализация бота для поиска арт-галерей"""
+        self.airtable_api = airtable_client.shared_api(airtable_token, airtable_endpoint_url)
+        self.art_table = self.airtable_api.table(airtable_base_id, art_table_name)
+        self.load_catalog()
+
+    def catalog_from_records(self, records: list) -> dict:
+        """Каталог (арт-галереи) и индексы из записей Airtable"""
+        db = {}
+
+        for record in records:
+            fields = record['fields']
+
+            area_raw = fields.get('area', 'unknown')
+            area = gazetteer.normalize_area(area_raw)
+            if area not in db:
+                db[area] = []
+
+            art = {
+                "name": fields.get('art_name_en', 'Unknown'),
+                "name_ru": fields.get('art_name_ru', ''),
+                "category": fields.get('category_en', ''),
+                "category_ru": fields.get('category_ru', ''),
+                "specialty_ru": fields.get('specialty_ru', ''),
+                "vibe_ru": fields.get('vibe_short_ru', ''),
+                "price_level": fields.get('price_level', ''),
+                "instagram_link": fields.get('instagram_link', ''),
+                "phone": fields.get('phone', ''),
+                "prestige_tier": fields.get('prestige_tier', ''),
+                "rating": fields.get('rating', ''),
+                "rating_stars": fields.get('rating_stars', '')
+            }
+
+            # Координаты для поиска ближайших мест (None, если в записи их нет)
+            art["lat"], art["lng"] = geo.coordinates_from_fields(fields) or (None, None)
+
+            db[area].append(art)
+
+        ranked_places = ranking.rank_catalog(db)
+        logger.info(f"✅ Loaded {sum(len(art) for art in db.values())} art places from Airtable")
+        return {
+            "art_db": db,
+            "ranked_places": ranked_places,  # [(area, place)] всех районов по убыванию rank_score
+            "filter_index": place_filters.FilterIndex(ranked_places, FILTER_FIELDS),
+            "geo_index": geo.GeoGrid.from_catalog(db),
+        }
 
-        except Exception as e:
-            logger.error(f"❌ Error loading art places from Airtable: {e}")
-            self.art_db = {}
+    def empty_catalog(self) -> dict:
+        return {
+            "art_db": {},
+            "ranked_places": [],
+            "filter_index": place_filters.FilterIndex([], FILTER_FIELDS),
+            "geo_index": geo.GeoGrid(),
+        }
 
+    @tracing.traced("art.search")
     async def search_art(self, query: str, location: str = None) -> dict:
         """
         Поиск арт-галерей в Airtable
@@ -77,26 +94,17 @@ class SmartArtBot:
         Returns:
             dict с результатами поиска
         """
-        results = []
-
-        # Если указана локация, ищем только там
-        if location:
-            art = self.art_db.get(location, [])
-            for item in art:
-                results.append({
-                    "art": item,
-                    "location": location.capitalize(),
-                    "relevance_score": 1.0
-                })
-        else:
-            # Ищем во всех локациях
-            for loc, art in self.art_db.items():
-                for item in art:
-                    results.append({
-                        "art": item,
-                        "location": loc.capitalize(),
-                        "relevance_score": 1.0
-                    })
+        # Цена, тип, стиль и атмосфера из запроса - по битовым индексам; порядок - по рейтингу (ranking.rank_catalog)
+        ranked = self.filter_index.search(query, location)
+
+        results = [
+            {
+                "art": item,
+                "location": loc.capitalize(),
+                "relevance_score": round(item.get("rank_score", 0) / 100, 4)
+            }
+            for loc, item in ranked
+        ]
 
         # Форматируем результаты
         return {
@@ -3,71 +3,87 @@ Smart Breakfast/Lunch Search для Бали
 Поиск кафе для завтраков и ланчей в Airtable
 """
 
-from pyairtable import Api
 import logging
+import gazetteer
+import geo
+import place_filters
+import ranking
+import airtable_client
+import catalog_reload
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Поля места для фильтров запроса (place_filters): тип, стиль, атмосфера
+FILTER_FIELDS = {
+    "type": ("category", "category_ru"),
+    "style": ("cuisine_ru",),
+    "vibe": ("vibe_ru",),
+}
 
-class SmartBreakfastBot:
-    def __init__(self, airtable_token: str, airtable_base_id: str, breakfast_table_name: str):
-        """Инициализация бота для поиска кафе для завтраков"""
-        self.airtable_api = Api(airtable_token)
-        self.breakfast_table = self.airtable_api.table(airtable_base_id, breakfast_table_name)
-        self.cafes_db = {}
-        self._load_cafes_from_airtable()
-    def _normalize_area(self, area: str) -> str:
-        """Нормализует название района к стандартному виду"""
-        area_lower = area.lower()
-        if any(x in area_lower for x in ['canggu', 'berawa', 'pererenan']):
-            return 'canggu'
-        elif any(x in area_lower for x in ['uluwatu', 'bingin']):
-            return 'uluwatu'
-        elif any(x in area_lower for x in ['seminyak', 'kerobokan']):
-            return 'seminyak'
-        elif 'ubud' in area_lower:
-            return 'ubud'
-        else:
-            return area_lower
-
-
-    def _load_cafes_from_airtable(self):
-        """Загружает кафе из Airtable"""
-        try:
-            records = self.breakfast_table.all()
-            db = {}
-
-            for record in records:
-                fields = record['fields']
-
-                area_raw = fields.get('area', 'unknown')
-                area = self._normalize_area(area_raw)
-                if area not in db:
-                    db[area] = []
-
-                cafe = {
-                    "name": fields.get('restaurant_name_en', 'Unknown'),
-                    "name_ru": fields.get('restaurant_name_ru', ''),
-                    "category": fields.get('category_en', ''),
-                    "category_ru": fields.get('category_ru', ''),
-                    "cuisine_ru": fields.get('cuisine_style_ru', ''),
-                    "vibe_ru": fields.get('vibe_short_ru', ''),
-                    "awards_ru": fields.get('awards_ru', ''),
-                    "price_level": fields.get('price_level', ''),
-                    "prestige_tier": fields.get('prestige_tier', ''),
-                    "instagram_link": fields.get('instagram_link', ''),
-                    "phone": fields.get('phone', '')
-                }
 
-                db[area].append(cafe)
+class SmartBreakfastBot(catalog_reload.ReloadableCatalog):
+    CATALOG_ATTR = "cafes_db"
+    CATALOG_NAME = "breakfast cafes"
+    CATALOG_TABLE = "breakfast_table"
 
-            self.cafes_db = db
-            logger.info(f"✅ Loaded {sum(len(cafes) for cafes in db.values())} breakfast cafes from Airtable")
+    def __init__(self, airtable_token: str, airtable_base_id: str, breakfast_table_name: str, airtable_endpoint_url: str = "https://api.airtable.com"):
+        """Инициализация бота для поиска кафе для завтраков"""
+        self.airtable_api = airtable_client.shared_api(airtable_token, airtable_endpoint_url)
+        self.breakfast_table = self.airtable_api.table(airtable_base_id, breakfast_table_name)
+        self.load_catalog()
+
+    def catalog_from_records(self, records: list) -> dict:
+        """Каталог (кафе) и индексы из записей Airtable"""
+        db = {}
+
+        for record in records:
+            fields = record['fields']
+
+            area_raw = fields.get('area', 'unknown')
+            area = gazetteer.normalize_area(area_raw)
+            if area not in db:
+                db[area] = []
+
+            cafe = {
+                "name": fields.get('restaurant_name_en', 'Unknown'),
+                "name_ru": fields.get('restaurant_name_ru', ''),
+                "category": fields.get('category_en', ''),
+                "category_ru": fields.get('category_ru', ''),
+                "cuisine_ru": fields.get('cuisine_style_ru', ''),
+                "vibe_ru": fields.get('vibe_short_ru', ''),
+                "awards_ru": fields.get('awards_ru', ''),
+                "price_level": fields.get('price_level', ''),
+                "prestige_tier": fields.get('prestige_tier', ''),
+                "instagram_link": fields.get('instagram_link', ''),
+                "phone": fields.get('phone', ''),
+                "rating": fields.get('rating', ''),
+                "rating_stars": fields.get('rating_stars', '')
+            }
+
+            # Координаты для поиска ближайших мест (None, если в записи их нет)
+            cafe["lat"], cafe["lng"] = geo.coordinates_from_fields(fields) or (None, None)
+
+            db[area].append(cafe)
+
+        ranked_places = ranking.rank_catalog(db)
+        logger.info(f"✅ Loaded {sum(len(cafes) for cafes in db.values())} breakfast cafes from Airtable")
+        return {
+            "cafes_db": db,
+            "ranked_places": ranked_places,  # [(area, place)] всех районов по убыванию rank_score
+            "filter_index": place_filters.FilterIndex(ranked_places, FILTER_FIELDS),
+            "geo_index": geo.GeoGrid.from_catalog(db),
+        }
 
-        except Exception as e:
-            logger.error(f"❌ Error loading breakfast cafes from Airtable: {e}")
-            self.cafes_db = {}
+    def empty_catalog(self) -> dict:
+        return {
+            "cafes_db": {},
+            "ranked_places": [],
+            "filter_index": place_filters.FilterIndex([], FILTER_FIELDS),
+            "geo_index": geo.GeoGrid(),
+        }
 
+    @tracing.traced("breakfast.search")
     async def search_cafes(self, query: str, location: str = None) -> dict:
         """
         Поиск кафе для завтраков в Airtable
@@ -79,26 +95,17 @@ class SmartBreakfastBot:
         Returns:
             dict с результатами поиска
         """
-        results = []
-
-        # Если указана локация, ищем только там
-        if location:
-            cafes = self.cafes_db.get(location, [])
-            for cafe in cafes:
-                results.append({
-                    "cafe": cafe,
-                    "location": location.capitalize(),
-                    "relevance_score": 1.0
-                })
-        else:
-            # Ищем во всех локациях
-            for loc, cafes in self.cafes_db.items():
-                for cafe in cafes:
-                    results.append({
-                        "cafe": cafe,
-                        "location": loc.capitalize(),
-                        "relevance_score": 1.0
-                    })
+        # Цена, тип, стиль и атмосфера из запроса - по битовым индексам; порядок - по рейтингу (ranking.rank_catalog)
+        ranked = self.filter_index.search(query, location)
+
+        results = [
+            {
+                "cafe": cafe,
+                "location": loc.capitalize(),
+                "relevance_score": round(cafe.get("rank_score", 0) / 100, 4)
+            }
+            for loc, cafe in ranked
+        ]
 
         # Форматируем результаты
         return {
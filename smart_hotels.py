@@ -3,75 +3,91 @@ Smart Hotels Search для Бали
 Поиск отелей в Airtable
 """
 
-from pyairtable import Api
 import logging
+import gazetteer
+import geo
+import place_filters
+import ranking
+import airtable_client
+import catalog_reload
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Поля места для фильтров запроса (place_filters): тип, стиль, атмосфера
+FILTER_FIELDS = {
+    "type": ("type", "type_ru"),
+    "style": ("style", "style_ru"),
+    "vibe": ("vibe", "vibe_ru"),
+}
 
-class SmartHotelsBot:
-    def __init__(self, airtable_token: str, airtable_base_id: str, hotels_table_name: str):
-        """Инициализация бота для поиска отелей"""
-        self.airtable_api = Api(airtable_token)
-        self.hotels_table = self.airtable_api.table(airtable_base_id, hotels_table_name)
-        self.hotels_db = {}
-        self._load_hotels_from_airtable()
-    def _normalize_area(self, area: str) -> str:
-        """Нормализует название района к стандартному виду"""
-        area_lower = area.lower()
-        if any(x in area_lower for x in ['canggu', 'berawa', 'pererenan']):
-            return 'canggu'
-        elif any(x in area_lower for x in ['uluwatu', 'bingin']):
-            return 'uluwatu'
-        elif any(x in area_lower for x in ['seminyak', 'kerobokan']):
-            return 'seminyak'
-        elif 'ubud' in area_lower:
-            return 'ubud'
-        else:
-            return area_lower
-
-
-    def _load_hotels_from_airtable(self):
-        """Загружает отели из Airtable"""
-        try:
-            records = self.hotels_table.all()
-            db = {}
-
-            for record in records:
-                fields = record['fields']
-
-                area_raw = fields.get('area', 'unknown')
-                area = self._normalize_area(area_raw)
-                if area not in db:
-                    db[area] = []
-
-                hotel = {
-                    "name": fields.get('hotel_name_en', 'Unknown'),
-                    "name_ru": fields.get('hotel_name_ru', ''),
-                    "type": fields.get('type_en', ''),
-                    "type_ru": fields.get('type_ru', ''),
-                    "style": fields.get('style_en', ''),
-                    "style_ru": fields.get('style_ru', ''),
-                    "vibe": fields.get('vibe_short_en', ''),
-                    "vibe_ru": fields.get('vibe_short_ru', ''),
-                    "price_level": fields.get('price_level', ''),
-                    "phone": fields.get('phone', ''),
-                    "instagram_handle": fields.get('instagram_handle', ''),
-                    "booking_link": fields.get('booking_link', ''),
-                    "year_opened": fields.get('year_opened', ''),
-                    "rating": fields.get('rating', ''),
-                    "description_ru_short": fields.get('description_ru_short', '')
-                }
 
-                db[area].append(hotel)
+class SmartHotelsBot(catalog_reload.ReloadableCatalog):
+    CATALOG_ATTR = "hotels_db"
+    CATALOG_NAME = "hotels"
+    CATALOG_TABLE = "hotels_table"
 
-            self.hotels_db = db
-            logger.info(f"✅ Loaded {sum(len(hotels) for hotels in db.values())} hotels from Airtable")
+    def __init__(self, airtable_token: str, airtable_base_id: str, hotels_table_name: str, airtable_endpoint_url: str = "https://api.airtable.com"):
+        """Инициализация бота для поиска отелей"""
+        self.airtable_api = airtable_client.shared_api(airtable_token, airtable_endpoint_url)
+        self.hotels_table = self.airtable_api.table(airtable_base_id, hotels_table_name)
+        self.load_catalog()
+
+    def catalog_from_records(self, records: list) -> dict:
+        """Каталог (отели) и индексы из записей Airtable"""
+        db = {}
+
+        for record in records:
+            fields = record['fields']
+
+            area_raw = fields.get('area', 'unknown')
+            area = gazetteer.normalize_area(area_raw)
+            if area not in db:
+                db[area] = []
+
+            hotel = {
+                "name": fields.get('hotel_name_en', 'Unknown'),
+                "name_ru": fields.get('hotel_name_ru', ''),
+                "type": fields.get('type_en', ''),
+                "type_ru": fields.get('type_ru', ''),
+                "style": fields.get('style_en', ''),
+                "style_ru": fields.get('style_ru', ''),
+                "vibe": fields.get('vibe_short_en', ''),
+                "vibe_ru": fields.get('vibe_short_ru', ''),
+                "price_level": fields.get('price_level', ''),
+                "phone": fields.get('phone', ''),
+                "instagram_handle": fields.get('instagram_handle', ''),
+                "booking_link": fields.get('booking_link', ''),
+                "year_opened": fields.get('year_opened', ''),
+                "rating": fields.get('rating', ''),
+                "description_ru_short": fields.get('description_ru_short', ''),
+                "prestige_tier": fields.get('prestige_tier', ''),
+                "rating_stars": fields.get('rating_stars', '')
+            }
+
+            # Координаты для поиска ближайших мест (None, если в записи их нет)
+            hotel["lat"], hotel["lng"] = geo.coordinates_from_fields(fields) or (None, None)
+
+            db[area].append(hotel)
+
+        ranked_places = ranking.rank_catalog(db)
+        logger.info(f"✅ Loaded {sum(len(hotels) for hotels in db.values())} hotels from Airtable")
+        return {
+            "hotels_db": db,
+            "ranked_places": ranked_places,  # [(area, place)] всех районов по убыванию rank_score
+            "filter_index": place_filters.FilterIndex(ranked_places, FILTER_FIELDS),
+            "geo_index": geo.GeoGrid.from_catalog(db),
+        }
 
-        except Exception as e:
-            logger.error(f"❌ Error loading hotels from Airtable: {e}")
-            self.hotels_db = {}
+    def empty_catalog(self) -> dict:
+        return {
+            "hotels_db": {},
+            "ranked_places": [],
+            "filter_index": place_filters.FilterIndex([], FILTER_FIELDS),
+            "geo_index": geo.GeoGrid(),
+        }
 
+    @tracing.traced("hotels.search")
     async def search_hotels(self, query: str, location: str = None) -> dict:
         """
         Поиск отелей в Airtable
@@ -83,26 +99,17 @@ class SmartHotelsBot:
         Returns:
             dict с результатами поиска
         """
-        results = []
-
-        # Если указана локация, ищем только там
-        if location:
-            hotels = self.hotels_db.get(location, [])
-            for hotel in hotels:
-                results.append({
-                    "hotel": hotel,
-                    "location": location.capitalize(),
-                    "relevance_score": 1.0
-                })
-        else:
-            # Ищем во всех локациях
-            for loc, hotels in self.hotels_db.items():
-                for hotel in hotels:
-                    results.append({
-                        "hotel": hotel,
-                        "location": loc.capitalize(),
-                        "relevance_score": 1.0
-                    })
+        # Цена, тип, стиль и атмосфера из запроса - по битовым индексам; порядок - по рейтингу (ranking.rank_catalog)
+        ranked = self.filter_index.search(query, location)
+
+        results = [
+            {
+                "hotel": hotel,
+                "location": loc.capitalize(),
+                "relevance_score": round(hotel.get("rank_score", 0) / 100, 4)
+            }
+            for loc, hotel in ranked
+        ]
 
         # Форматируем результаты
         return {
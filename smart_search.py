@@ -4,130 +4,151 @@
 Слой 2: Perplexity API (дополнение + свежие данные)
 """
 
+import asyncio
+import logging
+import time
 import httpx
 from typing import List, Dict, Optional
-from fuzzywuzzy import fuzz
-from pyairtable import Api
+import gazetteer
+import geo
+import airtable_client
+import catalog_reload
+import metrics
+import relevance
+import token_usage
+import tracing
 
+logger = logging.getLogger(__name__)
 
-class SmartBaliBot:
-    def __init__(self, perplexity_api_key: str, airtable_token: str, airtable_base_id: str, restaurants_table_name: str):
+
+class SmartBaliBot(catalog_reload.ReloadableCatalog):
+    CATALOG_ATTR = "restaurants_db"
+    CATALOG_NAME = "restaurants"
+    CATALOG_TABLE = "restaurants_table"
+
+    def __init__(
+        self,
+        perplexity_api_key: str,
+        airtable_token: str,
+        airtable_base_id: str,
+        restaurants_table_name: str,
+        airtable_endpoint_url: str = "https://api.airtable.com",
+        perplexity_api_url: str = "https://api.perplexity.ai/chat/completions"
+    ):
         self.perplexity_api_key = perplexity_api_key
-        self.airtable_api = Api(airtable_token)
+        self.perplexity_api_url = perplexity_api_url
+        self.airtable_api = airtable_client.shared_api(airtable_token, airtable_endpoint_url)
         self.restaurants_table = self.airtable_api.table(airtable_base_id, restaurants_table_name)
-        self.curated_db = {}  # Будет загружен из Airtable
-        self.restaurants_db = self._load_restaurants_from_airtable()  # Инициализируем сразу
+        self.load_catalog()  # restaurants_db и geo_index (ближайшие рестораны по координатам)
         self.config = {
             "excluded_domains": ["tripadvisor.com", "timeout.com"],
             "preferred_domains": [
                 "google.com/maps", "thenomadexperience.com", "instagram.com",
                 "theworlds50best.com", "eater.com", "seriouseats.com",
                 "balibible.com", "thehoneycombers.com"
-            ]
+            ],
+            # Конвейерный режим: Perplexity стартует параллельно с поиском по базе
+            "pipelined_search": True,
+            # Сколько секунд от начала поиска ждём Perplexity, если база уже что-то нашла
+            "enrichment_deadline": 6.0
         }
 
-    def _normalize_area(self, area: str) -> str:
-        """Нормализует название района к стандартному виду"""
-        area_lower = area.lower()
-
-        # Canggu включает: canggu, berawa, pererenan
-        if any(x in area_lower for x in ['canggu', 'berawa', 'pererenan']):
-            return 'canggu'
-        # Uluwatu включает: uluwatu, bingin
-        elif any(x in area_lower for x in ['uluwatu', 'bingin']):
-            return 'uluwatu'
-        # Seminyak включает: seminyak, kerobokan
-        elif any(x in area_lower for x in ['seminyak', 'kerobokan']):
-            return 'seminyak'
-        # Ubud остается как есть
-        elif 'ubud' in area_lower:
-            return 'ubud'
-        else:
-            return area_lower
-
-    def _load_restaurants_from_airtable(self):
-        """Загружает рестораны из Airtable при каждом запросе"""
-        try:
-            records = self.restaurants_table.all()
-            print(f"🔍 DEBUG Airtable: Загружено {len(records)} записей")
-
-            # Группируем по area (location)
-            db = {}
-            for record in records:
-                fields = record['fields']
-
-                # DEBUG: Печатаем ВСЕ поля первой записи
-                if len(db) == 0:
-                    print(f"🔍 DEBUG: Доступные поля в Airtable: {list(fields.keys())}")
-                    print(f"🔍 DEBUG: Пример записи: {fields}")
-
-                area_raw = fields.get('area', 'unknown')
-                area = self._normalize_area(area_raw)
-
-                if area not in db:
-                    db[area] = []
-
-                # Преобразуем в формат нашей системы
-                vibe_tags = fields.get('vibe_tags', [])
-                # Если vibe_tags строка - разбиваем, если список - используем как есть
-                if isinstance(vibe_tags, str):
-                    tags_list = vibe_tags.split(',') if vibe_tags else []
-                elif isinstance(vibe_tags, list):
-                    tags_list = vibe_tags
-                else:
-                    tags_list = []
-
-                restaurant = {
-                    "name": fields.get('restaurant_name_en', 'Unknown'),
-                    "type": fields.get('category_en', ''),
-                    "cuisine": fields.get('cuisine_style_en', ''),  # Английская версия для поиска
-                    "cuisine_ru": fields.get('cuisine_style_ru', ''),  # Русская версия для отображения
-                    "price_range": fields.get('price_level', ''),
-                    "vibe": fields.get('vibe_short_en', ''),  # Английская версия для поиска
-                    "vibe_ru": fields.get('vibe_short_ru', ''),  # Русская версия для отображения
-                    "instagram_link": fields.get('instagram_link', ''),  # Instagram ссылка
-                    "tags": tags_list,
-                    "keywords": []  # Создадим из других полей
-                }
-
-                # Генерируем keywords для поиска
-                keywords = []
-                if restaurant["type"]:
-                    keywords.append(restaurant["type"].lower())
-                if restaurant["cuisine"]:
-                    keywords.extend(restaurant["cuisine"].lower().split())
-                if restaurant["vibe"]:
-                    keywords.extend(restaurant["vibe"].lower().split())
-                # tags_list уже список, не нужно вызывать split()
-                if restaurant["tags"]:
-                    keywords.extend([tag.strip().lower() for tag in restaurant["tags"]])
-
-                restaurant["keywords"] = list(set(keywords))  # Убираем дубликаты
-
-                db[area].append(restaurant)
-
-            print(f"🔍 DEBUG Airtable: Сгруппировано по локациям: {list(db.keys())}")
-            for loc, rests in db.items():
-                print(f"  - {loc}: {len(rests)} ресторанов")
-
-            return db
+    def catalog_from_records(self, records: list) -> dict:
+        """Каталог (рестораны) и индексы из записей Airtable"""
+        print(f"🔍 DEBUG Airtable: Загружено {len(records)} записей")
+
+        # Группируем по area (location)
+        db = {}
+        for record in records:
+            fields = record['fields']
+
+            # DEBUG: Печатаем ВСЕ поля первой записи
+            if len(db) == 0:
+                print(f"🔍 DEBUG: Доступные поля в Airtable: {list(fields.keys())}")
+                print(f"🔍 DEBUG: Пример записи: {fields}")
+
+            area_raw = fields.get('area', 'unknown')
+            area = gazetteer.normalize_area(area_raw)
+
+            if area not in db:
+                db[area] = []
+
+            # Преобразуем в формат нашей системы
+            vibe_tags = fields.get('vibe_tags', [])
+            # Если vibe_tags строка - разбиваем, если список - используем как есть
+            if isinstance(vibe_tags, str):
+                tags_list = vibe_tags.split(',') if vibe_tags else []
+            elif isinstance(vibe_tags, list):
+                tags_list = vibe_tags
+            else:
+                tags_list = []
+
+            restaurant = {
+                "name": fields.get('restaurant_name_en', 'Unknown'),
+                "type": fields.get('category_en', ''),
+                "cuisine": fields.get('cuisine_style_en', ''),  # Английская версия для поиска
+                "cuisine_ru": fields.get('cuisine_style_ru', ''),  # Русская версия для отображения
+                "price_range": fields.get('price_level', ''),
+                "vibe": fields.get('vibe_short_en', ''),  # Английская версия для поиска
+                "vibe_ru": fields.get('vibe_short_ru', ''),  # Русская версия для отображения
+                "instagram_link": fields.get('instagram_link', ''),  # Instagram ссылка
+                "tags": tags_list,
+                "keywords": []  # Создадим из других полей
+            }
+
+            # Генерируем keywords для поиска
+            keywords = []
+            if restaurant["type"]:
+                keywords.append(restaurant["type"].lower())
+            if restaurant["cuisine"]:
+                keywords.extend(restaurant["cuisine"].lower().split())
+            if restaurant["vibe"]:
+                keywords.extend(restaurant["vibe"].lower().split())
+            # tags_list уже список, не нужно вызывать split()
+            if restaurant["tags"]:
+                keywords.extend([tag.strip().lower() for tag in restaurant["tags"]])
+
+            restaurant["keywords"] = list(set(keywords))  # Убираем дубликаты
+
+            # Координаты для поиска ближайших мест (None, если в записи их нет)
+            restaurant["lat"], restaurant["lng"] = geo.coordinates_from_fields(fields) or (None, None)
+
+            db[area].append(restaurant)
+
+        print(f"🔍 DEBUG Airtable: Сгруппировано по локациям: {list(db.keys())}")
+        for loc, rests in db.items():
+            print(f"  - {loc}: {len(rests)} ресторанов")
+
+        return {
+            "restaurants_db": db,
+            "geo_index": geo.GeoGrid.from_catalog(db),
+        }
 
-        except Exception as e:
-            print(f"Error loading restaurants from Airtable: {e}")
-            import traceback
-            traceback.print_exc()
-            return {}
+    def empty_catalog(self) -> dict:
+        return {"restaurants_db": {}, "geo_index": geo.GeoGrid()}
 
-    async def search_restaurants(self, user_query: str, location: Optional[str] = None) -> Dict:
+    @tracing.traced("restaurants.search")
+    async def search_restaurants(self, user_query: str, location: Optional[str] = None, enrich: bool = True) -> Dict:
         """
         Главная функция поиска:
         1. Проверяет кураторскую базу
-        2. Если нужно - дополняет через Perplexity API
+        2. Если нужно - дополняет через Perplexity API (enrich=False - вызывающий показывает только базу,
+           платный запрос не делаем)
         """
 
+        if not enrich:
+            curated_results = self._search_curated_db(user_query, location)
+            metrics.record_cache("curated_restaurants", hit=bool(curated_results))
+            return self._merge_results(curated_results, None, user_query)
+
+        if self.config.get("pipelined_search"):
+            return await self._search_restaurants_pipelined(user_query, location)
+
         # ШАГ 1: Поиск в кураторской базе
         curated_results = self._search_curated_db(user_query, location)
 
+        metrics.record_cache("curated_restaurants", hit=bool(curated_results))
+
         # ШАГ 2: Определяем, нужен ли API запрос
         needs_api_search = self._should_use_api(user_query, curated_results)
 
@@ -141,19 +162,77 @@ class SmartBaliBot:
 
         return final_response
 
-    def _search_curated_db(self, query: str, location: Optional[str] = None) -> List[Dict]:
-        """Поиск по кураторской базе из Airtable"""
+    async def _search_restaurants_pipelined(self, user_query: str, location: Optional[str] = None) -> Dict:
+        """
+        Конвейерный поиск: задержка max(база, API) вместо суммы.
+        1. Если в запросе есть триггерные слова - сразу запускаем Perplexity
+        2. Параллельно ищем в кураторской базе
+        3. Ждём Perplexity до дедлайна, опоздал - отдаём только базу
+        """
 
-        # Загружаем свежие данные из Airtable
-        self.curated_db = self._load_restaurants_from_airtable()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.config["enrichment_deadline"]
+
+        api_task = None
+        if self._has_api_triggers(user_query):
+            # Контекст для API - из того же снимка базы, что и основной поиск
+            snapshot = self.restaurants_db
+            # Для контекста Perplexity нужен только топ-5
+            speculative_context = self._rank_curated(snapshot, user_query, location, limit=5)
+            api_task = asyncio.create_task(
+                self._search_with_perplexity(user_query, location, speculative_context)
+            )
+
+        try:
+            # Ранжирование большой базы - в поток, чтобы не блокировать event loop
+            curated_results = await asyncio.to_thread(self._search_curated_db, user_query, location)
+            metrics.record_cache("curated_restaurants", hit=bool(curated_results))
+
+            api_results = None
+            if api_task is not None:
+                if curated_results:
+                    api_results = await self._await_enrichment(api_task, deadline - loop.time())
+                else:
+                    # В базе пусто - без API ответить нечем, ждём его полный таймаут
+                    api_results = await api_task
+            elif not curated_results:
+                api_results = await self._search_with_perplexity(user_query, location, curated_results)
+        finally:
+            # Ошибка поиска по базе или отмена самого запроса - не оставляем платный вызов висеть
+            if api_task is not None and not api_task.done():
+                api_task.cancel()
+
+        return self._merge_results(curated_results, api_results, user_query)
+
+    async def _await_enrichment(self, api_task: asyncio.Task, timeout: float) -> Optional[Dict]:
+        """Ждём ответ Perplexity не дольше timeout; по истечении отменяем запрос"""
+        try:
+            return await asyncio.wait_for(api_task, timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            logger.info(f"⏱ Perplexity не успел к дедлайну ({self.config['enrichment_deadline']}s) - отдаём только базу")
+            return None
+
+    @tracing.traced("restaurants.search_curated")
+    def _search_curated_db(self, query: str, location: Optional[str] = None) -> List[Dict]:
+        """Поиск по кураторской базе (снимок из Airtable, обновляется перезагрузкой каталога)"""
 
         print(f"🔍 DEBUG _search_curated_db: query='{query}', location='{location}'")
 
+        return self._rank_curated(self.restaurants_db, query, location)
+
+    def _rank_curated(
+        self,
+        db: Dict[str, List[Dict]],
+        query: str,
+        location: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """Ранжирует рестораны из уже загруженной базы (без обращения к Airtable); limit - только топ-N"""
+
         query_lower = query.lower()
-        results = []
 
         # Определяем локации для поиска
-        locations_to_search = [location.lower()] if location else self.curated_db.keys()
+        locations_to_search = [location.lower()] if location else db.keys()
 
         print(f"🔍 DEBUG locations_to_search: {list(locations_to_search)}")
 
@@ -165,82 +244,28 @@ class SmartBaliBot:
         # Пустой query или общие запросы считаются общим запросом
         is_general_query = (not query_lower.strip()) or (any(gq in query_lower for gq in general_queries) and len(query_lower.split()) <= 5)
 
-        for loc in locations_to_search:
-            if loc not in self.curated_db:
-                continue
-
-            for restaurant in self.curated_db[loc]:
-                score = self._calculate_relevance_score(query_lower, restaurant)
-
-                # Если общий запрос - показываем ВСЕ рестораны из локации
-                if is_general_query:
-                    results.append({
-                        "restaurant": restaurant,
-                        "location": loc,
-                        "relevance_score": score,
-                        "source": "curated"
-                    })
-                # Если специфичный запрос - применяем порог релевантности
-                elif score > 40:  # Снизил порог с 60 до 40
-                    results.append({
-                        "restaurant": restaurant,
-                        "location": loc,
-                        "relevance_score": score,
-                        "source": "curated"
-                    })
-
-        # Сортируем по релевантности
-        results.sort(key=lambda x: x["relevance_score"], reverse=True)
-        return results  # Возвращаем ВСЕ результаты (без ограничения топ-10)
-
-    def _calculate_relevance_score(self, query: str, restaurant: Dict) -> int:
-        """Рассчитываем релевантность ресторана к запросу"""
-
-        score = 0
-
-        # Проверяем название
-        name_match = fuzz.partial_ratio(query, restaurant["name"].lower())
-        score += name_match * 0.4  # 40% веса
-
-        # Проверяем кухню
-        if "cuisine" in restaurant:
-            cuisine_match = fuzz.partial_ratio(query, restaurant["cuisine"].lower())
-            score += cuisine_match * 0.2
-
-        # Проверяем ключевые слова
-        if "keywords" in restaurant:
-            for keyword in restaurant["keywords"]:
-                if keyword in query:
-                    score += 20
-
-        # Проверяем тип заведения
-        if "type" in restaurant:
-            type_match = fuzz.partial_ratio(query, restaurant["type"].lower())
-            score += type_match * 0.2
-
-        # Специальные термины
-        special_terms = {
-            "michelin": ["michelin", "starred", "star"],
-            "fine dining": ["fine dining", "tasting menu", "degustation"],
-            "romantic": ["romantic", "date", "anniversary"],
-            "view": ["view", "ocean", "sunset", "cliff"],
-            "новый": ["new", "2024", "2025", "opening"],
-            "дешевый": ["cheap", "budget", "affordable"],
-            "дорогой": ["expensive", "luxury", "premium"]
-        }
-
-        for term_category, terms in special_terms.items():
-            if any(term in query for term in terms):
-                if any(term in str(restaurant.get("highlights", "")).lower() or
-                       term in str(restaurant.get("distinction", "")).lower() or
-                       term in str(restaurant.get("keywords", "")).lower()
-                       for term in terms):
-                    score += 15
+        # Скорим каждый район одним пакетным вызовом (индекс района строится один раз на загрузку базы).
+        # Если общий запрос - показываем ВСЕ рестораны из локации,
+        # если специфичный - применяем порог релевантности (снизил с 60 до 40)
+        ranked = relevance.rank(
+            db, query_lower, locations_to_search,
+            min_score=None if is_general_query else 40,
+            limit=limit
+        )
 
-        return min(score, 100)  # Максимум 100
+        # Отсортировано по релевантности; без limit возвращаем ВСЕ результаты
+        return [
+            {
+                "restaurant": restaurant,
+                "location": loc,
+                "relevance_score": score,
+                "source": "curated"
+            }
+            for restaurant, loc, score in ranked
+        ]
 
-    def _should_use_api(self, query: str, curated_results: List[Dict]) -> bool:
-        """Решаем, нужен ли запрос к Perplexity API"""
+    def _has_api_triggers(self, query: str) -> bool:
+        """Есть ли в запросе слова, требующие актуальных данных из Perplexity"""
 
         # API ТОЛЬКО для специфичных запросов:
         specific_triggers = [
@@ -252,9 +277,13 @@ class SmartBaliBot:
         ]
 
         query_lower = query.lower()
+        return any(trigger in query_lower for trigger in specific_triggers)
+
+    def _should_use_api(self, query: str, curated_results: List[Dict]) -> bool:
+        """Решаем, нужен ли запрос к Perplexity API"""
 
         # Если есть специфичные триггерные слова - идем в API
-        if any(trigger in query_lower for trigger in specific_triggers):
+        if self._has_api_triggers(query):
             return True
 
         # Если в базе НЕТ результатов - дополняем через API
@@ -272,6 +301,10 @@ class SmartBaliBot:
     ) -> Optional[Dict]:
         """Поиск через Perplexity API с учетом кураторской базы"""
 
+        # Дневной бюджет гостя (token_usage.set_user) исчерпан - только база
+        if not token_usage.within_budget():
+            return None
+
         # Формируем контекст из кураторской базы
         context = self._build_context_from_curated(curated_results)
 
@@ -317,29 +350,34 @@ Respond in Russian with insider knowledge."""
 
         try:
             async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.perplexity.ai/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.perplexity_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "sonar",
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": enhanced_query}
-                        ],
-                        "temperature": 0.2,
-                        "max_tokens": 1000,
-                        "top_p": 0.9,
-                        "frequency_penalty": 1.0,
-                        "stream": False
-                    },
-                    timeout=20.0
-                )
+                start = time.perf_counter()
+                with metrics.track_upstream("perplexity", "restaurants") as call:
+                    response = await client.post(
+                        self.perplexity_api_url,
+                        headers={
+                            "Authorization": f"Bearer {self.perplexity_api_key}",
+                            "Content-Type": "application/json"
+                        },
+                        json={
+                            "model": "sonar",
+                            "messages": [
+                                {"role": "system", "content": system_prompt},
+                                {"role": "user", "content": enhanced_query}
+                            ],
+                            "temperature": 0.2,
+                            "max_tokens": 1000,
+                            "top_p": 0.9,
+                            "frequency_penalty": 1.0,
+                            "stream": False
+                        },
+                        timeout=20.0
+                    )
+                    if response.status_code != 200:
+                        call.fail()
 
                 if response.status_code == 200:
                     data = response.json()
+                    token_usage.record_perplexity("restaurants", data, time.perf_counter() - start)
                     return {
                         "content": data['choices'][0]['message']['content'],
                         "citations": data.get('citations', []),
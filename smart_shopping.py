@@ -3,69 +3,86 @@ Smart Shopping Search для Бали
 Поиск магазинов в Airtable
 """
 
-from pyairtable import Api
 import logging
+import gazetteer
+import geo
+import place_filters
+import ranking
+import airtable_client
+import catalog_reload
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Поля места для фильтров запроса (place_filters): тип, стиль, атмосфера
+FILTER_FIELDS = {
+    "type": ("category", "category_ru"),
+    "style": ("specialty_ru",),
+    "vibe": ("vibe_ru",),
+}
 
-class SmartShoppingBot:
-    def __init__(self, airtable_token: str, airtable_base_id: str, shopping_table_name: str):
-        """Инициализация бота для поиска магазинов"""
-        self.airtable_api = Api(airtable_token)
-        self.shopping_table = self.airtable_api.table(airtable_base_id, shopping_table_name)
-        self.shops_db = {}
-        self._load_shops_from_airtable()
-    def _normalize_area(self, area: str) -> str:
-        """Нормализует название района к стандартному виду"""
-        area_lower = area.lower()
-        if any(x in area_lower for x in ['canggu', 'berawa', 'pererenan']):
-            return 'canggu'
-        elif any(x in area_lower for x in ['uluwatu', 'bingin']):
-            return 'uluwatu'
-        elif any(x in area_lower for x in ['seminyak', 'kerobokan']):
-            return 'seminyak'
-        elif 'ubud' in area_lower:
-            return 'ubud'
-        else:
-            return area_lower
-
-
-    def _load_shops_from_airtable(self):
-        """Загружает магазины из Airtable"""
-        try:
-            records = self.shopping_table.all()
-            db = {}
-
-            for record in records:
-                fields = record['fields']
-
-                area_raw = fields.get('area', 'unknown')
-                area = self._normalize_area(area_raw)
-                if area not in db:
-                    db[area] = []
-
-                shop = {
-                    "name": fields.get('shop_name_en', 'Unknown'),
-                    "name_ru": fields.get('shop_name_ru', ''),
-                    "category": fields.get('category_en', ''),
-                    "category_ru": fields.get('category_ru', ''),
-                    "specialty_ru": fields.get('specialty_ru', ''),
-                    "vibe_ru": fields.get('vibe_short_ru', ''),
-                    "price_level": fields.get('price_level', ''),
-                    "instagram_link": fields.get('instagram_link', ''),
-                    "phone": fields.get('phone', '')
-                }
 
-                db[area].append(shop)
+class SmartShoppingBot(catalog_reload.ReloadableCatalog):
+    CATALOG_ATTR = "shops_db"
+    CATALOG_NAME = "shopping places"
+    CATALOG_TABLE = "shopping_table"
 
-            self.shops_db = db
-            logger.info(f"✅ Loaded {sum(len(shops) for shops in db.values())} shopping places from Airtable")
+    def __init__(self, airtable_token: str, airtable_base_id: str, shopping_table_name: str, airtable_endpoint_url: str = "https://api.airtable.com"):
+        """Инициализация бота для поиска магазинов"""
+        self.airtable_api = airtable_client.shared_api(airtable_token, airtable_endpoint_url)
+        self.shopping_table = self.airtable_api.table(airtable_base_id, shopping_table_name)
+        self.load_catalog()
+
+    def catalog_from_records(self, records: list) -> dict:
+        """Каталог (магазины) и индексы из записей Airtable"""
+        db = {}
+
+        for record in records:
+            fields = record['fields']
+
+            area_raw = fields.get('area', 'unknown')
+            area = gazetteer.normalize_area(area_raw)
+            if area not in db:
+                db[area] = []
+
+            shop = {
+                "name": fields.get('shop_name_en', 'Unknown'),
+                "name_ru": fields.get('shop_name_ru', ''),
+                "category": fields.get('category_en', ''),
+                "category_ru": fields.get('category_ru', ''),
+                "specialty_ru": fields.get('specialty_ru', ''),
+                "vibe_ru": fields.get('vibe_short_ru', ''),
+                "price_level": fields.get('price_level', ''),
+                "instagram_link": fields.get('instagram_link', ''),
+                "phone": fields.get('phone', ''),
+                "prestige_tier": fields.get('prestige_tier', ''),
+                "rating": fields.get('rating', ''),
+                "rating_stars": fields.get('rating_stars', '')
+            }
+
+            # Координаты для поиска ближайших мест (None, если в записи их нет)
+            shop["lat"], shop["lng"] = geo.coordinates_from_fields(fields) or (None, None)
+
+            db[area].append(shop)
+
+        ranked_places = ranking.rank_catalog(db)
+        logger.info(f"✅ Loaded {sum(len(shops) for shops in db.values())} shopping places from Airtable")
+        return {
+            "shops_db": db,
+            "ranked_places": ranked_places,  # [(area, place)] всех районов по убыванию rank_score
+            "filter_index": place_filters.FilterIndex(ranked_places, FILTER_FIELDS),
+            "geo_index": geo.GeoGrid.from_catalog(db),
+        }
 
-        except Exception as e:
-            logger.error(f"❌ Error loading shopping places from Airtable: {e}")
-            self.shops_db = {}
+    def empty_catalog(self) -> dict:
+        return {
+            "shops_db": {},
+            "ranked_places": [],
+            "filter_index": place_filters.FilterIndex([], FILTER_FIELDS),
+            "geo_index": geo.GeoGrid(),
+        }
 
+    @tracing.traced("shopping.search")
     async def search_shops(self, query: str, location: str = None) -> dict:
         """
         Поиск магазинов в Airtable
@@ -77,26 +94,17 @@ class SmartShoppingBot:
         Returns:
             dict с результатами поиска
         """
-        results = []
-
-        # Если указана локация, ищем только там
-        if location:
-            shops = self.shops_db.get(location, [])
-            for shop in shops:
-                results.append({
-                    "shop": shop,
-                    "location": location.capitalize(),
-                    "relevance_score": 1.0
-                })
-        else:
-            # Ищем во всех локациях
-            for loc, shops in self.shops_db.items():
-                for shop in shops:
-                    results.append({
-                        "shop": shop,
-                        "location": loc.capitalize(),
-                        "relevance_score": 1.0
-                    })
+        # Цена, тип, стиль и атмосфера из запроса - по битовым индексам; порядок - по рейтингу (ranking.rank_catalog)
+        ranked = self.filter_index.search(query, location)
+
+        results = [
+            {
+                "shop": shop,
+                "location": loc.capitalize(),
+                "relevance_score": round(shop.get("rank_score", 0) / 100, 4)
+            }
+            for loc, shop in ranked
+        ]
 
         # Форматируем результаты
         return {
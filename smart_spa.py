@@ -3,71 +3,87 @@ Smart Spa Search для Бали
 Поиск спа-центров в Airtable
 """
 
-from pyairtable import Api
 import logging
+import gazetteer
+import geo
+import place_filters
+import ranking
+import airtable_client
+import catalog_reload
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Поля места для фильтров запроса (place_filters): тип, стиль, атмосфера
+FILTER_FIELDS = {
+    "type": ("category", "category_ru"),
+    "style": ("massage_type_ru",),
+    "vibe": ("vibe_ru",),
+}
 
-class SmartSpaBot:
-    def __init__(self, airtable_token: str, airtable_base_id: str, spa_table_name: str):
-        """Инициализация бота для поиска спа-центров"""
-        self.airtable_api = Api(airtable_token)
-        self.spa_table = self.airtable_api.table(airtable_base_id, spa_table_name)
-        self.spas_db = {}
-        self._load_spas_from_airtable()
-    def _normalize_area(self, area: str) -> str:
-        """Нормализует название района к стандартному виду"""
-        area_lower = area.lower()
-        if any(x in area_lower for x in ['canggu', 'berawa', 'pererenan']):
-            return 'canggu'
-        elif any(x in area_lower for x in ['uluwatu', 'bingin']):
-            return 'uluwatu'
-        elif any(x in area_lower for x in ['seminyak', 'kerobokan']):
-            return 'seminyak'
-        elif 'ubud' in area_lower:
-            return 'ubud'
-        else:
-            return area_lower
-
-
-    def _load_spas_from_airtable(self):
-        """Загружает спа-центры из Airtable"""
-        try:
-            records = self.spa_table.all()
-            db = {}
-
-            for record in records:
-                fields = record['fields']
-
-                area_raw = fields.get('area', 'unknown')
-                area = self._normalize_area(area_raw)
-                if area not in db:
-                    db[area] = []
-
-                spa = {
-                    "name": fields.get('spa_name_en', 'Unknown'),
-                    "name_ru": fields.get('spa_name_ru', ''),
-                    "category": fields.get('category_en', ''),
-                    "category_ru": fields.get('category_ru', ''),
-                    "massage_type_ru": fields.get('massage_type_ru', ''),
-                    "vibe_ru": fields.get('vibe_short_ru', ''),
-                    "awards_ru": fields.get('awards_ru', ''),
-                    "price_level": fields.get('price_level', ''),
-                    "prestige_tier": fields.get('prestige_tier', ''),
-                    "instagram_link": fields.get('instagram_link', ''),
-                    "phone": fields.get('phone', '')
-                }
 
-                db[area].append(spa)
+class SmartSpaBot(catalog_reload.ReloadableCatalog):
+    CATALOG_ATTR = "spas_db"
+    CATALOG_NAME = "spa places"
+    CATALOG_TABLE = "spa_table"
 
-            self.spas_db = db
-            logger.info(f"✅ Loaded {sum(len(spas) for spas in db.values())} spa/shopping/art places from Airtable")
+    def __init__(self, airtable_token: str, airtable_base_id: str, spa_table_name: str, airtable_endpoint_url: str = "https://api.airtable.com"):
+        """Инициализация бота для поиска спа-центров"""
+        self.airtable_api = airtable_client.shared_api(airtable_token, airtable_endpoint_url)
+        self.spa_table = self.airtable_api.table(airtable_base_id, spa_table_name)
+        self.load_catalog()
+
+    def catalog_from_records(self, records: list) -> dict:
+        """Каталог (спа-центры) и индексы из записей Airtable"""
+        db = {}
+
+        for record in records:
+            fields = record['fields']
+
+            area_raw = fields.get('area', 'unknown')
+            area = gazetteer.normalize_area(area_raw)
+            if area not in db:
+                db[area] = []
+
+            spa = {
+                "name": fields.get('spa_name_en', 'Unknown'),
+                "name_ru": fields.get('spa_name_ru', ''),
+                "category": fields.get('category_en', ''),
+                "category_ru": fields.get('category_ru', ''),
+                "massage_type_ru": fields.get('massage_type_ru', ''),
+                "vibe_ru": fields.get('vibe_short_ru', ''),
+                "awards_ru": fields.get('awards_ru', ''),
+                "price_level": fields.get('price_level', ''),
+                "prestige_tier": fields.get('prestige_tier', ''),
+                "instagram_link": fields.get('instagram_link', ''),
+                "phone": fields.get('phone', ''),
+                "rating": fields.get('rating', ''),
+                "rating_stars": fields.get('rating_stars', '')
+            }
+
+            # Координаты для поиска ближайших мест (None, если в записи их нет)
+            spa["lat"], spa["lng"] = geo.coordinates_from_fields(fields) or (None, None)
+
+            db[area].append(spa)
+
+        ranked_places = ranking.rank_catalog(db)
+        logger.info(f"✅ Loaded {sum(len(spas) for spas in db.values())} spa/shopping/art places from Airtable")
+        return {
+            "spas_db": db,
+            "ranked_places": ranked_places,  # [(area, place)] всех районов по убыванию rank_score
+            "filter_index": place_filters.FilterIndex(ranked_places, FILTER_FIELDS),
+            "geo_index": geo.GeoGrid.from_catalog(db),
+        }
 
-        except Exception as e:
-            logger.error(f"❌ Error loading spa places from Airtable: {e}")
-            self.spas_db = {}
+    def empty_catalog(self) -> dict:
+        return {
+            "spas_db": {},
+            "ranked_places": [],
+            "filter_index": place_filters.FilterIndex([], FILTER_FIELDS),
+            "geo_index": geo.GeoGrid(),
+        }
 
+    @tracing.traced("spa.search")
     async def search_spas(self, query: str, location: str = None) -> dict:
         """
         Поиск спа-центров в Airtable
@@ -79,26 +95,17 @@ class SmartSpaBot:
         Returns:
             dict с результатами поиска
         """
-        results = []
-
-        # Если указана локация, ищем только там
-        if location:
-            spas = self.spas_db.get(location, [])
-            for spa in spas:
-                results.append({
-                    "spa": spa,
-                    "location": location.capitalize(),
-                    "relevance_score": 1.0
-                })
-        else:
-            # Ищем во всех локациях
-            for loc, spas in self.spas_db.items():
-                for spa in spas:
-                    results.append({
-                        "spa": spa,
-                        "location": loc.capitalize(),
-                        "relevance_score": 1.0
-                    })
+        # Цена, тип, стиль и атмосфера из запроса - по битовым индексам; порядок - по рейтингу (ranking.rank_catalog)
+        ranked = self.filter_index.search(query, location)
+
+        results = [
+            {
+                "spa": spa,
+                "location": loc.capitalize(),
+                "relevance_score": round(spa.get("rank_score", 0) / 100, 4)
+            }
+            for loc, spa in ranked
+        ]
 
         # Форматируем результаты
         return {
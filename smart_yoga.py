@@ -3,71 +3,87 @@ Smart Yoga & Fitness Search для Бали
 Поиск студий йоги и фитнеса в Airtable
 """
 
-from pyairtable import Api
 import logging
+import gazetteer
+import geo
+import place_filters
+import ranking
+import airtable_client
+import catalog_reload
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Поля места для фильтров запроса (place_filters): тип, стиль, атмосфера
+FILTER_FIELDS = {
+    "type": ("category", "category_ru", "booking_type"),
+    "style": ("specialties", "specialties_ru"),
+    "vibe": ("highlights", "highlights_ru"),
+}
 
-class SmartYogaBot:
-    def __init__(self, airtable_token: str, airtable_base_id: str, yoga_table_name: str):
-        """Инициализация бота для поиска йога-студий"""
-        self.airtable_api = Api(airtable_token)
-        self.yoga_table = self.airtable_api.table(airtable_base_id, yoga_table_name)
-        self.studios_db = {}
-        self._load_studios_from_airtable()
-
-    def _normalize_area(self, area: str) -> str:
-        """Нормализует название района к стандартному виду"""
-        area_lower = area.lower()
-        if any(x in area_lower for x in ['canggu', 'berawa', 'pererenan']):
-            return 'canggu'
-        elif any(x in area_lower for x in ['uluwatu', 'bingin']):
-            return 'uluwatu'
-        elif any(x in area_lower for x in ['seminyak', 'kerobokan']):
-            return 'seminyak'
-        elif 'ubud' in area_lower:
-            return 'ubud'
-        else:
-            return area_lower
-
-    def _load_studios_from_airtable(self):
-        """Загружает студии из Airtable"""
-        try:
-            records = self.yoga_table.all()
-            db = {}
-
-            for record in records:
-                fields = record['fields']
-
-                area_raw = fields.get('area', 'unknown')
-                area = self._normalize_area(area_raw)
-                if area not in db:
-                    db[area] = []
-
-                studio = {
-                    "name": fields.get('studio_name_en', 'Unknown'),
-                    "category": fields.get('category_en', ''),
-                    "category_ru": fields.get('category_ru', ''),
-                    "specialties": fields.get('specialties_en', ''),
-                    "specialties_ru": fields.get('specialties_ru', ''),
-                    "highlights": fields.get('highlights_en', ''),
-                    "highlights_ru": fields.get('highlights_ru', ''),
-                    "booking_type": fields.get('booking_type', ''),
-                    "instagram_link": fields.get('instagram_link', ''),
-                    "prestige_tier": fields.get('prestige_tier', ''),
-                    "rating_stars": fields.get('rating_stars', '')
-                }
 
-                db[area].append(studio)
+class SmartYogaBot(catalog_reload.ReloadableCatalog):
+    CATALOG_ATTR = "studios_db"
+    CATALOG_NAME = "yoga studios"
+    CATALOG_TABLE = "yoga_table"
 
-            self.studios_db = db
-            logger.info(f"✅ Loaded {sum(len(studios) for studios in db.values())} yoga studios from Airtable")
+    def __init__(self, airtable_token: str, airtable_base_id: str, yoga_table_name: str, airtable_endpoint_url: str = "https://api.airtable.com"):
+        """Инициализация бота для поиска йога-студий"""
+        self.airtable_api = airtable_client.shared_api(airtable_token, airtable_endpoint_url)
+        self.yoga_table = self.airtable_api.table(airtable_base_id, yoga_table_name)
+        self.load_catalog()
+
+
+    def catalog_from_records(self, records: list) -> dict:
+        """Каталог (студии) и индексы из записей Airtable"""
+        db = {}
+
+        for record in records:
+            fields = record['fields']
+
+            area_raw = fields.get('area', 'unknown')
+            area = gazetteer.normalize_area(area_raw)
+            if area not in db:
+                db[area] = []
+
+            studio = {
+                "name": fields.get('studio_name_en', 'Unknown'),
+                "category": fields.get('category_en', ''),
+                "category_ru": fields.get('category_ru', ''),
+                "specialties": fields.get('specialties_en', ''),
+                "specialties_ru": fields.get('specialties_ru', ''),
+                "highlights": fields.get('highlights_en', ''),
+                "highlights_ru": fields.get('highlights_ru', ''),
+                "booking_type": fields.get('booking_type', ''),
+                "instagram_link": fields.get('instagram_link', ''),
+                "prestige_tier": fields.get('prestige_tier', ''),
+                "rating_stars": fields.get('rating_stars', ''),
+                "rating": fields.get('rating', '')
+            }
+
+            # Координаты для поиска ближайших мест (None, если в записи их нет)
+            studio["lat"], studio["lng"] = geo.coordinates_from_fields(fields) or (None, None)
+
+            db[area].append(studio)
+
+        ranked_places = ranking.rank_catalog(db)
+        logger.info(f"✅ Loaded {sum(len(studios) for studios in db.values())} yoga studios from Airtable")
+        return {
+            "studios_db": db,
+            "ranked_places": ranked_places,  # [(area, place)] всех районов по убыванию rank_score
+            "filter_index": place_filters.FilterIndex(ranked_places, FILTER_FIELDS),
+            "geo_index": geo.GeoGrid.from_catalog(db),
+        }
 
-        except Exception as e:
-            logger.error(f"❌ Error loading yoga studios from Airtable: {e}")
-            self.studios_db = {}
+    def empty_catalog(self) -> dict:
+        return {
+            "studios_db": {},
+            "ranked_places": [],
+            "filter_index": place_filters.FilterIndex([], FILTER_FIELDS),
+            "geo_index": geo.GeoGrid(),
+        }
 
+    @tracing.traced("yoga.search")
     async def search_studios(self, query: str, location: str = None) -> dict:
         """
         Поиск йога-студий в Airtable
@@ -79,26 +95,17 @@ class SmartYogaBot:
         Returns:
             dict с результатами поиска
         """
-        results = []
-
-        # Если указана локация, ищем только там
-        if location:
-            studios = self.studios_db.get(location, [])
-            for studio in studios:
-                results.append({
-                    "studio": studio,
-                    "location": location.capitalize(),
-                    "relevance_score": 1.0
-                })
-        else:
-            # Ищем во всех локациях
-            for loc, studios in self.studios_db.items():
-                for studio in studios:
-                    results.append({
-                        "studio": studio,
-                        "location": loc.capitalize(),
-                        "relevance_score": 1.0
-                    })
+        # Цена, тип, стиль и атмосфера из запроса - по битовым индексам; порядок - по рейтингу (ranking.rank_catalog)
+        ranked = self.filter_index.search(query, location)
+
+        results = [
+            {
+                "studio": studio,
+                "location": loc.capitalize(),
+                "relevance_score": round(studio.get("rank_score", 0) / 100, 4)
+            }
+            for loc, studio in ranked
+        ]
 
         # Форматируем результаты
         return {
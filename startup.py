@@ -0,0 +1,224 @@
+"""
+Быстрый холодный старт Weddy Bot.
+
+Тяжёлые зависимости (anthropic, pyairtable, httpx, numpy, rapidfuzz) и клиенты каталогов
+создаются не при импорте, а лениво: бот начинает принимать апдейты сразу,
+а каталоги грузятся из Airtable параллельно в фоновых потоках.
+
+  Lazy              - прокси, создающий объект при первом обращении
+  ensure(...)       - дождаться объектов из хендлера, не блокируя event loop
+  warm_up(...)      - фоновый прогрев всех клиентов, по завершении - сигнал готовности
+  READY / /ready    - сигнал готовности (метрика weddy_ready, HTTP /ready, файл READY_FILE)
+  PROFILE           - отметки фаз старта от запуска процесса до первого апдейта
+
+Профиль импорта: python -m startup [--top 20]
+"""
+
+import asyncio
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _process_start_time() -> float:
+    """Время запуска процесса (unix time); на Linux - из /proc, иначе - момент импорта модуля"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Поля после имени процесса (имя в скобках может содержать пробелы)
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_START = _process_start_time()
+
+STARTUP_PHASE = metrics.REGISTRY.gauge(
+    "weddy_startup_phase_seconds",
+    "Секунд от запуска процесса до фазы старта",
+    ["phase"],
+)
+CLIENT_BUILD_SECONDS = metrics.REGISTRY.gauge(
+    "weddy_client_build_seconds",
+    "Время создания ленивого клиента (импорт + загрузка каталога)",
+    ["client"],
+)
+READY_GAUGE = metrics.REGISTRY.gauge(
+    "weddy_ready",
+    "1, когда все клиенты и каталоги загружены",
+)
+
+
+class StartupProfile:
+    """Отметки фаз старта: секунды от запуска процесса"""
+
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str) -> float:
+        elapsed = time.time() - PROCESS_START
+        with self._lock:
+            self.phases.append((phase, elapsed))
+        STARTUP_PHASE.set(elapsed, phase=phase)
+        return elapsed
+
+    def report(self) -> str:
+        with self._lock:
+            phases = list(self.phases)
+        lines = ["⏱ Профиль старта (секунды от запуска процесса):"]
+        lines += [f"  {elapsed:7.2f}  {phase}" for phase, elapsed in phases]
+        return "\n".join(lines)
+
+
+PROFILE = StartupProfile()
+READY = threading.Event()
+
+
+class Lazy:
+    """
+    Прокси, создающий объект фабрикой при первом обращении к атрибуту.
+    Создание потокобезопасно: фоновый прогрев и хендлер не построят объект дважды.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], object]):
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._instance is not None
+
+    @property
+    def building(self) -> bool:
+        """Фабрика работает прямо сейчас (прогрев или первое обращение)"""
+        return self._instance is None and self._lock.locked()
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    instance = self._factory()
+                    elapsed = time.perf_counter() - start
+                    CLIENT_BUILD_SECONDS.set(elapsed, client=self._name)
+                    logger.info(f"🧩 {self._name} готов за {elapsed:.2f} с")
+                    self._instance = instance
+        return self._instance
+
+    def __getattr__(self, item):
+        return getattr(self.get(), item)
+
+    def __repr__(self):
+        return f"<Lazy {self._name} ({'готов' if self.built else 'не создан'})>"
+
+
+async def ensure(*proxies: Lazy):
+    """Дожидается создания объектов в потоках, чтобы загрузка каталога не блокировала event loop"""
+    pending = [proxy for proxy in proxies if not proxy.built]
+    if pending:
+        await asyncio.gather(*(asyncio.to_thread(proxy.get) for proxy in pending))
+
+
+async def warm_up(proxies: List[Lazy], ready_file: str = ""):
+    """Создаёт все клиенты параллельно в фоне и выставляет сигнал готовности"""
+    PROFILE.mark("warmup_started")
+    results = await asyncio.gather(*(asyncio.to_thread(proxy.get) for proxy in proxies), return_exceptions=True)
+    for proxy, result in zip(proxies, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Не удалось создать {proxy._name}: {result}")
+    mark_ready(ready_file)
+
+
+def mark_ready(ready_file: str = ""):
+    if READY.is_set():
+        return
+    PROFILE.mark("ready")
+    READY.set()
+    READY_GAUGE.set(1)
+    if ready_file:
+        try:
+            with open(ready_file, "w") as f:
+                f.write(f"{time.time():.3f}\n")
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось записать {ready_file}: {e}")
+    logger.info(PROFILE.report())
+
+
+_first_update_seen = False
+
+
+async def first_update_middleware(handler, event, data):
+    """Outer middleware апдейтов: отмечает время до первого обработанного апдейта"""
+    global _first_update_seen
+    result = await handler(event, data)
+    if not _first_update_seen:
+        _first_update_seen = True
+        elapsed = PROFILE.mark("first_update_handled")
+        logger.info(f"🚀 Первый апдейт обработан через {elapsed:.2f} с после запуска процесса")
+    return result
+
+
+async def ready_handler(request):
+    """GET /ready: 200, когда каталоги загружены, иначе 503 (для health check хостинга)"""
+    from aiohttp import web
+
+    if READY.is_set():
+        return web.Response(text="ready\n")
+    return web.Response(text="warming up\n", status=503)
+
+
+# ── Профиль импорта ──────────────────────────────────────────────────────────
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile(module: str = "wedding_bot_v2", top: int = 15, env: Optional[Dict[str, str]] = None) -> str:
+    """Импортирует модуль в отдельном процессе с -X importtime и возвращает отчёт"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env or dict(os.environ),
+        capture_output=True,
+        text=True,
+    )
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            # Уровень вложенности: -X importtime отбивает каждый уровень двумя пробелами
+            entries.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    if not entries:
+        return f"Не удалось получить профиль импорта {module}:\n{proc.stderr[-2000:]}"
+
+    total_us = next((cumulative for name, _, cumulative, _ in entries if name == module), 0)
+    top_level = sorted((e for e in entries if e[3] <= 1 and e[0] != module), key=lambda e: -e[2])[:top]
+    lines = [f"Импорт {module}: {total_us / 1e6:.2f} с" + ("" if proc.returncode == 0 else " (с ошибкой)")]
+    lines.append(f"{'модуль':<40}{'всего, мс':>12}{'сам, мс':>10}")
+    for name, self_us, cumulative_us, _ in top_level:
+        lines.append(f"{name:<40}{cumulative_us / 1e3:>12.1f}{self_us / 1e3:>10.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m startup", description="Профиль импорта Weddy Bot")
+    parser.add_argument("--module", default="wedding_bot_v2")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    print(import_profile(args.module, args.top))
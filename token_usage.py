@@ -0,0 +1,274 @@
+"""
+Учёт токенов и стоимости вызовов LLM (Claude и Perplexity): по гостям и по дням, с дневным бюджетом на гостя.
+
+  token_usage.set_user(user_id, user_name)     - в начале обработки сообщения: вызовы дальше (в т.ч. внутри
+                                                  SmartBaliBot и его фоновых задач) приписываются этому гостю
+  if token_usage.within_budget(): ...          - перед платным вызовом
+  token_usage.record_claude("chat", model, response.usage, seconds)
+  token_usage.record_perplexity("general", data, seconds)
+  token_usage.record_prompt_parts(system=..., context=..., history=..., message=...)  - из чего состоит вход (оценка)
+  token_usage.LEDGER.report(days)              - текст /usage
+
+Статистика - в памяти процесса (как лимиты Perplexity), старше KEEP_DAYS удаляется задачей планировщика.
+Бюджет - в долларах за день; 0 - без лимита. Проверяется до вызова, поэтому последний вызов может его превысить.
+"""
+
+import contextvars
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import metrics
+import model_routing
+
+KEEP_DAYS = 7
+REPORT_TOP_USERS = 10
+# Имена гостей в отчёте (Markdown) - без символов разметки
+_MARKDOWN = str.maketrans("", "", "*_`[]")
+
+# Perplexity: USD за миллион токенов (input, output) и плата за запрос (поиск с небольшим контекстом)
+PERPLEXITY_PRICES_PER_MTOK: Dict[str, Tuple[float, float]] = {
+    "sonar": (1.00, 1.00),
+    "sonar-pro": (3.00, 15.00),
+    "sonar-reasoning": (1.00, 5.00),
+}
+PERPLEXITY_REQUEST_FEE: Dict[str, float] = {
+    "sonar": 0.005,
+    "sonar-pro": 0.006,
+    "sonar-reasoning": 0.005,
+}
+
+# Части входа Claude в порядке отчёта
+PROMPT_PARTS = ("system", "context", "history", "message")
+_PART_TITLES = {
+    "system": "системный промпт",
+    "context": "контекст поиска",
+    "history": "история",
+    "message": "сообщение",
+}
+
+LLM_TOKENS = metrics.REGISTRY.counter(
+    "weddy_llm_tokens_total",
+    "Токены LLM по провайдеру, операции и направлению (input, output)",
+    ("provider", "operation", "direction")
+)
+LLM_COST = metrics.REGISTRY.counter(
+    "weddy_llm_cost_usd_total",
+    "Стоимость вызовов LLM, USD",
+    ("provider", "operation")
+)
+PROMPT_PART_TOKENS = metrics.REGISTRY.histogram(
+    "weddy_llm_prompt_part_tokens",
+    "Оценка токенов части входа Claude (system, context, history, message)",
+    ("part",),
+    buckets=(25, 50, 100, 250, 500, 750, 1000, 1500, 2000, 3000)
+)
+BUDGET_EXCEEDED = metrics.REGISTRY.counter(
+    "weddy_llm_budget_exceeded_total",
+    "Вызовы LLM, не сделанные из-за исчерпанного дневного бюджета гостя",
+)
+
+# Гость, чьё сообщение сейчас обрабатывается (у каждой задачи asyncio - своя копия)
+CURRENT_USER: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("weddy_llm_user", default=None)
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+class Totals:
+    __slots__ = ("calls", "input_tokens", "output_tokens", "cost_usd", "seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.seconds = 0.0
+
+    def add(self, input_tokens: int, output_tokens: int, cost: float, seconds: float):
+        self.calls += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += cost
+        self.seconds += seconds
+
+    def merge(self, other: "Totals"):
+        self.calls += other.calls
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cost_usd += other.cost_usd
+        self.seconds += other.seconds
+
+    def line(self) -> str:
+        average_ms = self.seconds / self.calls * 1000 if self.calls else 0.0
+        return (
+            f"{self.calls} выз. · вход {self.input_tokens:,} / выход {self.output_tokens:,} ток. · "
+            f"${self.cost_usd:.4f} · ~{average_ms:.0f} мс"
+        ).replace(",", " ")
+
+
+class DayUsage:
+    def __init__(self):
+        self.operations: Dict[Tuple[str, str], Totals] = defaultdict(Totals)  # (провайдер, операция)
+        self.users: Dict[int, Totals] = defaultdict(Totals)
+        self.prompt_parts: Dict[str, int] = defaultdict(int)  # сумма оценок по частям входа Claude
+        self.prompts = 0
+
+
+class UsageLedger:
+    def __init__(self, daily_budget_usd: float = 0.0):
+        self.daily_budget_usd = daily_budget_usd
+        self.budgets: Dict[int, float] = {}  # личные бюджеты поверх общего
+        self.days: Dict[str, DayUsage] = defaultdict(DayUsage)
+        self.names: Dict[int, str] = {}
+
+    # ── Бюджеты ───────────────────────────────────────────────────────────────
+    def set_budget(self, user_id: int, usd: Optional[float]):
+        """Личный дневной бюджет гостя; 0 - без лимита, None - снова общий"""
+        if usd is None:
+            self.budgets.pop(user_id, None)
+        else:
+            self.budgets[user_id] = usd
+
+    def budget_for(self, user_id: int) -> float:
+        return self.budgets.get(user_id, self.daily_budget_usd)
+
+    def spent_today(self, user_id: int) -> float:
+        day = self.days.get(_today())
+        totals = day.users.get(user_id) if day else None
+        return totals.cost_usd if totals else 0.0
+
+    def within_budget(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return True
+        budget = self.budget_for(user_id)
+        return budget <= 0 or self.spent_today(user_id) < budget
+
+    # ── Учёт ──────────────────────────────────────────────────────────────────
+    def record(self, provider: str, operation: str, input_tokens: int, output_tokens: int, cost: float,
+               seconds: float, user_id: Optional[int] = None):
+        day = self.days[_today()]
+        day.operations[(provider, operation)].add(input_tokens, output_tokens, cost, seconds)
+        if user_id is not None:
+            day.users[user_id].add(input_tokens, output_tokens, cost, seconds)
+
+    def record_prompt_parts(self, parts: Dict[str, int]):
+        day = self.days[_today()]
+        day.prompts += 1
+        for part, tokens in parts.items():
+            day.prompt_parts[part] += tokens
+
+    def prune(self, keep_days: int = KEEP_DAYS):
+        """Удаляет дни старше keep_days (задача планировщика)"""
+        oldest = (datetime.now() - timedelta(days=keep_days - 1)).strftime("%Y-%m-%d")
+        for day in [day for day in self.days if day < oldest]:
+            del self.days[day]
+
+    # ── Отчёт ─────────────────────────────────────────────────────────────────
+    def report(self, days: int = 1) -> str:
+        """Текст /usage за последние days дней (Markdown)"""
+        first = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        selected = [usage for day, usage in self.days.items() if day >= first]
+        period = "сегодня" if days == 1 else f"{days} дн. (с {first})"
+
+        operations: Dict[Tuple[str, str], Totals] = defaultdict(Totals)
+        users: Dict[int, Totals] = defaultdict(Totals)
+        prompt_parts: Dict[str, int] = defaultdict(int)
+        prompts = 0
+        for usage in selected:
+            for key, totals in usage.operations.items():
+                operations[key].merge(totals)
+            for user_id, totals in usage.users.items():
+                users[user_id].merge(totals)
+            for part, tokens in usage.prompt_parts.items():
+                prompt_parts[part] += tokens
+            prompts += usage.prompts
+
+        if not operations:
+            return f"💸 **Расход LLM за {period}:** вызовов не было."
+
+        total = Totals()
+        for totals in operations.values():
+            total.merge(totals)
+        text = f"💸 **Расход LLM за {period}**\n\nВсего: {total.line()}\n\n**По вызовам:**\n"
+        for (provider, operation), totals in sorted(operations.items(), key=lambda item: -item[1].cost_usd):
+            text += f"• {provider}/{operation}: {totals.line()}\n"
+
+        if prompts:
+            estimated = sum(prompt_parts.values()) or 1
+            text += f"\n**Вход Claude в среднем на вызов (оценка, ~{estimated // prompts} ток.):**\n"
+            for part in PROMPT_PARTS:
+                tokens = prompt_parts.get(part, 0)
+                text += f"• {_PART_TITLES[part]}: ~{tokens // prompts} ток. ({tokens / estimated:.0%})\n"
+
+        text += f"\n**Гости ({len(users)}), топ по стоимости:**\n"
+        for user_id, totals in sorted(users.items(), key=lambda item: -item[1].cost_usd)[:REPORT_TOP_USERS]:
+            name = self.names.get(user_id, "").translate(_MARKDOWN)
+            budget = self.budget_for(user_id)
+            limit = f" / ${budget:.2f} в день" if budget > 0 else ""
+            text += f"• {name} `{user_id}`: ${totals.cost_usd:.4f}{limit} · {totals.calls} выз.\n"
+
+        exhausted = sum(1 for user_id in users if not self.within_budget(user_id))
+        general = f"${self.daily_budget_usd:.2f} в день" if self.daily_budget_usd > 0 else "без лимита"
+        text += f"\n💰 Бюджет на гостя: {general}; исчерпан сегодня: {exhausted}"
+        if self.budgets:
+            text += f"; личных бюджетов: {len(self.budgets)}"
+        return text
+
+
+LEDGER = UsageLedger()
+
+
+# ── Точки учёта ───────────────────────────────────────────────────────────────
+def set_user(user_id: int, user_name: str = ""):
+    CURRENT_USER.set(user_id)
+    if user_name:
+        LEDGER.names[user_id] = user_name
+
+
+def within_budget(user_id: Optional[int] = None) -> bool:
+    """Можно ли сделать платный вызов для гостя (по умолчанию - текущего); отказ считается в метриках"""
+    allowed = LEDGER.within_budget(CURRENT_USER.get() if user_id is None else user_id)
+    if not allowed:
+        BUDGET_EXCEEDED.inc()
+    return allowed
+
+
+def _record(provider: str, operation: str, input_tokens: int, output_tokens: int, cost: float,
+            seconds: float, user_id: Optional[int]):
+    LLM_TOKENS.inc(input_tokens, provider=provider, operation=operation, direction="input")
+    LLM_TOKENS.inc(output_tokens, provider=provider, operation=operation, direction="output")
+    LLM_COST.inc(cost, provider=provider, operation=operation)
+    LEDGER.record(provider, operation, input_tokens, output_tokens, cost, seconds,
+                  CURRENT_USER.get() if user_id is None else user_id)
+
+
+def record_claude(operation: str, model: str, usage, seconds: float, user_id: Optional[int] = None):
+    """usage - response.usage Anthropic (input_tokens, output_tokens) или None"""
+    input_tokens = getattr(usage, "input_tokens", 0) or 0
+    output_tokens = getattr(usage, "output_tokens", 0) or 0
+    cost = model_routing.cost_usd(model, input_tokens, output_tokens)
+    _record("claude", operation, input_tokens, output_tokens, cost, seconds, user_id)
+
+
+def perplexity_cost_usd(model: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = PERPLEXITY_PRICES_PER_MTOK.get(model, (0.0, 0.0))
+    fee = PERPLEXITY_REQUEST_FEE.get(model, 0.0)
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000 + fee
+
+
+def record_perplexity(operation: str, data: Dict, seconds: float, user_id: Optional[int] = None):
+    """data - JSON ответа Perplexity (usage: prompt_tokens, completion_tokens)"""
+    usage = data.get("usage") or {}
+    input_tokens = usage.get("prompt_tokens", 0) or 0
+    output_tokens = usage.get("completion_tokens", 0) or 0
+    cost = perplexity_cost_usd(data.get("model", "sonar"), input_tokens, output_tokens)
+    _record("perplexity", operation, input_tokens, output_tokens, cost, seconds, user_id)
+
+
+def record_prompt_parts(**parts: int):
+    """Оценка токенов частей входа Claude: system, context, history, message"""
+    for part, tokens in parts.items():
+        PROMPT_PART_TOKENS.observe(tokens, part=part)
+    LEDGER.record_prompt_parts(parts)
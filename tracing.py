@@ -0,0 +1,265 @@
+"""
+Лёгкая трассировка апдейтов Weddy Bot
+Корневой спан на каждый апдейт Telegram, дочерние спаны на этапы:
+роутинг, поиск, Airtable, Claude/Perplexity, отправка сообщений.
+Готовые трейсы хранятся в памяти (для /traces) и экспортируются
+в JSONL-файл и/или OTLP/HTTP коллектор в формате OTLP JSON.
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("weddy_current_span", default=None)
+
+
+class Span:
+    """Один этап обработки: имя, время начала/конца и атрибуты"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = dict(attributes)
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """Все спаны одного апдейта"""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()  # дочерние спаны могут закрываться в потоках (asyncio.to_thread)
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class _NoopSpan:
+    """Заглушка вне активного трейса (например, загрузка каталогов при старте)"""
+
+    def set_attribute(self, key: str, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """Хранит последние трейсы и копит готовые к экспорту"""
+
+    def __init__(self, service_name: str = "weddy-bot", keep_recent: int = 200):
+        self.service_name = service_name
+        self.recent: deque = deque(maxlen=keep_recent)
+        self._pending: deque = deque(maxlen=5000)  # если экспорт отстаёт - теряем старые, но не растём бесконечно
+        self.file_path: Optional[str] = None
+        self.otlp_endpoint: Optional[str] = None
+
+    def configure(self, file_path: Optional[str] = None, otlp_endpoint: Optional[str] = None):
+        self.file_path = file_path or None
+        self.otlp_endpoint = otlp_endpoint or None
+
+    @property
+    def exporting(self) -> bool:
+        return bool(self.file_path or self.otlp_endpoint)
+
+    def finish(self, trace: Trace):
+        self.recent.append(trace)
+        if self.exporting:
+            self._pending.append(trace)
+
+    def slowest(self, limit: int = 5) -> List[Trace]:
+        """Самые медленные из последних трейсов"""
+        return sorted(self.recent, key=lambda t: t.root.duration_ms, reverse=True)[:limit]
+
+    def _otlp_payload(self, traces: List[Trace]) -> Dict:
+        spans = [span.to_otlp() for trace in traces for span in trace.spans]
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "weddy.tracing"}, "spans": spans}]
+            }]
+        }
+
+    async def flush(self):
+        """Экспортирует накопленные трейсы одним батчем"""
+        if not self._pending:
+            return
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        payload = self._otlp_payload(batch)
+
+        if self.file_path:
+            line = json.dumps(payload, ensure_ascii=False) + "\n"
+            try:
+                await asyncio.to_thread(self._append_to_file, line)
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось записать трейсы в {self.file_path}: {e}")
+
+        if self.otlp_endpoint:
+            import httpx
+            try:
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(self.otlp_endpoint, json=payload, timeout=5.0)
+                if response.status_code >= 300:
+                    logger.warning(f"⚠️ OTLP коллектор ответил {response.status_code}")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось отправить трейсы в OTLP коллектор: {e}")
+
+    def _append_to_file(self, line: str):
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+TRACER = Tracer()
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Открывает корневой спан нового трейса"""
+    trace = Trace()
+    root = Span(trace, name, None, attributes)
+    trace.add(root)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = type(e).__name__
+        raise
+    finally:
+        root.end_ns = time.time_ns()
+        _current_span.reset(token)
+        TRACER.finish(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Дочерний спан текущего трейса; вне трейса ничего не делает"""
+    parent = _current_span.get()
+    if parent is None:
+        yield _NOOP_SPAN
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    parent.trace.add(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def traced(name: Optional[str] = None):
+    """Декоратор: оборачивает функцию (обычную или async) в спан"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ── aiogram middlewares ───────────────────────────────────────────────────────
+async def update_middleware(handler, event, data):
+    """Outer middleware диспетчера: корневой спан на каждый апдейт"""
+    user = data.get("event_from_user")
+    attributes = {"update.id": getattr(event, "update_id", 0), "update.type": getattr(event, "event_type", "unknown")}
+    if user is not None:
+        attributes["user.id"] = user.id
+    with start_trace("telegram.update", **attributes):
+        return await handler(event, data)
+
+
+async def handler_middleware(handler, event, data):
+    """Inner middleware роутера: спан с именем выбранного хендлера"""
+    callback = getattr(data.get("handler"), "callback", None)
+    handler_name = getattr(callback, "__name__", "unknown")
+    parent = _current_span.get()
+    if parent is not None:
+        parent.trace.root.set_attribute("handler", handler_name)
+    with span(f"handler.{handler_name}"):
+        return await handler(event, data)
+
+
+def format_trace(trace: Trace, max_spans: int = 12) -> str:
+    """Текстовое представление трейса для админа: корень и самые долгие этапы"""
+    root = trace.root
+    handler = root.attributes.get("handler", root.name)
+    user_id = root.attributes.get("user.id", "?")
+    started = time.strftime("%d.%m %H:%M:%S", time.localtime(root.start_ns / 1e9))
+    lines = [f"⏱ {root.duration_ms:.0f} ms · {handler} · user {user_id} · {started}"]
+    children = sorted(trace.spans[1:], key=lambda s: s.duration_ms, reverse=True)[:max_spans]
+    for child in children:
+        mark = " ❌" if child.error else ""
+        lines.append(f"  └ {child.name}: {child.duration_ms:.0f} ms{mark}")
+    return "\n".join(lines)
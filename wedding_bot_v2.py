@@ -5,24 +5,34 @@ from datetime import datetime
 from pathlib import Path
 from decouple import Config, RepositoryEnv, AutoConfig
 from aiogram import Bot, Dispatcher, F, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, BotCommand, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, WebAppInfo
-import anthropic
-from pyairtable import Api
-import httpx
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, BotCommand, BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, WebAppInfo
 from collections import defaultdict
-import csv
 import io
-from smart_search import SmartBaliBot
-from smart_yoga import SmartYogaBot
-from smart_hotels import SmartHotelsBot
-from smart_breakfast import SmartBreakfastBot
-from smart_spa import SmartSpaBot
-from smart_shopping import SmartShoppingBot
-from smart_art import SmartArtBot
+import sys
+import time
+# anthropic, pyairtable, httpx и модули каталогов импортируются лениво (см. startup.py)
+import startup
+import metrics
+import tracing
+import geo
+import guest_stats
+import guest_store
+import guest_export
+import model_routing
+import prompt_retrieval
+import token_usage
+from scheduler import SCHEDULER
+from query_routing import (
+    needs_perplexity_search, get_search_topic, is_restaurant_query,
+    is_yoga_query, is_hotel_query, extract_location, parse_proximity_query
+)
+from place_rendering import render_category_results, render_nearby, render_proximity, render_place_card
 
 # ── Логирование ────────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -32,6 +42,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ── Настройки из .env.wedding или переменных окружения ───────────────────────
+# Ошибка загрузки не роняет импорт: её проверяет validate_settings() в main()
+SETTINGS_ERROR = None
 try:
     # Пробуем загрузить из .env.wedding (локально)
     env_path = Path(__file__).parent / '.env.wedding'
@@ -52,6 +64,38 @@ try:
         AIRTABLE_SHOPPING_TABLE = config('AIRTABLE_SHOPPING_TABLE')
         AIRTABLE_ART_TABLE = config('AIRTABLE_ART_TABLE')
         PERPLEXITY_KEY = config('PERPLEXITY_API_KEY')
+        METRICS_HOST = config('METRICS_HOST', default='127.0.0.1')
+        METRICS_PORT = int(config('METRICS_PORT', default='9108'))
+        TRACING_FILE = config('TRACING_FILE', default='')
+        TRACING_OTLP_ENDPOINT = config('TRACING_OTLP_ENDPOINT', default='')
+        # Адреса внешних API (переопределяются для нагрузочного теста с локальными заглушками)
+        TELEGRAM_API_URL = config('TELEGRAM_API_URL', default='')
+        ANTHROPIC_BASE_URL = config('ANTHROPIC_BASE_URL', default='')
+        PERPLEXITY_API_URL = config('PERPLEXITY_API_URL', default='https://api.perplexity.ai/chat/completions')
+        AIRTABLE_ENDPOINT_URL = config('AIRTABLE_ENDPOINT_URL', default='https://api.airtable.com')
+        # Режим старта: lazy - polling сразу, каталоги грузятся в фоне; eager - сначала всё загрузить
+        STARTUP_MODE = config('STARTUP_MODE', default='lazy')
+        READY_FILE = config('READY_FILE', default='')
+        # Свадебная площадка: точка отсчёта для вопросов "что рядом" (координаты - "lat, lng")
+        VENUE_NAME = config('VENUE_NAME', default='Bali Beach Glamping')
+        VENUE_COORDINATES = config('VENUE_COORDINATES', default='-8.5917, 115.0873')
+        # Локальный реестр гостей (SQLite): регистрации пишутся сюда, в Airtable - фоном пачками
+        GUEST_DB_PATH = config('GUEST_DB_PATH', default='weddy_guests.db')
+        # Плановая перезагрузка каталогов из Airtable, секунды (0 - только по /reload)
+        CATALOG_RELOAD_INTERVAL = int(config('CATALOG_RELOAD_INTERVAL', default='3600'))
+        # Вебхуки Airtable: публичный адрес приёмника (пусто - выключены) и где его слушать.
+        # С вебхуками каталоги обновляются по изменённым записям, плановая перезагрузка не нужна
+        AIRTABLE_WEBHOOK_URL = config('AIRTABLE_WEBHOOK_URL', default='')
+        AIRTABLE_WEBHOOK_HOST = config('AIRTABLE_WEBHOOK_HOST', default='0.0.0.0')
+        AIRTABLE_WEBHOOK_PORT = int(config('AIRTABLE_WEBHOOK_PORT', default='8090'))
+        # Модели Claude: быстрая - для коротких и обычных вопросов, сильная - для планов и сложных запросов
+        CLAUDE_FAST_MODEL = config('CLAUDE_FAST_MODEL', default='claude-3-5-haiku-20241022')
+        CLAUDE_STRONG_MODEL = config('CLAUDE_STRONG_MODEL', default='claude-sonnet-4-20250514')
+        # Системный промпт собирается под вопрос: жёсткий бюджет (оценка токенов) и доля на результат поиска
+        PROMPT_TOKEN_BUDGET = int(config('PROMPT_TOKEN_BUDGET', default='2000'))
+        PROMPT_CONTEXT_TOKENS = int(config('PROMPT_CONTEXT_TOKENS', default='600'))
+        # Дневной бюджет на гостя для Claude и Perplexity, USD (0 - без лимита; /budget - личные бюджеты)
+        USER_DAILY_BUDGET_USD = float(config('USER_DAILY_BUDGET_USD', default='0.50'))
     else:
         # Используем переменные окружения напрямую (Railway, Render, etc.)
         logger.info("✅ Настройки загружены из переменных окружения")
@@ -69,6 +113,38 @@ try:
         AIRTABLE_SHOPPING_TABLE = os.getenv('AIRTABLE_SHOPPING_TABLE')
         AIRTABLE_ART_TABLE = os.getenv('AIRTABLE_ART_TABLE')
         PERPLEXITY_KEY = os.getenv('PERPLEXITY_API_KEY')
+        METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+        METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+        TRACING_FILE = os.getenv('TRACING_FILE', '')
+        TRACING_OTLP_ENDPOINT = os.getenv('TRACING_OTLP_ENDPOINT', '')
+        # Адреса внешних API (переопределяются для нагрузочного теста с локальными заглушками)
+        TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+        ANTHROPIC_BASE_URL = os.getenv('ANTHROPIC_BASE_URL', '')
+        PERPLEXITY_API_URL = os.getenv('PERPLEXITY_API_URL', 'https://api.perplexity.ai/chat/completions')
+        AIRTABLE_ENDPOINT_URL = os.getenv('AIRTABLE_ENDPOINT_URL', 'https://api.airtable.com')
+        # Режим старта: lazy - polling сразу, каталоги грузятся в фоне; eager - сначала всё загрузить
+        STARTUP_MODE = os.getenv('STARTUP_MODE', 'lazy')
+        READY_FILE = os.getenv('READY_FILE', '')
+        # Свадебная площадка: точка отсчёта для вопросов "что рядом" (координаты - "lat, lng")
+        VENUE_NAME = os.getenv('VENUE_NAME', 'Bali Beach Glamping')
+        VENUE_COORDINATES = os.getenv('VENUE_COORDINATES', '-8.5917, 115.0873')
+        # Локальный реестр гостей (SQLite): регистрации пишутся сюда, в Airtable - фоном пачками
+        GUEST_DB_PATH = os.getenv('GUEST_DB_PATH', 'weddy_guests.db')
+        # Плановая перезагрузка каталогов из Airtable, секунды (0 - только по /reload)
+        CATALOG_RELOAD_INTERVAL = int(os.getenv('CATALOG_RELOAD_INTERVAL', '3600'))
+        # Вебхуки Airtable: публичный адрес приёмника (пусто - выключены) и где его слушать.
+        # С вебхуками каталоги обновляются по изменённым записям, плановая перезагрузка не нужна
+        AIRTABLE_WEBHOOK_URL = os.getenv('AIRTABLE_WEBHOOK_URL', '')
+        AIRTABLE_WEBHOOK_HOST = os.getenv('AIRTABLE_WEBHOOK_HOST', '0.0.0.0')
+        AIRTABLE_WEBHOOK_PORT = int(os.getenv('AIRTABLE_WEBHOOK_PORT', '8090'))
+        # Модели Claude: быстрая - для коротких и обычных вопросов, сильная - для планов и сложных запросов
+        CLAUDE_FAST_MODEL = os.getenv('CLAUDE_FAST_MODEL', 'claude-3-5-haiku-20241022')
+        CLAUDE_STRONG_MODEL = os.getenv('CLAUDE_STRONG_MODEL', 'claude-sonnet-4-20250514')
+        # Системный промпт собирается под вопрос: жёсткий бюджет (оценка токенов) и доля на результат поиска
+        PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '2000'))
+        PROMPT_CONTEXT_TOKENS = int(os.getenv('PROMPT_CONTEXT_TOKENS', '600'))
+        # Дневной бюджет на гостя для Claude и Perplexity, USD (0 - без лимита; /budget - личные бюджеты)
+        USER_DAILY_BUDGET_USD = float(os.getenv('USER_DAILY_BUDGET_USD', '0.50'))
 
     logger.info("✅ Все настройки загружены успешно")
 
@@ -77,70 +153,352 @@ try:
     logger.info(f"🔍 AIRTABLE_BASE_ID = '{AIRTABLE_BASE_ID}' (type: {type(AIRTABLE_BASE_ID)})")
     logger.info(f"🔍 BOT_TOKEN length = {len(BOT_TOKEN) if BOT_TOKEN else 0}")
 
-    # Проверяем что все критичные переменные установлены
+except Exception as e:
+    SETTINGS_ERROR = e
+
+def validate_settings():
+    """Проверяем что все критичные переменные установлены (вызывается из main, не при импорте)"""
+    if SETTINGS_ERROR is not None:
+        logger.error(f"❌ Ошибка загрузки настроек: {SETTINGS_ERROR}")
+        sys.exit(1)
     if not BOT_TOKEN:
         logger.error("❌ WEDDING_BOT_TOKEN не установлен!")
-        exit(1)
+        sys.exit(1)
     if not AIRTABLE_TABLE_NAME:
         logger.error("❌ AIRTABLE_TABLE_NAME не установлен!")
         logger.error(f"Доступные переменные окружения: {list(os.environ.keys())}")
-        exit(1)
+        sys.exit(1)
     if not AIRTABLE_BASE_ID:
         logger.error("❌ AIRTABLE_BASE_ID не установлен!")
-        exit(1)
-
-except Exception as e:
-    logger.error(f"❌ Ошибка загрузки настроек: {e}")
-    exit(1)
+        sys.exit(1)
 
 # ── API Clients ───────────────────────────────────────────────────────────────
-claude_client = anthropic.AsyncAnthropic(api_key=CLAUDE_KEY)
-airtable_api = Api(AIRTABLE_TOKEN)
-guests_table = airtable_api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME)
+# Клиенты создаются при первом обращении (или фоновым прогревом после старта),
+# поэтому импорт модуля не тянет anthropic/pyairtable и не ходит в Airtable
+def _create_claude_client():
+    import anthropic
+    return anthropic.AsyncAnthropic(api_key=CLAUDE_KEY, base_url=ANTHROPIC_BASE_URL or None)
+
+def _create_guests_table():
+    import airtable_client
+    api = airtable_client.shared_api(AIRTABLE_TOKEN, AIRTABLE_ENDPOINT_URL)
+    return api.table(AIRTABLE_BASE_ID, AIRTABLE_TABLE_NAME, priority=airtable_client.GUESTS)
+
+claude_client = startup.Lazy("claude_client", _create_claude_client)
+guests_table = startup.Lazy("guests_table", _create_guests_table)
+
+def _create_guest_registry():
+    return guest_store.GuestStore(GUEST_DB_PATH)
+
+guest_registry = startup.Lazy("guest_registry", _create_guest_registry)
 
 # ── Smart Search Bots ─────────────────────────────────────────────────────────
-smart_bot = SmartBaliBot(
-    perplexity_api_key=PERPLEXITY_KEY,
-    airtable_token=AIRTABLE_TOKEN,
-    airtable_base_id=AIRTABLE_BASE_ID,
-    restaurants_table_name=AIRTABLE_RESTAURANTS_TABLE
-)
+# Каждый бот при создании загружает свою таблицу из Airtable
+def _create_smart_bot():
+    from smart_search import SmartBaliBot
+    return SmartBaliBot(
+        perplexity_api_key=PERPLEXITY_KEY,
+        airtable_token=AIRTABLE_TOKEN,
+        airtable_base_id=AIRTABLE_BASE_ID,
+        restaurants_table_name=AIRTABLE_RESTAURANTS_TABLE,
+        airtable_endpoint_url=AIRTABLE_ENDPOINT_URL,
+        perplexity_api_url=PERPLEXITY_API_URL
+    )
 
-yoga_bot = SmartYogaBot(
-    airtable_token=AIRTABLE_TOKEN,
-    airtable_base_id=AIRTABLE_BASE_ID,
-    yoga_table_name=AIRTABLE_YOGA_TABLE
-)
+def _create_yoga_bot():
+    from smart_yoga import SmartYogaBot
+    return SmartYogaBot(
+        airtable_token=AIRTABLE_TOKEN,
+        airtable_base_id=AIRTABLE_BASE_ID,
+        yoga_table_name=AIRTABLE_YOGA_TABLE,
+        airtable_endpoint_url=AIRTABLE_ENDPOINT_URL
+    )
 
-hotels_bot = SmartHotelsBot(
-    airtable_token=AIRTABLE_TOKEN,
-    airtable_base_id=AIRTABLE_BASE_ID,
-    hotels_table_name=AIRTABLE_HOTELS_TABLE
-)
+def _create_hotels_bot():
+    from smart_hotels import SmartHotelsBot
+    return SmartHotelsBot(
+        airtable_token=AIRTABLE_TOKEN,
+        airtable_base_id=AIRTABLE_BASE_ID,
+        hotels_table_name=AIRTABLE_HOTELS_TABLE,
+        airtable_endpoint_url=AIRTABLE_ENDPOINT_URL
+    )
 
-breakfast_bot = SmartBreakfastBot(
-    airtable_token=AIRTABLE_TOKEN,
-    airtable_base_id=AIRTABLE_BASE_ID,
-    breakfast_table_name=AIRTABLE_BREAKFAST_TABLE
-)
+def _create_breakfast_bot():
+    from smart_breakfast import SmartBreakfastBot
+    return SmartBreakfastBot(
+        airtable_token=AIRTABLE_TOKEN,
+        airtable_base_id=AIRTABLE_BASE_ID,
+        breakfast_table_name=AIRTABLE_BREAKFAST_TABLE,
+        airtable_endpoint_url=AIRTABLE_ENDPOINT_URL
+    )
 
-spa_bot = SmartSpaBot(
-    airtable_token=AIRTABLE_TOKEN,
-    airtable_base_id=AIRTABLE_BASE_ID,
-    spa_table_name=AIRTABLE_SPA_TABLE
-)
+def _create_spa_bot():
+    from smart_spa import SmartSpaBot
+    return SmartSpaBot(
+        airtable_token=AIRTABLE_TOKEN,
+        airtable_base_id=AIRTABLE_BASE_ID,
+        spa_table_name=AIRTABLE_SPA_TABLE,
+        airtable_endpoint_url=AIRTABLE_ENDPOINT_URL
+    )
 
-shopping_bot = SmartShoppingBot(
-    airtable_token=AIRTABLE_TOKEN,
-    airtable_base_id=AIRTABLE_BASE_ID,
-    shopping_table_name=AIRTABLE_SHOPPING_TABLE
-)
+def _create_shopping_bot():
+    from smart_shopping import SmartShoppingBot
+    return SmartShoppingBot(
+        airtable_token=AIRTABLE_TOKEN,
+        airtable_base_id=AIRTABLE_BASE_ID,
+        shopping_table_name=AIRTABLE_SHOPPING_TABLE,
+        airtable_endpoint_url=AIRTABLE_ENDPOINT_URL
+    )
 
-art_bot = SmartArtBot(
-    airtable_token=AIRTABLE_TOKEN,
-    airtable_base_id=AIRTABLE_BASE_ID,
-    art_table_name=AIRTABLE_ART_TABLE
-)
+def _create_art_bot():
+    from smart_art import SmartArtBot
+    return SmartArtBot(
+        airtable_token=AIRTABLE_TOKEN,
+        airtable_base_id=AIRTABLE_BASE_ID,
+        art_table_name=AIRTABLE_ART_TABLE,
+        airtable_endpoint_url=AIRTABLE_ENDPOINT_URL
+    )
+
+smart_bot = startup.Lazy("smart_bot", _create_smart_bot)
+yoga_bot = startup.Lazy("yoga_bot", _create_yoga_bot)
+hotels_bot = startup.Lazy("hotels_bot", _create_hotels_bot)
+breakfast_bot = startup.Lazy("breakfast_bot", _create_breakfast_bot)
+spa_bot = startup.Lazy("spa_bot", _create_spa_bot)
+shopping_bot = startup.Lazy("shopping_bot", _create_shopping_bot)
+art_bot = startup.Lazy("art_bot", _create_art_bot)
+
+# Бот каталога по категории меню
+CATALOG_BOTS = {
+    "restaurants": smart_bot,
+    "yoga": yoga_bot,
+    "hotels": hotels_bot,
+    "breakfast": breakfast_bot,
+    "spa": spa_bot,
+    "shopping": shopping_bot,
+    "art": art_bot,
+}
+
+# Ключ списка мест в ответе search_* бота категории (рестораны считают попадания сами - в search_restaurants)
+CURATED_RESULT_KEYS = {
+    "yoga": "curated_studios",
+    "hotels": "curated_hotels",
+    "breakfast": "curated_cafes",
+    "spa": "curated_spas",
+    "shopping": "curated_shops",
+    "art": "curated_art",
+}
+
+# ── Расстояния до площадки и отелей ──────────────────────────────────────────
+def _proximity_table(categories=None):
+    """
+    Таблица "что рядом": точки отсчёта из каталога отелей, соседи - по загруженным каталогам categories
+    (None - все загруженные, () - только точки отсчёта). None - нет координат площадки или каталога отелей
+    """
+    import proximity
+
+    coordinates = geo.parse_coordinates(VENUE_COORDINATES)
+    if coordinates is None or not hotels_bot.built:
+        return None
+    catalogs = {
+        category: CATALOG_BOTS[category].geo_index
+        for category in (CATALOG_BOTS if categories is None else categories) if CATALOG_BOTS[category].built
+    }
+    return proximity.table_for(hotels_bot.hotels_db, (VENUE_NAME, *coordinates), catalogs)
+
+async def answer_proximity_query(user_message: str) -> str | None:
+    """Ответ на "ужин рядом с нашим отелем" из таблицы расстояний; None - не такой запрос или точка не найдена"""
+    parsed = parse_proximity_query(user_message)
+    if parsed is None:
+        return None
+    categories, anchor_text = parsed
+    if not anchor_text:
+        return None
+
+    # Сначала точка отсчёта - для неё нужен только каталог отелей; остальные каталоги грузим, если она нашлась
+    await startup.ensure(hotels_bot)
+    # Сборка таблицы после загрузки каталога занимает время - не в event loop
+    table = await asyncio.to_thread(_proximity_table, ())
+    anchor = table.find_anchor(anchor_text) if table else None
+    if anchor is None:
+        return None
+
+    wanted = categories or list(CATALOG_BOTS)
+    await startup.ensure(*(CATALOG_BOTS[category] for category in wanted))
+    updated = await asyncio.to_thread(_proximity_table, wanted)
+    if updated is not table:
+        # Каталог отелей перезагрузился, пока грузились остальные - точка отсчёта из новой таблицы
+        table, anchor = updated, updated.find_anchor(anchor_text)
+        if anchor is None:
+            return None
+
+    logger.info(f"📍 Proximity query: {categories or 'все категории'} near {anchor.name}")
+    k = 5 if len(categories) == 1 else 3
+    nearby = {category: table.nearby(anchor, category, k) for category in wanted}
+    return render_proximity(anchor.name, nearby)
+
+# ── Карточка места по названию ────────────────────────────────────────────────
+# Атрибут каталога у бота каждой категории
+CATALOG_DB_ATTRS = {
+    "restaurants": "restaurants_db",
+    "yoga": "studios_db",
+    "hotels": "hotels_db",
+    "breakfast": "cafes_db",
+    "spa": "spas_db",
+    "shopping": "shops_db",
+    "art": "art_db",
+}
+# Длинное сообщение - это вопрос, а не название места
+PLACE_LOOKUP_MAX_WORDS = 8
+
+def _place_name_index():
+    """Индекс названий уже загруженных каталогов (не ждём каталоги, которые ещё грузятся)"""
+    import place_names
+
+    catalogs = {
+        category: getattr(catalog_bot, CATALOG_DB_ATTRS[category])
+        for category, catalog_bot in CATALOG_BOTS.items() if catalog_bot.built
+    }
+    return place_names.index_for(catalogs)
+
+async def answer_place_lookup(user_message: str) -> str | None:
+    """Гость назвал место ("Locavor", "Кинг Кол") - карточка из каталога без LLM; None - название не найдено"""
+    if len(user_message.split()) > PLACE_LOOKUP_MAX_WORDS:
+        return None
+    # Сборка индекса после загрузки каталога - не в event loop
+    index = await asyncio.to_thread(_place_name_index)
+    match = index.lookup(user_message)
+    if match is None:
+        return None
+    logger.info(f"📇 Place lookup: '{user_message}' -> {match.place['name']} ({match.category}, опечаток: {match.distance})")
+    return render_place_card(match.category, match.area, match.place)
+
+# ── Перезагрузка каталогов ────────────────────────────────────────────────────
+# Новый снимок каталога строится в потоке и подменяется целиком (catalog_reload.ReloadableCatalog):
+# хендлеры не ждут перезагрузку и видят либо старый каталог, либо новый
+async def reload_catalogs(categories=None, only_built: bool = False) -> dict:
+    """Перезагружает каталоги параллельно; {категория: число мест или исключение}"""
+    categories = [
+        category for category in (categories or CATALOG_BOTS)
+        if not only_built or CATALOG_BOTS[category].built
+    ]
+
+    async def reload_one(category):
+        catalog_bot = CATALOG_BOTS[category]
+        if not catalog_bot.built:
+            # Ещё не загружен - первая загрузка и есть свежий снимок
+            await startup.ensure(catalog_bot)
+            return catalog_bot.catalog_size
+        return await catalog_bot.reload()
+
+    results = await asyncio.gather(*(reload_one(category) for category in categories), return_exceptions=True)
+    await rebuild_catalog_indexes()
+    return dict(zip(categories, results))
+
+async def rebuild_catalog_indexes():
+    """Таблица расстояний и индекс названий привязаны к объектам каталогов - пересобираем под новые снимки"""
+    try:
+        await asyncio.to_thread(_proximity_table)
+        await asyncio.to_thread(_place_name_index)
+    except Exception as e:
+        logger.error(f"⚠️ Proximity table / place name index rebuild error: {e}")
+
+async def scheduled_catalog_reload():
+    """Плановая перезагрузка уже загруженных каталогов (незагруженные подтянутся при первом обращении)"""
+    start = time.perf_counter()
+    results = await reload_catalogs(only_built=True)
+    for category, result in results.items():
+        if isinstance(result, Exception):
+            logger.error(f"❌ Scheduled reload of {category} failed, keeping previous catalog: {result}")
+    logger.info(f"🔄 Scheduled catalog reload: {len(results)} catalogs in {time.perf_counter() - start:.1f} s")
+
+# ── Вебхуки Airtable ──────────────────────────────────────────────────────────
+def _airtable_api():
+    import airtable_client
+
+    return airtable_client.shared_api(AIRTABLE_TOKEN, AIRTABLE_ENDPOINT_URL)
+
+async def start_catalog_webhooks():
+    """Приёмник вебхуков Airtable и фоновая регистрация вебхука; (runner приёмника, задача)"""
+    import catalog_webhooks
+
+    catalog_tables = {
+        "restaurants": AIRTABLE_RESTAURANTS_TABLE,
+        "yoga": AIRTABLE_YOGA_TABLE,
+        "hotels": AIRTABLE_HOTELS_TABLE,
+        "breakfast": AIRTABLE_BREAKFAST_TABLE,
+        "spa": AIRTABLE_SPA_TABLE,
+        "shopping": AIRTABLE_SHOPPING_TABLE,
+        "art": AIRTABLE_ART_TABLE,
+    }
+    webhooks = catalog_webhooks.CatalogWebhooks(
+        _airtable_api, AIRTABLE_BASE_ID, AIRTABLE_WEBHOOK_URL,
+        {category: (catalog_tables[category], catalog_bot) for category, catalog_bot in CATALOG_BOTS.items()},
+        on_change=rebuild_catalog_indexes,
+    )
+    runner = await webhooks.start_receiver(AIRTABLE_WEBHOOK_HOST, AIRTABLE_WEBHOOK_PORT)
+    # Подбор пропущенных сигналов и продление вебхука
+    SCHEDULER.every("airtable_webhook_sync", catalog_webhooks.SYNC_INTERVAL, webhooks.sync)
+    SCHEDULER.every("airtable_webhook_refresh", catalog_webhooks.REFRESH_INTERVAL, webhooks.extend)
+    return runner, asyncio.create_task(webhooks.run())
+
+# ── Реестр и статистика гостей ────────────────────────────────────────────────
+# Регистрации коммитятся в локальный реестр и сразу подтверждаются, в Airtable их пачками пишет GUEST_WRITER.
+# Агрегаты для /stats: загрузка из реестра один раз, дальше - по записи при регистрации и сверке с Airtable
+GUEST_STATS = guest_stats.GuestStats()
+_guest_stats_lock = asyncio.Lock()
+_guest_registry_lock = asyncio.Lock()
+_guest_registry_reconciled = False
+# Повторы после ошибок Airtable: планировщик раз в GUEST_SYNC_INTERVAL секунд проверяет очередь
+GUEST_SYNC_INTERVAL = 5.0
+
+async def _guest_sync_table():
+    """
+    Таблица для GUEST_WRITER - только после сверки с Airtable: запись, которую Airtable принял перед падением,
+    сверка отмечает как созданную; отправка до сверки создала бы её второй раз. Сверка не удалась - None,
+    повтор (и новая попытка сверки) - на следующем guest_sync_retry
+    """
+    await ensure_guest_registry()
+    if not _guest_registry_reconciled:
+        return None
+    return guests_table
+
+GUEST_WRITER = guest_store.GuestWriter(guest_registry, _guest_sync_table, interval=None)
+
+async def ensure_guest_registry():
+    """Реестр гостей; первый вызов сверяет его с Airtable. Airtable недоступен - работаем с локальными данными"""
+    global _guest_registry_reconciled
+    await startup.ensure(guest_registry)
+    if _guest_registry_reconciled:
+        return guest_registry
+    async with _guest_registry_lock:
+        if not _guest_registry_reconciled:
+            try:
+                await startup.ensure(guests_table)
+                changed = await asyncio.to_thread(guest_store.reconcile, guests_table, guest_registry)
+                _guest_registry_reconciled = True
+                for record in changed:
+                    GUEST_STATS.apply(record)
+                # Записи, не ушедшие в Airtable до перезапуска
+                GUEST_WRITER.notify()
+            except Exception as e:
+                logger.error(f"⚠️ Guest registry reconcile failed, using local data: {e}")
+    return guest_registry
+
+async def find_guest(telegram_id: int) -> dict | None:
+    """Анкета гостя по Telegram ID (индекс в памяти реестра); None - гость не регистрировался"""
+    registry = await ensure_guest_registry()
+    return registry.find(telegram_id)
+
+async def ensure_guest_stats() -> guest_stats.GuestStats:
+    """Статистика гостей; первый вызов загружает все записи реестра (не в event loop)"""
+    if GUEST_STATS.loaded:
+        return GUEST_STATS
+    async with _guest_stats_lock:
+        if not GUEST_STATS.loaded:
+            registry = await ensure_guest_registry()
+            GUEST_STATS.load(await asyncio.to_thread(registry.records))
+            logger.info(f"📊 Guest stats loaded: {GUEST_STATS.total_guests} guests, {GUEST_STATS.total_people} people")
+    return GUEST_STATS
 
 # ── История сообщений для контекста ───────────────────────────────────────────
 # Хранит последние N сообщений для каждого пользователя
@@ -155,6 +513,13 @@ ADMIN_ID = 162577592  # Fedor's Telegram ID
 perplexity_usage = defaultdict(lambda: defaultdict(int))
 MAX_PERPLEXITY_REQUESTS_PER_DAY = 3  # Лимит: 3 запроса в день на пользователя
 
+# ── LLM Budget ────────────────────────────────────────────────────────────────
+# Учёт токенов и стоимости по гостям и дням - token_usage.LEDGER (бюджет задаётся в main)
+LLM_BUDGET_EXCEEDED_TEXT = (
+    "На сегодня я исчерпал лимит развёрнутых ответов для вас. "
+    "Команды /menu, /tips и /contacts работают как обычно, а завтра я снова в строю."
+)
+
 # ── User tracking for broadcast ───────────────────────────────────────────────
 # Множество всех user_id, которые когда-либо писали боту
 all_users = set()
@@ -162,6 +527,9 @@ all_users = set()
 # ── Conversation History ──────────────────────────────────────────────────────
 # Хранилище истории разговоров: {user_id: [messages]}
 conversation_history = {}
+# Последний ответ пользователю (unix time): история молчащих дольше HISTORY_IDLE_TTL удаляется
+conversation_last_active = {}
+HISTORY_IDLE_TTL = 12 * 3600
 
 # ── FSM States ────────────────────────────────────────────────────────────────
 class GuestRegistration(StatesGroup):
@@ -176,7 +544,7 @@ class GuestRegistration(StatesGroup):
 
 # ── Bot & Dispatcher ──────────────────────────────────────────────────────────
 storage = MemoryStorage()
-bot = Bot(token=BOT_TOKEN)
+bot: Bot | None = None  # создаётся в setup_dispatcher(): Bot проверяет токен, а импорт не должен падать
 dp = Dispatcher(storage=storage)
 router = Router()
 
@@ -400,33 +768,33 @@ WEDDY_SYSTEM_PROMPT = """Ты — Weddy AI, личный консьерж для
 **Скажи:** "Дресс-код Ethno-Elegance. Что это значит? Честно, даже я не уверен на 100%, но думайте 'красиво, но чтобы можно было танцевать на песке'. Этно-мотивы приветствуются."
 """
 
-# ── Helper: Проверка нужен ли поиск через Perplexity ─────────────────────────
-def needs_perplexity_search(question: str) -> bool:
-    """Определяет, нужен ли актуальный поиск через Perplexity"""
-
-    # Исключения - НЕ использовать Perplexity если вопрос о свадьбе
-    wedding_keywords = ['свадьб', 'wedding', 'церемони', 'ceremony', 'праздник', 'celebration']
-    question_lower = question.lower()
-
-    # Если вопрос о свадьбе - не ищем через Perplexity
-    if any(kw in question_lower for kw in wedding_keywords):
-        return False
-
-    # Ключевые слова для поиска актуальной информации о Бали
-    search_keywords = [
-        'погода', 'weather', 'температура', 'temperature',
-        'ресторан', 'restaurant', 'кафе', 'cafe', 'еда', 'food',
-        'посетить', 'visit', 'достопримечательност', 'attractions',
-        'что посмотреть', 'what to see', 'what to do',
-        'отель', 'hotel', 'где остановиться', 'where to stay', 'accommodation',
-        'цены', 'prices', 'стоимость', 'cost', 'сколько стоит', 'how much',
-        'такси', 'taxi', 'транспорт', 'transport', 'transfer',
-        'экскурси', 'excursion', 'тур', 'tour',
-        'убуд', 'ubud', 'чангу', 'canggu', 'улувату', 'uluwatu',
-        'пляж', 'beach', 'spa', 'спа', 'йога', 'yoga'
-    ]
+# ── Отбор разделов промпта под вопрос ─────────────────────────────────────────
+# Стиль и факты о свадьбе нужны в каждом ответе; остальное - только если подходит к вопросу
+PROMPT_PINNED_SECTIONS = ("ТВОЙ СТИЛЬ", "ФАКТЫ О СВАДЬБЕ")
+# Слова, которыми гости спрашивают о разделе, но которых нет в его тексте (раздел или жирный подзаголовок)
+PROMPT_SECTION_TOPICS = {
+    "RSVP": "регистрация зарегистрироваться анкета форма подтвердить участие приеду приедем register",
+    "ЧТО ТЫ ДЕЛАЕШЬ": "умеешь можешь бот функции команды",
+    "КОНТАКТЫ": "организатор связаться позвонить звонить телефон номер помощь проблема случилось пошло водитель машина такси трансфер "
+                "contact phone call organizer help driver car taxi",
+    "Деньги": "обмен обменять поменять обменник курс рупии валюта наличные доллары money exchange cash",
+    "Балийский разговорник": "язык фразы слова индонезийский балийский разговорник сказать language phrases",
+    "Торговля": "торговаться торг рынок скидка цена дорого bargain market",
+    "Навигация": "дорога направление найти заблудился потерялся directions",
+    "В ресторане": "еда острое заказать официант food spicy",
+    "Экстренный": "экстренный помогите срочно emergency",
+}
+
+def _create_prompt_index():
+    return prompt_retrieval.PromptIndex(
+        WEDDY_SYSTEM_PROMPT,
+        pinned=PROMPT_PINNED_SECTIONS,
+        topics=PROMPT_SECTION_TOPICS,
+        budget=PROMPT_TOKEN_BUDGET,
+        context_tokens=PROMPT_CONTEXT_TOKENS,
+    )
 
-    return any(keyword in question_lower for keyword in search_keywords)
+prompt_index = startup.Lazy("prompt_index", _create_prompt_index)
 
 # ── Helper: Поиск через Perplexity ────────────────────────────────────────────
 async def search_perplexity(query: str, user_id: int) -> str | None:
@@ -437,6 +805,9 @@ async def search_perplexity(query: str, user_id: int) -> str | None:
     if perplexity_usage[user_id][today] >= MAX_PERPLEXITY_REQUESTS_PER_DAY:
         logger.info(f"⚠️ User {user_id} exceeded Perplexity limit for today")
         return None
+    if not token_usage.within_budget(user_id):
+        logger.info(f"💸 User {user_id} exceeded daily LLM budget, skipping Perplexity")
+        return None
 
     # System prompt для Perplexity
     perplexity_system_prompt = """You are an expert Bali travel curator specializing in discovering new and trending places.
@@ -468,46 +839,53 @@ Search strategy:
 - Cross-reference multiple sources
 - Prioritize recent reviews and updates from 2024-2025"""
 
+    import httpx
+
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.perplexity.ai/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {PERPLEXITY_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "sonar",  # Быстрая модель с веб-поиском
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": perplexity_system_prompt
-                        },
-                        {
-                            "role": "user",
-                            "content": f"Bali 2024-2025: {query}"
-                        }
-                    ],
-                    # КОНТРОЛЬ КРЕАТИВНОСТИ
-                    "temperature": 0.2,        # Низкое = факты, не креатив
-                    "top_p": 0.9,              # Nucleus sampling
-                    "top_k": 0,                # Выключено
-
-                    # КОНТРОЛЬ ДЛИНЫ
-                    "max_tokens": 500,         # Увеличил до 500 для деталей
-
-                    # КОНТРОЛЬ ПОВТОРЕНИЙ
-                    "presence_penalty": 0.0,   # Без штрафа
-                    "frequency_penalty": 1.0,  # Штраф за частоту слов (против повторений)
-
-                    # STREAMING
-                    "stream": False            # Без потоковой передачи
-                },
-                timeout=20.0  # Увеличил timeout
-            )
+            start = time.perf_counter()
+            with metrics.track_upstream("perplexity", "general") as call:
+                response = await client.post(
+                    PERPLEXITY_API_URL,
+                    headers={
+                        "Authorization": f"Bearer {PERPLEXITY_KEY}",
+                        "Content-Type": "application/json"
+                    },
+                    json={
+                        "model": "sonar",  # Быстрая модель с веб-поиском
+                        "messages": [
+                            {
+                                "role": "system",
+                                "content": perplexity_system_prompt
+                            },
+                            {
+                                "role": "user",
+                                "content": f"Bali 2024-2025: {query}"
+                            }
+                        ],
+                        # КОНТРОЛЬ КРЕАТИВНОСТИ
+                        "temperature": 0.2,        # Низкое = факты, не креатив
+                        "top_p": 0.9,              # Nucleus sampling
+                        "top_k": 0,                # Выключено
+
+                        # КОНТРОЛЬ ДЛИНЫ
+                        "max_tokens": 500,         # Увеличил до 500 для деталей
+
+                        # КОНТРОЛЬ ПОВТОРЕНИЙ
+                        "presence_penalty": 0.0,   # Без штрафа
+                        "frequency_penalty": 1.0,  # Штраф за частоту слов (против повторений)
+
+                        # STREAMING
+                        "stream": False            # Без потоковой передачи
+                    },
+                    timeout=20.0  # Увеличил timeout
+                )
+                if response.status_code != 200:
+                    call.fail()
 
             if response.status_code == 200:
                 data = response.json()
+                token_usage.record_perplexity("general", data, time.perf_counter() - start, user_id)
                 perplexity_usage[user_id][today] += 1
                 logger.info(f"✅ Perplexity search for user {user_id}: {perplexity_usage[user_id][today]}/{MAX_PERPLEXITY_REQUESTS_PER_DAY}")
                 return data['choices'][0]['message']['content']
@@ -519,101 +897,33 @@ Search strategy:
         logger.error(f"⚠️ Perplexity error: {e}")
         return None
 
-# ── Helper: Определить тему запроса ──────────────────────────────────────────
-def get_search_topic(query: str) -> str:
-    """Определяет тему запроса для адаптивного сообщения"""
-    query_lower = query.lower()
-
-    # Рестораны и еда
-    if any(kw in query_lower for kw in ['ресторан', 'restaurant', 'кафе', 'cafe', 'еда', 'food', 'поесть', 'поужинать', 'пообедать']):
-        return "о ресторанах"
-
-    # Отели
-    if any(kw in query_lower for kw in ['отель', 'hotel', 'где остановиться', 'accommodation', 'жильё']):
-        return "об отелях"
-
-    # Достопримечательности
-    if any(kw in query_lower for kw in ['посетить', 'visit', 'посмотреть', 'see', 'достопримечательност', 'attractions']):
-        return "о местах"
-
-    # Пляжи
-    if any(kw in query_lower for kw in ['пляж', 'beach', 'побережье']):
-        return "о пляжах"
-
-    # Погода
-    if any(kw in query_lower for kw in ['погода', 'weather', 'температура', 'temperature']):
-        return "о погоде"
-
-    # Цены
-    if any(kw in query_lower for kw in ['цены', 'prices', 'стоимость', 'cost', 'сколько стоит']):
-        return "о ценах"
-
-    # SPA и йога
-    if any(kw in query_lower for kw in ['spa', 'спа', 'йога', 'yoga', 'массаж', 'massage']):
-        return "о SPA и йоге"
-
-    # По умолчанию
-    return "актуальную информацию"
-
-# ── Helper: Определение запроса о ресторанах ──────────────────────────────────
-def is_restaurant_query(query: str) -> bool:
-    """Определяет, является ли запрос о ресторанах"""
-    query_lower = query.lower()
-    restaurant_keywords = [
-        'ресторан', 'restaurant', 'кафе', 'cafe', 'еда', 'food',
-        'поесть', 'поужинать', 'пообедать', 'где поужинать', 'где поесть',
-        'fine dining', 'файн дайнинг', 'michelin', 'мишлен'
-    ]
-    return any(kw in query_lower for kw in restaurant_keywords)
-
-# ── Helper: Проверка запросов о йоге/фитнесе ──────────────────────────────────
-def is_yoga_query(query: str) -> bool:
-    """Определяет, является ли запрос о йоге/фитнесе"""
-    query_lower = query.lower()
-    yoga_keywords = [
-        'йога', 'yoga', 'фитнес', 'fitness', 'спортзал', 'gym',
-        'pilates', 'пилатес', 'студия', 'studio', 'тренировка', 'workout',
-        'йога студи', 'yoga studi', 'йогу', 'фитнесу', 'тренажерк'
-    ]
-    return any(kw in query_lower for kw in yoga_keywords)
-
-# ── Helper: Проверка запросов об отелях ───────────────────────────────────────
-def is_hotel_query(query: str) -> bool:
-    """Определяет, является ли запрос об отелях"""
-    query_lower = query.lower()
-    hotel_keywords = [
-        'отель', 'hotel', 'отел', 'отдел', 'отедел', 'где остановиться', 'where to stay',
-        'accommodation', 'жильё', 'жилье', 'villa', 'вилла', 'resort', 'курорт',
-        'guesthouse', 'бутик отель', 'boutique', 'проживан', 'размещен'
-    ]
-    return any(kw in query_lower for kw in hotel_keywords)
-
-# ── Helper: Извлечение локации из запроса ──────────────────────────────────────
-def extract_location(query: str) -> str | None:
-    """Извлекает локацию из запроса пользователя"""
-    query_lower = query.lower()
-    locations = ['ubud', 'убуд', 'uluwatu', 'улувату', 'canggu', 'чангу',
-                 'seminyak', 'семиньяк', 'pererenan', 'перереnan', 'bingin', 'бингин']
-
-    for loc in locations:
-        if loc in query_lower:
-            # Возвращаем стандартное английское название
-            location_map = {
-                'убуд': 'ubud',
-                'улувату': 'uluwatu',
-                'чангу': 'canggu',
-                'семиньяк': 'seminyak',
-                'перереnan': 'pererenan',
-                'бингин': 'bingin'
-            }
-            return location_map.get(loc, loc)
-    return None
-
 # ── Helper: Генерация ответов через Claude ───────────────────────────────────
+@tracing.traced()
 async def generate_weddy_response(user_message: str, user_name: str, user_id: int, message_obj: Message = None) -> str:
     """Генерация ответа с умной двухслойной системой поиска для ресторанов"""
 
-    context_prompt = WEDDY_SYSTEM_PROMPT
+    # Вызовы Claude и Perplexity дальше (в т.ч. внутри SmartBaliBot) учитываются на этого гостя
+    token_usage.set_user(user_id, user_name)
+
+    # Дополнение к системному промпту: результат поиска и/или пометка для Claude
+    search_context = None
+    context_note = None
+
+    # СПЕЦИАЛЬНАЯ ОБРАБОТКА: "что рядом с площадкой / отелем" - из таблицы расстояний
+    try:
+        proximity_answer = await answer_proximity_query(user_message)
+        if proximity_answer:
+            return proximity_answer
+    except Exception as e:
+        logger.error(f"⚠️ Proximity lookup error: {e}")
+
+    # СПЕЦИАЛЬНАЯ ОБРАБОТКА: гость назвал конкретное место - карточка из каталога
+    try:
+        place_card = await answer_place_lookup(user_message)
+        if place_card:
+            return place_card
+    except Exception as e:
+        logger.error(f"⚠️ Place lookup error: {e}")
 
     # СПЕЦИАЛЬНАЯ ОБРАБОТКА: Запросы о ресторанах (ТОЛЬКО AIRTABLE!)
     if is_restaurant_query(user_message):
@@ -627,6 +937,7 @@ async def generate_weddy_response(user_message: str, user_name: str, user_id: in
 
         try:
             # Используем SmartBaliBot ТОЛЬКО для поиска в Airtable
+            await startup.ensure(smart_bot)
             search_results = await smart_bot.search_restaurants(user_message, location)
 
             logger.info(f"🔍 DEBUG: search_results keys: {search_results.keys()}")
@@ -668,15 +979,22 @@ async def generate_weddy_response(user_message: str, user_name: str, user_id: in
 
                     response_text += "\n"
 
+                # Вопрос про цены/часы/новые места - к списку из базы свежие данные Perplexity
+                if search_results.get("api_content"):
+                    response_text += f"📍 Актуальная информация:\n\n{search_results['api_content']}\n"
+
                 logger.info(f"✅ DEBUG: RETURNING response_text (length: {len(response_text)})")
                 return response_text
+            elif search_results.get("api_content"):
+                # В базе пусто - Claude отвечает по результатам поиска, а не из головы
+                search_context = search_results["api_content"]
+                context_note = "В базе проверенных ресторанов нет мест для этого запроса - отвечай только по результатам поиска ниже и скажи, что они не из нашей базы."
             else:
                 logger.warning(f"⚠️ DEBUG: restaurants_list пустой!")
-                context_prompt = f"{WEDDY_SYSTEM_PROMPT}\n\nВ базе нет ресторанов для этого запроса. Скажи честно."
+                context_note = "В базе нет ресторанов для этого запроса. Скажи честно."
 
         except Exception as e:
             logger.error(f"⚠️ SmartBaliBot error: {e}")
-            context_prompt = WEDDY_SYSTEM_PROMPT
 
     # СПЕЦИАЛЬНАЯ ОБРАБОТКА: Запросы о йоге/фитнесе (ТОЛЬКО AIRTABLE!)
     elif is_yoga_query(user_message):
@@ -688,7 +1006,9 @@ async def generate_weddy_response(user_message: str, user_name: str, user_id: in
         location = extract_location(user_message)
 
         try:
+            await startup.ensure(yoga_bot)
             search_results = await yoga_bot.search_studios(user_message, location)
+            metrics.record_cache("curated_yoga", hit=bool(search_results.get(CURATED_RESULT_KEYS["yoga"])))
 
             if search_results.get("curated_studios"):
                 response_text = "🧘 Проверенные студии:\n\n"
@@ -712,11 +1032,10 @@ async def generate_weddy_response(user_message: str, user_name: str, user_id: in
 
                 return response_text
             else:
-                context_prompt = f"{WEDDY_SYSTEM_PROMPT}\n\nВ базе нет студий для этого запроса. Скажи честно."
+                context_note = "В базе нет студий для этого запроса. Скажи честно."
 
         except Exception as e:
             logger.error(f"⚠️ YogaBot error: {e}")
-            context_prompt = WEDDY_SYSTEM_PROMPT
 
     # СПЕЦИАЛЬНАЯ ОБРАБОТКА: Запросы об отелях (ТОЛЬКО AIRTABLE!)
     elif is_hotel_query(user_message):
@@ -728,7 +1047,9 @@ async def generate_weddy_response(user_message: str, user_name: str, user_id: in
         location = extract_location(user_message)
 
         try:
+            await startup.ensure(hotels_bot)
             search_results = await hotels_bot.search_hotels(user_message, location)
+            metrics.record_cache("curated_hotels", hit=bool(search_results.get(CURATED_RESULT_KEYS["hotels"])))
 
             if search_results.get("curated_hotels"):
                 response_text = "🏨 Проверенные отели:\n\n"
@@ -754,11 +1075,10 @@ async def generate_weddy_response(user_message: str, user_name: str, user_id: in
 
                 return response_text
             else:
-                context_prompt = f"{WEDDY_SYSTEM_PROMPT}\n\nВ базе нет отелей для этого запроса. Скажи честно."
+                context_note = "В базе нет отелей для этого запроса. Скажи честно."
 
         except Exception as e:
             logger.error(f"⚠️ HotelsBot error: {e}")
-            context_prompt = WEDDY_SYSTEM_PROMPT
 
     # ОБЫЧНАЯ ОБРАБОТКА: Другие запросы о Бали (не рестораны)
     elif needs_perplexity_search(user_message):
@@ -774,23 +1094,52 @@ async def generate_weddy_response(user_message: str, user_name: str, user_id: in
             perplexity_result = await search_perplexity(user_message, user_id)
 
             if perplexity_result:
-                context_prompt = f"{WEDDY_SYSTEM_PROMPT}\n\n## Current Bali Information (from search):\n{perplexity_result}"
+                search_context = perplexity_result
+
+    # Дневной бюджет гостя исчерпан - ответы из каталогов работают, Claude нет
+    if not token_usage.within_budget(user_id):
+        logger.info(f"💸 User {user_id} exceeded daily LLM budget")
+        return LLM_BUDGET_EXCEEDED_TEXT
 
     # Получаем историю для этого пользователя
     history = conversation_history.get(user_id, [])
 
+    # Модель, длина и температура ответа - по классу запроса ("спасибо" - быстро и коротко, план поездки - сильная модель)
+    route = model_routing.route_request(user_message, history, has_context=bool(search_context or context_note))
+    model = CLAUDE_STRONG_MODEL if route.tier == "strong" else CLAUDE_FAST_MODEL
+    logger.info(f"🧭 Claude route: {route.name} -> {model}, max_tokens={route.max_tokens}")
+
+    # Системный промпт: закреплённые разделы, подходящие к вопросу и истории, и контекст - в пределах бюджета
+    system_prompt = prompt_index.assemble(user_message, history, context=search_context, note=context_note)
+    logger.info(f"🧩 System prompt: ~{system_prompt.tokens} tokens, sections: {', '.join(system_prompt.sections) or 'pinned only'}")
+
+    # Из чего состоит вход (оценка): какая часть промпта дороже всего
+    user_content = f"{user_name}: {user_message}"
+    token_usage.record_prompt_parts(
+        system=system_prompt.tokens - system_prompt.context_tokens,
+        context=system_prompt.context_tokens,
+        history=sum(prompt_retrieval.estimate_tokens(str(entry["content"])) for entry in history),
+        message=prompt_retrieval.estimate_tokens(user_content),
+    )
+
     # Добавляем текущее сообщение пользователя в историю
-    history.append({"role": "user", "content": f"{user_name}: {user_message}"})
+    history.append({"role": "user", "content": user_content})
 
     # Генерируем финальный ответ через Claude
     try:
-        response = await claude_client.messages.create(
-            model="claude-3-5-haiku-20241022",  # Haiku 3.5 быстрее
-            max_tokens=500,  # Увеличил для ресторанных результатов
-            temperature=0.3,  # Понижена с 0.7 до 0.3 для более предсказуемого поведения
-            system=context_prompt,
-            messages=history  # Передаем всю историю вместо одного сообщения
-        )
+        await startup.ensure(claude_client)
+        start = time.perf_counter()
+        with metrics.track_upstream("claude", "messages.create"):
+            response = await claude_client.messages.create(
+                model=model,
+                max_tokens=route.max_tokens,
+                temperature=route.temperature,
+                system=system_prompt.text,
+                messages=history  # Передаем всю историю вместо одного сообщения
+            )
+        elapsed = time.perf_counter() - start
+        model_routing.record(route, model, elapsed, getattr(response, "usage", None))
+        token_usage.record_claude("chat", model, getattr(response, "usage", None), elapsed, user_id)
 
         assistant_response = response.content[0].text.strip()
 
@@ -803,45 +1152,53 @@ async def generate_weddy_response(user_message: str, user_name: str, user_id: in
 
         # Сохраняем обновленную историю
         conversation_history[user_id] = history
+        conversation_last_active[user_id] = time.time()
 
         return assistant_response
     except Exception as e:
         logger.error(f"⚠️ Claude API error: {e}")
         return "Sorry, I'm having technical difficulties. Please try again!"
 
-# ── Helper: Сохранение в Airtable ────────────────────────────────────────────
-def save_to_airtable(data: dict):
-    """Сохраняет данные гостя в Airtable"""
+# ── Helper: Сохранение регистрации ────────────────────────────────────────────
+def guest_fields(data: dict) -> dict:
+    """Данные анкеты -> поля записи гостя в Airtable"""
+    # Преобразуем guests_count в число
+    guests_count = data.get('guests_count')
     try:
-        logger.info(f"🔄 Пробуем сохранить: {data.get('full_name')}")
-        logger.info(f"📊 Base ID: {AIRTABLE_BASE_ID}, Table: {AIRTABLE_TABLE_NAME}")
+        guests_count = int(guests_count) if guests_count else 1
+    except (ValueError, TypeError):
+        guests_count = 1
+
+    return {
+        "Telegram ID": str(data.get('telegram_id')),
+        "Full Name": data.get('full_name'),
+        "Username": data.get('username', 'N/A'),
+        "Arrival Date": data.get('arrival_date'),
+        "Tickets Bought": data.get('tickets_bought'),
+        "Departure Date": data.get('departure_date'),
+        "Guests Count": guests_count,
+        "Drinks Preference": data.get('drinks_preference'),
+        "Dietary Restrictions": data.get('dietary_restrictions'),
+        "Allergies": data.get('allergies'),
+        "Registration Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
 
-        # Преобразуем guests_count в число
-        guests_count = data.get('guests_count')
-        try:
-            guests_count = int(guests_count) if guests_count else 1
-        except (ValueError, TypeError):
-            guests_count = 1
-
-        record = guests_table.create({
-            "Telegram ID": str(data.get('telegram_id')),
-            "Full Name": data.get('full_name'),
-            "Username": data.get('username', 'N/A'),
-            "Arrival Date": data.get('arrival_date'),
-            "Tickets Bought": data.get('tickets_bought'),
-            "Departure Date": data.get('departure_date'),
-            "Guests Count": guests_count,
-            "Drinks Preference": data.get('drinks_preference'),
-            "Dietary Restrictions": data.get('dietary_restrictions'),
-            "Allergies": data.get('allergies'),
-            "Registration Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        logger.info(f"✅ Saved to Airtable: {data.get('full_name')}")
-        return True
+async def save_registration(data: dict) -> bool:
+    """
+    Коммитит регистрацию в локальный реестр; в Airtable её отправит GUEST_WRITER.
+    Повторная анкета того же гостя обновляет его запись, а не создаёт новую
+    """
+    try:
+        # Индекс гостей сверен с Airtable (при старте это делает прогрев) - upsert найдёт прошлую анкету
+        registry = await ensure_guest_registry()
+        record, created = await asyncio.to_thread(registry.upsert, guest_fields(data))
     except Exception as e:
-        logger.error(f"❌ Airtable error: {e}")
-        logger.error(f"💡 Проверьте: 1) Права токена 2) Названия полей в таблице 3) BASE_ID и TABLE_NAME")
+        logger.error(f"❌ Guest registry error: {e}")
         return False
+    logger.info(f"✅ Registration {'saved' if created else 'updated'} locally: {data.get('full_name')}")
+    GUEST_STATS.apply(record)
+    GUEST_WRITER.notify()
+    return True
 
 # ── Command: /start ───────────────────────────────────────────────────────────
 @router.message(Command("start"))
@@ -883,15 +1240,7 @@ async def cmd_start(message: Message, state: FSMContext):
 @router.callback_query(F.data == "start_registration")
 async def callback_start_registration(callback: CallbackQuery, state: FSMContext):
     """Начать регистрацию гостя"""
-    await state.clear()
-    await state.set_state(GuestRegistration.full_name)
-    await callback.message.answer(
-        "Отлично! Давайте соберем информацию для организации свадьбы.\n\n"
-        "**Как вас зовут?** (Имя и Фамилия)\n\n"
-        "_Чтобы отменить регистрацию или вернуться назад, нажмите /cancel_",
-        parse_mode="Markdown",
-        reply_markup=ReplyKeyboardRemove()
-    )
+    await begin_registration(callback.message, callback.from_user.id, state)
     await callback.answer()
 
 @router.callback_query(F.data == "show_menu")
@@ -1010,6 +1359,7 @@ async def callback_show_help(callback: CallbackQuery, state: FSMContext):
         "• Просто задавайте вопросы о свадьбе\n"
         "• `/form` - Регистрация гостя\n"
         "• `/menu` - База данных мест на Бали\n"
+        "• 📍 Отправьте геолокацию - покажу ближайшие места\n"
         "• `/contacts` - Полезные контакты\n"
         "• `/tips` - Полезные советы про Бали\n"
         "• `/cancel` - Отменить регистрацию\n\n"
@@ -1036,14 +1386,39 @@ async def cmd_cancel(message: Message, state: FSMContext):
 # ── Command: /form (and /register for compatibility) ─────────────────────────
 @router.message(Command("form", "register"))
 async def cmd_register(message: Message, state: FSMContext):
+    await begin_registration(message, message.from_user.id, state)
+
+# ── Анкета: начало и прошлые ответы ───────────────────────────────────────────
+def saved_answer_keyboard(saved: dict | None, field: str):
+    """Повторная анкета: кнопка с прошлым ответом, чтобы не набирать его заново"""
+    value = (saved or {}).get(field)
+    if value in (None, "", "N/A"):
+        return ReplyKeyboardRemove()
+    return ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=str(value))]], resize_keyboard=True)
+
+async def begin_registration(message: Message, user_id: int, state: FSMContext):
     await state.clear()  # Очищаем предыдущее состояние перед началом новой регистрации
     await state.set_state(GuestRegistration.full_name)
+
+    try:
+        saved = await find_guest(user_id)
+    except Exception as e:
+        logger.error(f"⚠️ Guest lookup failed: {e}")
+        saved = None
+    intro = "Отлично! Давайте соберем информацию для организации свадьбы.\n\n"
+    if saved:
+        await state.update_data(saved=saved)
+        intro = (
+            "Вы уже зарегистрированы - новые ответы обновят вашу анкету.\n"
+            "Прошлый ответ можно выбрать кнопкой.\n\n"
+        )
+
     await message.answer(
-        "Отлично! Давайте соберем информацию для организации свадьбы.\n\n"
+        intro +
         "**Как вас зовут?** (Имя и Фамилия)\n\n"
         "_Чтобы отменить регистрацию или вернуться назад, нажмите /cancel_",
         parse_mode="Markdown",
-        reply_markup=ReplyKeyboardRemove()
+        reply_markup=saved_answer_keyboard(saved, "Full Name")
     )
 
 # ── FSM: Full Name ────────────────────────────────────────────────────────────
@@ -1054,9 +1429,11 @@ async def process_full_name(message: Message, state: FSMContext):
     await state.update_data(username=message.from_user.username or "N/A")
 
     await state.set_state(GuestRegistration.arrival_date)
+    data = await state.get_data()
     await message.answer(
         "Спасибо! Какого числа вы планируете прилететь на Бали?\n"
-        "Пример: 03.01.2026"
+        "Пример: 03.01.2026",
+        reply_markup=saved_answer_keyboard(data.get("saved"), "Arrival Date")
     )
 
 # ── FSM: Arrival Date ─────────────────────────────────────────────────────────
@@ -1084,9 +1461,10 @@ async def process_tickets(message: Message, state: FSMContext):
     await state.update_data(tickets_bought=message.text)
     await state.set_state(GuestRegistration.departure_date)
 
+    data = await state.get_data()
     await message.answer(
         "Какого числа планируете вылетать?\nПример: 10.01.2026",
-        reply_markup=ReplyKeyboardRemove()
+        reply_markup=saved_answer_keyboard(data.get("saved"), "Departure Date")
     )
 
 # ── FSM: Departure Date ───────────────────────────────────────────────────────
@@ -1095,8 +1473,10 @@ async def process_departure_date(message: Message, state: FSMContext):
     await state.update_data(departure_date=message.text)
     await state.set_state(GuestRegistration.guests_count)
 
+    data = await state.get_data()
     await message.answer(
-        "Сколько человек будет с вами (включая вас)?\nНапример: 2"
+        "Сколько человек будет с вами (включая вас)?\nНапример: 2",
+        reply_markup=saved_answer_keyboard(data.get("saved"), "Guests Count")
     )
 
 # ── FSM: Guests Count ─────────────────────────────────────────────────────────
@@ -1144,9 +1524,10 @@ async def process_dietary(message: Message, state: FSMContext):
     await state.update_data(dietary_restrictions=message.text)
     await state.set_state(GuestRegistration.allergies)
 
+    data = await state.get_data()
     await message.answer(
         "Есть ли аллергии на продукты?\nНапишите или введите 'нет'",
-        reply_markup=ReplyKeyboardRemove()
+        reply_markup=saved_answer_keyboard(data.get("saved"), "Allergies")
     )
 
 # ── FSM: Allergies (Final) ────────────────────────────────────────────────────
@@ -1157,12 +1538,12 @@ async def process_allergies(message: Message, state: FSMContext):
     # Получаем все данные
     data = await state.get_data()
 
-    # Сохраняем в Airtable
-    success = save_to_airtable(data)
+    # Сохраняем в локальный реестр (в Airtable - фоном)
+    success = await save_registration(data)
 
     if success:
         summary = (
-            f"✅ Спасибо, {data['full_name']}! Ваша регистрация завершена.\n\n"
+            f"✅ Спасибо, {data['full_name']}! {'Ваша анкета обновлена' if data.get('saved') else 'Ваша регистрация завершена'}.\n\n"
             f"**Ваши данные:**\n"
             f"📅 Прилет: {data['arrival_date']}\n"
             f"🎫 Билеты: {data['tickets_bought']}\n"
@@ -1221,6 +1602,8 @@ async def category_selected(callback: CallbackQuery, state: FSMContext):
         await state.clear()
 
     category = callback.data.split("_")[1]
+    if category in CATALOG_BOTS:
+        await startup.ensure(CATALOG_BOTS[category])
 
     # Проверяем наличие мест в каждом регионе для выбранной категории
     available_regions = {}
@@ -1329,157 +1712,31 @@ async def show_results(callback: CallbackQuery, state: FSMContext):
     category, location = parts
 
     await callback.message.edit_text("🔍 Загружаю данные...")
+    if category in CATALOG_BOTS:
+        await startup.ensure(CATALOG_BOTS[category])
 
     try:
         if category == "restaurants":
-            search_results = await smart_bot.search_restaurants("", location)
-            if search_results.get("curated_restaurants"):
-                response_text = f"🍽 Рестораны в {location.capitalize()}:\n\n"
-                for i, rest in enumerate(search_results.get("curated_restaurants", []), 1):
-                    response_text += f"{i}. {rest['name']}"
-                    if rest.get('price_range'):
-                        response_text += f" · {rest['price_range']}"
-                    response_text += "\n"
-                    if rest.get('cuisine_ru'):
-                        response_text += f"{rest['cuisine_ru']}\n"
-                    if rest.get('vibe_ru'):
-                        response_text += f"{rest['vibe_ru']}\n"
-                    if rest.get('instagram_link'):
-                        response_text += f"{rest['instagram_link']}\n"
-                    response_text += "\n"
-            else:
-                response_text = f"В базе нет ресторанов в {location.capitalize()}"
-
+            search_results = await smart_bot.search_restaurants("", location, enrich=False)
         elif category == "yoga":
             search_results = await yoga_bot.search_studios("", location)
-            if search_results.get("curated_studios"):
-                response_text = f"🧘 Студии йоги в {location.capitalize()}:\n\n"
-                for i, studio in enumerate(search_results.get("curated_studios", []), 1):
-                    response_text += f"{i}. {studio['name']}"
-                    if studio.get('booking_type'):
-                        response_text += f" · {studio['booking_type']}"
-                    response_text += "\n"
-                    if studio.get('category_ru'):
-                        response_text += f"{studio['category_ru']}\n"
-                    if studio.get('specialties_ru'):
-                        response_text += f"{studio['specialties_ru']}\n"
-                    if studio.get('highlights_ru'):
-                        response_text += f"{studio['highlights_ru']}\n"
-                    if studio.get('instagram_link'):
-                        response_text += f"{studio['instagram_link']}\n"
-                    response_text += "\n"
-            else:
-                response_text = f"В базе нет студий йоги в {location.capitalize()}"
-
         elif category == "hotels":
             search_results = await hotels_bot.search_hotels("", location)
-            if search_results.get("curated_hotels"):
-                response_text = f"🏨 Отели в {location.capitalize()}:\n\n"
-                for i, hotel in enumerate(search_results.get("curated_hotels", []), 1):
-                    response_text += f"{i}. {hotel['name']}"
-                    if hotel.get('price_level'):
-                        response_text += f" · {hotel['price_level']}"
-                    response_text += "\n"
-                    if hotel.get('type_ru'):
-                        response_text += f"{hotel['type_ru']}\n"
-                    if hotel.get('style_ru'):
-                        response_text += f"{hotel['style_ru']}\n"
-                    if hotel.get('vibe_ru'):
-                        response_text += f"{hotel['vibe_ru']}\n"
-                    if hotel.get('instagram_handle'):
-                        response_text += f"{hotel['instagram_handle']}\n"
-                    if hotel.get('booking_link'):
-                        response_text += f"{hotel['booking_link']}\n"
-                    response_text += "\n"
-            else:
-                response_text = f"В базе нет отелей в {location.capitalize()}"
-
         elif category == "breakfast":
             search_results = await breakfast_bot.search_cafes("", location)
-            if search_results.get("curated_cafes"):
-                response_text = f"☕ Завтраки/Ланчи в {location.capitalize()}:\n\n"
-                for i, cafe in enumerate(search_results.get("curated_cafes", []), 1):
-                    response_text += f"{i}. {cafe['name']}"
-                    if cafe.get('price_level'):
-                        response_text += f" · {cafe['price_level']}"
-                    response_text += "\n"
-                    if cafe.get('category_ru'):
-                        response_text += f"{cafe['category_ru']}\n"
-                    if cafe.get('cuisine_ru'):
-                        response_text += f"{cafe['cuisine_ru']}\n"
-                    if cafe.get('vibe_ru'):
-                        response_text += f"{cafe['vibe_ru']}\n"
-                    if cafe.get('instagram_link'):
-                        response_text += f"{cafe['instagram_link']}\n"
-                    response_text += "\n"
-            else:
-                response_text = f"В базе нет кафе в {location.capitalize()}"
-
         elif category == "spa":
             search_results = await spa_bot.search_spas("", location)
-            if search_results.get("curated_spas"):
-                response_text = f"💆 Спа в {location.capitalize()}:\n\n"
-                for i, spa in enumerate(search_results.get("curated_spas", []), 1):
-                    response_text += f"{i}. {spa['name']}"
-                    if spa.get('price_level'):
-                        response_text += f" · {spa['price_level']}"
-                    response_text += "\n"
-                    if spa.get('category_ru'):
-                        response_text += f"{spa['category_ru']}\n"
-                    if spa.get('massage_type_ru'):
-                        response_text += f"{spa['massage_type_ru']}\n"
-                    if spa.get('vibe_ru'):
-                        response_text += f"{spa['vibe_ru']}\n"
-                    if spa.get('instagram_link'):
-                        response_text += f"{spa['instagram_link']}\n"
-                    response_text += "\n"
-            else:
-                response_text = f"В базе нет спа в {location.capitalize()}"
-
         elif category == "shopping":
             search_results = await shopping_bot.search_shops("", location)
-            if search_results.get("curated_shops"):
-                response_text = f"🛍 Шоппинг в {location.capitalize()}:\n\n"
-                for i, shop in enumerate(search_results.get("curated_shops", []), 1):
-                    response_text += f"{i}. {shop['name']}"
-                    if shop.get('price_level'):
-                        response_text += f" · {shop['price_level']}"
-                    response_text += "\n"
-                    if shop.get('category_ru'):
-                        response_text += f"{shop['category_ru']}\n"
-                    if shop.get('specialty_ru'):
-                        response_text += f"{shop['specialty_ru']}\n"
-                    if shop.get('vibe_ru'):
-                        response_text += f"{shop['vibe_ru']}\n"
-                    if shop.get('instagram_link'):
-                        response_text += f"{shop['instagram_link']}\n"
-                    response_text += "\n"
-            else:
-                response_text = f"В базе нет магазинов в {location.capitalize()}"
-
         elif category == "art":
             search_results = await art_bot.search_art("", location)
-            if search_results.get("curated_art"):
-                response_text = f"🎨 Арт в {location.capitalize()}:\n\n"
-                for i, art in enumerate(search_results.get("curated_art", []), 1):
-                    response_text += f"{i}. {art['name']}"
-                    if art.get('price_level'):
-                        response_text += f" · {art['price_level']}"
-                    response_text += "\n"
-                    if art.get('category_ru'):
-                        response_text += f"{art['category_ru']}\n"
-                    if art.get('specialty_ru'):
-                        response_text += f"{art['specialty_ru']}\n"
-                    if art.get('vibe_ru'):
-                        response_text += f"{art['vibe_ru']}\n"
-                    if art.get('instagram_link'):
-                        response_text += f"{art['instagram_link']}\n"
-                    response_text += "\n"
-            else:
-                response_text = f"В базе нет арт-мест в {location.capitalize()}"
-
         else:
-            response_text = "Неизвестная категория"
+            search_results = {}
+
+        if category in CURATED_RESULT_KEYS:
+            metrics.record_cache(f"curated_{category}", hit=bool(search_results.get(CURATED_RESULT_KEYS[category])))
+
+        response_text = render_category_results(category, location, search_results)
 
         # Кнопка "Назад в меню"
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -1529,6 +1786,24 @@ async def cmd_contacts(message: Message, state: FSMContext):
     )
     await message.answer(contacts_text, parse_mode="Markdown")
 
+# ── Location: ближайшие места ─────────────────────────────────────────────────
+NEARBY_PER_CATEGORY = 3
+NEARBY_MAX_KM = 15
+
+@router.message(F.location)
+async def handle_location(message: Message, state: FSMContext):
+    """Гость прислал геолокацию - ближайшие места каждой категории по расстоянию"""
+    await state.clear()
+    await startup.ensure(*CATALOG_BOTS.values())
+
+    lat, lng = message.location.latitude, message.location.longitude
+    logger.info(f"📍 Location from {message.from_user.id}: {lat:.5f}, {lng:.5f}")
+    nearby = {
+        category: catalog_bot.geo_index.nearest(lat, lng, k=NEARBY_PER_CATEGORY, max_km=NEARBY_MAX_KM)
+        for category, catalog_bot in CATALOG_BOTS.items()
+    }
+    await message.answer(render_nearby(nearby))
+
 # ── Command: /help ────────────────────────────────────────────────────────────
 @router.message(Command("help"))
 async def cmd_help(message: Message, state: FSMContext):
@@ -1548,6 +1823,7 @@ async def cmd_help(message: Message, state: FSMContext):
         "• Просто задавайте вопросы о свадьбе\n"
         "• `/form` - Регистрация гостя\n"
         "• `/menu` - База данных мест на Бали\n"
+        "• 📍 Отправьте геолокацию - покажу ближайшие места\n"
         "• `/contacts` - Полезные контакты\n"
         "• `/tips` - Полезные советы про Бали\n"
         "• `/cancel` - Отменить регистрацию\n\n"
@@ -1674,9 +1950,13 @@ async def cmd_admin(message: Message):
         "🔧 **Админ-панель Weddy Bot**\n\n"
         "**Доступные команды:**\n"
         "• `/stats` — Статистика гостей\n"
-        "• `/export` — Выгрузить данные в CSV\n"
+        "• `/export [csv|xlsx|jsonl]` — Выгрузить данные (по умолчанию CSV)\n"
+        "• `/reload [категория]` — Перезагрузить каталоги мест из Airtable\n"
         "• `/text2all <текст>` — Рассылка всем пользователям\n"
-        "• `/getguests` — Список зарегистрированных гостей\n\n"
+        "• `/getguests` — Список зарегистрированных гостей\n"
+        "• `/traces [N]` — Самые медленные из последних запросов\n"
+        "• `/usage [дни]` — Токены и стоимость Claude/Perplexity по вызовам и гостям\n"
+        "• `/budget <user_id> [USD]` — Дневной бюджет гостя на LLM\n\n"
         f"👤 Ваш ID: `{ADMIN_ID}`"
     )
     await message.answer(admin_text, parse_mode="Markdown")
@@ -1688,119 +1968,89 @@ async def cmd_stats(message: Message):
         return
 
     try:
-        # Получаем все записи из Airtable
-        records = guests_table.all()
-
-        if not records:
-            await message.answer("📊 **Статистика:** Пока нет зарегистрированных гостей.")
-            return
-
-        total_guests = len(records)
-        total_people = sum(record['fields'].get('Guests Count', 1) for record in records)
-
-        # Статистика по билетам
-        tickets_yes = sum(1 for r in records if r['fields'].get('Tickets Bought') == 'Да')
-        tickets_no = sum(1 for r in records if r['fields'].get('Tickets Bought') == 'Нет')
-        tickets_plan = sum(1 for r in records if r['fields'].get('Tickets Bought') == 'Планирую')
-
-        # Топ дат прилёта
-        arrival_dates = defaultdict(int)
-        for r in records:
-            date = r['fields'].get('Arrival Date', 'Не указано')
-            arrival_dates[date] += 1
-
-        top_dates = sorted(arrival_dates.items(), key=lambda x: x[1], reverse=True)[:5]
-
-        stats_text = (
-            f"📊 **Статистика гостей**\n\n"
-            f"👥 Всего зарегистрировано: **{total_guests}** гостей\n"
-            f"🧑‍🤝‍🧑 Всего прилетит людей: **{total_people}** человек\n\n"
-            f"✈️ **Билеты:**\n"
-            f"• ✅ Купили: {tickets_yes}\n"
-            f"• ❌ Не купили: {tickets_no}\n"
-            f"• 📅 Планируют: {tickets_plan}\n\n"
-            f"📅 **Топ дат прилёта:**\n"
-        )
-
-        for date, count in top_dates:
-            stats_text += f"• {date}: {count} гостей\n"
-
-        await message.answer(stats_text, parse_mode="Markdown")
+        stats = await ensure_guest_stats()
+        for part in guest_stats.split_message(stats.report()):
+            await message.answer(part, parse_mode="Markdown")
 
     except Exception as e:
         logger.error(f"❌ Error in /stats: {e}")
         await message.answer(f"❌ Ошибка при получении статистики: {str(e)}")
 
 # ── Command: /export ──────────────────────────────────────────────────────────
+# Фоновые задачи экспорта: держим ссылки, пока задача не завершится
+_export_tasks = set()
+
 @router.message(Command("export"))
 async def cmd_export(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
 
-    try:
-        # Получаем все записи
-        records = guests_table.all()
+    # /export xlsx - формат файла (по умолчанию csv)
+    text_parts = message.text.split(maxsplit=1)
+    fmt = text_parts[1].strip().lower() if len(text_parts) > 1 else "csv"
+    if fmt not in guest_export.FORMATS:
+        await message.answer(f"❌ Формат экспорта: {', '.join(guest_export.FORMATS)}")
+        return
 
-        if not records:
-            await message.answer("📊 Нет данных для экспорта.")
-            return
+    # Выгрузка может занять время - файл придёт отдельным сообщением
+    await message.answer(f"⏳ Готовлю экспорт гостей ({fmt})...")
+    task = asyncio.create_task(run_export(message, fmt))
+    _export_tasks.add(task)
+    task.add_done_callback(_export_tasks.discard)
 
-        # Создаём CSV в памяти
-        output = io.StringIO()
-        writer = csv.writer(output)
+def _build_export(registry, fmt: str) -> tuple[bytes, int]:
+    """Страницы реестра гостей потоком в буфер в памяти; выполняется в отдельном потоке"""
+    buffer = io.BytesIO()
+    count = guest_export.export_guests(registry.iter_pages(), fmt, buffer)
+    return buffer.getvalue(), count
 
-        # Заголовки
-        headers = [
-            "Telegram ID", "Full Name", "Username", "Arrival Date",
-            "Tickets Bought", "Departure Date", "Guests Count",
-            "Drinks Preference", "Dietary Restrictions", "Allergies",
-            "Registration Date"
-        ]
-        writer.writerow(headers)
+async def run_export(message: Message, fmt: str):
+    try:
+        registry = await ensure_guest_registry()
+        data, count = await asyncio.to_thread(_build_export, registry, fmt)
 
-        # Данные
-        for record in records:
-            fields = record['fields']
-            row = [
-                fields.get('Telegram ID', ''),
-                fields.get('Full Name', ''),
-                fields.get('Username', ''),
-                fields.get('Arrival Date', ''),
-                fields.get('Tickets Bought', ''),
-                fields.get('Departure Date', ''),
-                fields.get('Guests Count', ''),
-                fields.get('Drinks Preference', ''),
-                fields.get('Dietary Restrictions', ''),
-                fields.get('Allergies', ''),
-                fields.get('Registration Date', '')
-            ]
-            writer.writerow(row)
-
-        # Сохраняем CSV во временный файл
-        csv_content = output.getvalue()
-        output.close()
+        if not count:
+            await message.answer("📊 Нет данных для экспорта.")
+            return
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"wedding_guests_{timestamp}.csv"
-        filepath = Path(f"/tmp/{filename}")
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(csv_content)
-
-        # Отправляем файл
-        document = FSInputFile(filepath)
         await message.answer_document(
-            document=document,
-            caption=f"📊 Экспорт гостей ({len(records)} записей)\n🕐 {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+            document=BufferedInputFile(data, filename=f"wedding_guests_{timestamp}.{fmt}"),
+            caption=f"📊 Экспорт гостей ({count} записей)\n🕐 {datetime.now().strftime('%d.%m.%Y %H:%M')}"
         )
-
-        # Удаляем временный файл
-        filepath.unlink()
+        logger.info(f"📤 Export sent: {count} guests, {fmt}, {len(data)} bytes")
 
     except Exception as e:
         logger.error(f"❌ Error in /export: {e}")
         await message.answer(f"❌ Ошибка при экспорте: {str(e)}")
 
+# ── Command: /reload ──────────────────────────────────────────────────────────
+@router.message(Command("reload"))
+async def cmd_reload(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    # /reload hotels - один каталог (по умолчанию все)
+    text_parts = message.text.split(maxsplit=1)
+    category = text_parts[1].strip().lower() if len(text_parts) > 1 else None
+    if category and category not in CATALOG_BOTS:
+        await message.answer(f"❌ Каталоги: {', '.join(CATALOG_BOTS)}")
+        return
+
+    await message.answer("⏳ Перезагружаю каталоги из Airtable...")
+    start = time.perf_counter()
+    results = await reload_catalogs([category] if category else None)
+    elapsed = time.perf_counter() - start
+
+    lines = []
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            logger.error(f"❌ Error in /reload ({name}): {result}")
+            lines.append(f"❌ {name}: ошибка, оставлен прежний каталог")
+        else:
+            lines.append(f"✅ {name}: {result}")
+    await message.answer(f"🔄 Каталоги перезагружены за {elapsed:.1f} с\n\n" + "\n".join(lines))
+
 # ── Command: /text2all ───────────────────────────────────────────────────────
 @router.message(Command("text2all"))
 async def cmd_text2all(message: Message):
@@ -1819,9 +2069,10 @@ async def cmd_text2all(message: Message):
 
     broadcast_text = text_parts[1]
 
-    # Получаем все Telegram ID из Airtable
+    # Получаем все Telegram ID из реестра гостей
     try:
-        records = guests_table.all()
+        registry = await ensure_guest_registry()
+        records = await asyncio.to_thread(registry.records)
         user_ids = set()
         for record in records:
             tid = record['fields'].get('Telegram ID')
@@ -1843,7 +2094,7 @@ async def cmd_text2all(message: Message):
 
         for user_id in user_ids:
             try:
-                await bot.send_message(user_id, broadcast_text)
+                await message.bot.send_message(user_id, broadcast_text)
                 success_count += 1
             except Exception as e:
                 logger.warning(f"Failed to send to {user_id}: {e}")
@@ -1866,7 +2117,8 @@ async def cmd_getguests(message: Message):
         return
 
     try:
-        records = guests_table.all()
+        registry = await ensure_guest_registry()
+        records = await asyncio.to_thread(registry.records)
 
         if not records:
             await message.answer("📋 Нет зарегистрированных гостей.")
@@ -1898,6 +2150,73 @@ async def cmd_getguests(message: Message):
         logger.error(f"❌ Error in /getguests: {e}")
         await message.answer(f"❌ Ошибка: {str(e)}")
 
+# ── Command: /traces ──────────────────────────────────────────────────────────
+@router.message(Command("traces"))
+async def cmd_traces(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    # /traces 10 - сколько трейсов показать (по умолчанию 5)
+    text_parts = message.text.split(maxsplit=1)
+    try:
+        limit = max(1, min(int(text_parts[1]), 20)) if len(text_parts) > 1 else 5
+    except ValueError:
+        limit = 5
+
+    slowest = tracing.TRACER.slowest(limit)
+    if not slowest:
+        await message.answer("⏱ Пока нет трейсов.")
+        return
+
+    traces_text = f"⏱ Самые медленные запросы (из последних {len(tracing.TRACER.recent)}):\n\n"
+    for trace in slowest:
+        block = tracing.format_trace(trace) + "\n\n"
+        # Telegram имеет лимит 4096 символов на сообщение
+        if len(traces_text) + len(block) > 3500:
+            await message.answer(traces_text)
+            traces_text = ""
+        traces_text += block
+
+    if traces_text:
+        await message.answer(traces_text)
+
+# ── Command: /usage ───────────────────────────────────────────────────────────
+@router.message(Command("usage"))
+async def cmd_usage(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    # /usage 7 - за сколько последних дней (по умолчанию сегодня)
+    text_parts = message.text.split(maxsplit=1)
+    try:
+        days = max(1, min(int(text_parts[1]), token_usage.KEEP_DAYS)) if len(text_parts) > 1 else 1
+    except ValueError:
+        days = 1
+    await message.answer(token_usage.LEDGER.report(days), parse_mode="Markdown")
+
+# ── Command: /budget ──────────────────────────────────────────────────────────
+@router.message(Command("budget"))
+async def cmd_budget(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+
+    # /budget <user_id> [usd|default] - показать или задать личный дневной бюджет (0 - без лимита)
+    text_parts = message.text.split()
+    try:
+        user_id = int(text_parts[1])
+        usd = None if len(text_parts) < 3 or text_parts[2] == "default" else float(text_parts[2])
+    except (IndexError, ValueError):
+        await message.answer("❌ Формат: /budget <user_id> [сумма в USD | 0 - без лимита | default]")
+        return
+
+    ledger = token_usage.LEDGER
+    if len(text_parts) >= 3:
+        ledger.set_budget(user_id, usd)
+    budget = ledger.budget_for(user_id)
+    limit = f"${budget:.2f} в день" if budget > 0 else "без лимита"
+    personal = " (личный)" if user_id in ledger.budgets else ""
+    await message.answer(f"💰 {user_id}: потрачено сегодня ${ledger.spent_today(user_id):.4f}, бюджет {limit}{personal}")
+
 # ══════════════════════════════════════════════════════════════════════════════
 # END OF ADMIN COMMANDS
 # ══════════════════════════════════════════════════════════════════════════════
@@ -1921,10 +2240,103 @@ async def handle_message(message: Message, state: FSMContext):
     await message.answer(response)
 
 # ── Main ──────────────────────────────────────────────────────────────────────
-async def main():
+def create_bot() -> Bot:
+    if TELEGRAM_API_URL:
+        return Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+    return Bot(token=BOT_TOKEN)
+
+def setup_dispatcher():
+    """Создаёт бота, подключает middlewares и роутер к диспетчеру (main() и нагрузочный тест)"""
+    global bot
+    bot = create_bot()
+    dp.update.outer_middleware(startup.first_update_middleware)
+
+    # Метрики: задержки хендлеров (inner middleware видит, какой хендлер выбран) и вызовов Telegram API
+    router.message.middleware(metrics.handler_middleware)
+    router.callback_query.middleware(metrics.handler_middleware)
+    bot.session.middleware(metrics.telegram_request_middleware)
+
+    # Трассировка: корневой спан на апдейт, дочерний на выбранный хендлер
+    dp.update.outer_middleware(tracing.update_middleware)
+    router.message.middleware(tracing.handler_middleware)
+    router.callback_query.middleware(tracing.handler_middleware)
+    tracing.TRACER.configure(file_path=TRACING_FILE, otlp_endpoint=TRACING_OTLP_ENDPOINT)
     dp.include_router(router)
+
+# ── Фоновые задачи ────────────────────────────────────────────────────────────
+TRACE_EXPORT_INTERVAL = 5
+HISTORY_EVICTION_INTERVAL = 900
+
+async def evict_idle_histories():
+    """Удаляет историю разговоров, в которых давно не было сообщений"""
+    cutoff = time.time() - HISTORY_IDLE_TTL
+    idle = [user_id for user_id, last_active in conversation_last_active.items() if last_active < cutoff]
+    for user_id in idle:
+        conversation_history.pop(user_id, None)
+        conversation_last_active.pop(user_id, None)
+    if idle:
+        logger.info(f"🧹 Evicted {len(idle)} idle conversation histories")
+
+async def reset_perplexity_quotas():
+    """Новый день: счётчики Perplexity за прошлые дни больше не нужны"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    for user_id in list(perplexity_usage):
+        days = perplexity_usage[user_id]
+        for day in [day for day in days if day != today]:
+            del days[day]
+        if not days:
+            del perplexity_usage[user_id]
+
+async def prune_llm_usage():
+    """Статистика токенов старше token_usage.KEEP_DAYS дней больше не нужна"""
+    token_usage.LEDGER.prune()
+
+def setup_scheduler():
+    """Задачи обслуживания вне обработки апдейтов; запускаются в main вместе с polling"""
+    SCHEDULER.every("guest_sync_retry", GUEST_SYNC_INTERVAL, GUEST_WRITER.flush)
+    SCHEDULER.every("history_eviction", HISTORY_EVICTION_INTERVAL, evict_idle_histories)
+    SCHEDULER.cron("perplexity_quota_reset", "0 0 * * *", reset_perplexity_quotas)
+    SCHEDULER.cron("llm_usage_prune", "0 0 * * *", prune_llm_usage)
+    if tracing.TRACER.exporting:
+        SCHEDULER.every("trace_export", TRACE_EXPORT_INTERVAL, tracing.TRACER.flush)
+    # С вебхуками каталоги и так свежие - полные перезагрузки только по /reload
+    if CATALOG_RELOAD_INTERVAL > 0 and not AIRTABLE_WEBHOOK_URL:
+        SCHEDULER.every("catalog_reload", CATALOG_RELOAD_INTERVAL, scheduled_catalog_reload, jitter=60)
+
+async def warm_up(lazy_clients):
+    """Прогрев клиентов и каталогов, затем таблица расстояний, индекс названий мест и статистика гостей"""
+    await startup.warm_up(lazy_clients, READY_FILE)
+    try:
+        await asyncio.to_thread(_proximity_table)
+        await asyncio.to_thread(_place_name_index)
+    except Exception as e:
+        logger.error(f"⚠️ Proximity table / place name index build error: {e}")
+    try:
+        await ensure_guest_stats()
+    except Exception as e:
+        logger.error(f"⚠️ Guest stats load error: {e}")
+
+async def main():
+    validate_settings()
+    setup_dispatcher()
+    # Дневной бюджет LLM на гостя; у админа лимита нет
+    token_usage.LEDGER.daily_budget_usd = USER_DAILY_BUDGET_USD
+    token_usage.LEDGER.set_budget(ADMIN_ID, 0)
+    startup.PROFILE.mark("dispatcher_ready")
     logger.info("🚀 Запускаем Weddy Bot v2 с регистрацией гостей...")
 
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT, extra_routes={"/ready": startup.ready_handler})
+
+    # Клиенты и каталоги: в eager режиме ждём загрузки до polling, в lazy - грузим в фоне параллельно
+    lazy_clients = [claude_client, guests_table, guest_registry, *CATALOG_BOTS.values()]
+    warm_up_task = None
+    if STARTUP_MODE == "eager":
+        await warm_up(lazy_clients)
+    else:
+        warm_up_task = asyncio.create_task(warm_up(lazy_clients))
+
     # Устанавливаем меню команд
     commands = [
         BotCommand(command="start", description="🏠 Главное меню"),
@@ -1939,13 +2351,36 @@ async def main():
     await bot.set_my_commands(commands)
     logger.info("✅ Меню команд установлено")
 
+    loop_lag_task = asyncio.create_task(metrics.monitor_event_loop_lag())
+    guest_writer_task = asyncio.create_task(GUEST_WRITER.run())
+    webhook_runner, webhook_task = await start_catalog_webhooks() if AIRTABLE_WEBHOOK_URL else (None, None)
+    setup_scheduler()
+    SCHEDULER.start()
+
     try:
         await bot.delete_webhook(drop_pending_updates=True)
+        startup.PROFILE.mark("polling_started")
         await dp.start_polling(bot)
     except KeyboardInterrupt:
         logger.info("👋 Бот остановлен")
     finally:
+        loop_lag_task.cancel()
+        if warm_up_task:
+            warm_up_task.cancel()
+        # Идущим задачам обслуживания даём закончить, ждущие отменяем
+        await SCHEDULER.stop()
+        if webhook_task:
+            webhook_task.cancel()
+            await webhook_runner.cleanup()
+        # Даём писателю последнюю попытку отправить регистрации в Airtable
+        guest_writer_task.cancel()
+        await asyncio.gather(guest_writer_task, return_exceptions=True)
+        await tracing.TRACER.flush()
+        if metrics_runner:
+            await metrics_runner.cleanup()
         await bot.session.close()
 
+startup.PROFILE.mark("module_imported")
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file